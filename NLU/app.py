@@ -311,7 +311,7 @@ def root():
     return jsonify({
         'service': 'nlu-parser',
         'message': 'NLU Parser API is running. Try /health or POST /nlu/parse.',
-        'routes': ['/health', '/nlu/parse', '/nlu/pre-parse', '/nlu/post-parse', '/nlu/parse/batch']
+        'routes': ['/health', '/nlu/parse', '/nlu/pre-parse', '/nlu/post-parse', '/nlu/parse/batch', '/admin/catalog']
     }), 200
 
 
@@ -333,6 +333,7 @@ def health():
                 'entity_extractor': True,
                 'product_catalog': catalog_loaded,
                 'product_count': len(product_catalog.get_catalog()),
+                'catalog_version': product_catalog.get_version_info()['version'],
                 'semantic_classifier': intent_classifier.semantic_classifier.is_available() if hasattr(intent_classifier, 'semantic_classifier') and intent_classifier.semantic_classifier else False
             },
             'config': {
@@ -615,6 +616,30 @@ def parse_batch():
         raise InternalError("Failed to parse batch", details={'error': str(e)})
 
 
+@app.route('/admin/catalog', methods=['GET'])
+def catalog_status():
+    """Report the active product catalog version"""
+    return jsonify(product_catalog.get_version_info()), 200
+
+
+@app.route('/admin/catalog/reload', methods=['POST'])
+def reload_catalog():
+    """
+    Rebuild the product catalog in the background and swap it in when complete.
+    Parsing keeps using the current version meanwhile; ?wait=true returns after the swap.
+    """
+    try:
+        started = product_catalog.reload(background=True)
+        if request.args.get('wait', 'false').lower() == 'true':
+            product_catalog.wait_for_reload()
+        
+        return jsonify({'started': started, **product_catalog.get_version_info()}), 202
+        
+    except Exception as e:
+        logger.error(f"Error reloading catalog: {e}", exc_info=True)
+        raise InternalError("Failed to reload catalog", details={'error': str(e)})
+
+
 @app.route('/nlu/session/<session_id>', methods=['GET'])
 def get_session(session_id: str):
     """Get session information"""
@@ -1,12 +1,15 @@
 """
 Product Catalog Module
 Loads and manages product data for entity extraction
-Uses singleton pattern with caching
+Uses singleton pattern with caching; reloads build a new catalog version
+and swap it in atomically, so readers never see a partial catalog
 """
 
 import json
 import logging
 import os
+import threading
+import time
 from pathlib import Path
 from typing import Dict, List, Optional
 
@@ -40,14 +43,66 @@ class ProductCatalog:
         
         self.catalog_path = catalog_path or self._find_catalog_path()
         self._catalog: List[Dict] = []
+        self._version = 0
+        self._loaded_at: Optional[float] = None
+        self._reload_lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+        self._last_error: Optional[str] = None
         self._load_catalog()
         self._initialized = True
     
-    def reload(self):
-        """Reload catalog from file (useful for cache invalidation)"""
-        self._catalog = []
-        self._load_catalog()
-        logger.info("Product catalog reloaded")
+    def reload(self, background: bool = False) -> bool:
+        """
+        Reload catalog from file (useful for cache invalidation)
+        
+        The new catalog is built next to the current one and swapped in when complete;
+        lookups keep using the current version meanwhile.
+        
+        Args:
+            background: Build in a background thread and return immediately
+            
+        Returns:
+            False if a background reload is already running, else True
+        """
+        if not background:
+            with self._reload_lock:
+                self._load_catalog()
+            logger.info(f"Product catalog reloaded (version {self._version})")
+            return True
+        
+        with self._reload_lock:
+            if self.is_reloading():
+                return False
+            self._reload_thread = threading.Thread(target=self.reload, name='catalog-reload', daemon=True)
+            self._reload_thread.start()
+        return True
+    
+    def is_reloading(self) -> bool:
+        """Whether a background reload is in progress"""
+        thread = self._reload_thread
+        return thread is not None and thread.is_alive()
+    
+    def wait_for_reload(self, timeout: Optional[float] = None):
+        """Block until the running background reload (if any) finishes"""
+        thread = self._reload_thread
+        if thread is not None:
+            thread.join(timeout)
+    
+    def get_version_info(self) -> Dict:
+        """
+        Describe the active catalog version
+        
+        Returns:
+            Dictionary with version, load time, product count and reload state
+        """
+        return {
+            'version': self._version,
+            'loaded_at': self._loaded_at,
+            'product_count': len(self._catalog),
+            'catalog_path': self.catalog_path,
+            'reloading': self.is_reloading(),
+            'last_error': self._last_error,
+        }
     
     def _find_catalog_path(self) -> Optional[str]:
         """
@@ -88,7 +143,7 @@ class ProductCatalog:
         return None
     
     def _load_catalog(self):
-        """Load product catalog from file"""
+        """Load product catalog from file and swap it in; on error the current version stays active"""
         if not self.catalog_path:
             logger.warning("No product catalog file found. Product extraction will be limited.")
             return
@@ -98,35 +153,51 @@ class ProductCatalog:
                 data = json.load(f)
             
             # Handle different JSON structures
+            products: List[Dict] = []
             if isinstance(data, list):
-                self._catalog = data
+                products = data
             elif isinstance(data, dict):
                 # Try common keys
                 if 'products' in data:
-                    self._catalog = data['products']
+                    products = data['products']
                 elif 'items' in data:
-                    self._catalog = data['items']
+                    products = data['items']
                 else:
                     # Assume it's a single product or use values
-                    self._catalog = [data] if data else []
+                    products = [data] if data else []
             
-            # Normalize product structure
-            self._normalize_catalog()
+            # Normalize product structure, then publish with a single reference assignment
+            catalog = self._normalize_catalog(products)
+            self._catalog = catalog
+            self._version += 1
+            self._loaded_at = time.time()
+            self._last_error = None
             
-            logger.info(f"Loaded {len(self._catalog)} products from catalog")
+            logger.info(f"Loaded {len(catalog)} products from catalog")
             
         except FileNotFoundError:
+            self._last_error = f"Catalog file not found: {self.catalog_path}"
             logger.warning(f"Product catalog file not found: {self.catalog_path}")
         except json.JSONDecodeError as e:
+            self._last_error = f"Invalid catalog JSON: {e}"
             logger.error(f"Error parsing product catalog JSON: {e}")
         except Exception as e:
+            self._last_error = str(e)
             logger.error(f"Error loading product catalog: {e}")
     
-    def _normalize_catalog(self):
-        """Normalize product catalog structure and build comprehensive name mappings"""
+    def _normalize_catalog(self, products: List[Dict]) -> List[Dict]:
+        """
+        Normalize product catalog structure and build comprehensive name mappings
+        
+        Args:
+            products: Raw product dictionaries
+            
+        Returns:
+            New list of normalized products (the input is not modified)
+        """
         normalized = []
         
-        for product in self._catalog:
+        for product in products:
             normalized_product = {
                 'gtin': product.get('GTIN') or product.get('gtin') or product.get('id'),
                 'name': product.get('name') or product.get('Name') or product.get('product_name') or '',
@@ -190,7 +261,7 @@ class ProductCatalog:
             
             normalized.append(normalized_product)
         
-        self._catalog = normalized
+        return normalized
     
     def get_catalog(self) -> List[Dict]:
         """
@@ -0,0 +1,54 @@
+"""
+Unit tests for product catalog reloading
+"""
+
+import json
+
+from product_catalog import ProductCatalog
+
+
+def _write(path, names):
+    path.write_text(json.dumps([{'gtin': str(i), 'name': n} for i, n in enumerate(names)]), encoding='utf-8')
+
+
+def _catalog(path):
+    """Fresh (non-singleton) catalog instance bound to path"""
+    catalog = object.__new__(ProductCatalog)
+    catalog._initialized = False
+    ProductCatalog.__init__(catalog, str(path))
+    return catalog
+
+
+def test_background_reload_swaps_in_new_version(tmp_path):
+    """Test that a background reload publishes the new catalog as a new version"""
+    path = tmp_path / 'products.json'
+    _write(path, ['Milk'])
+    catalog = _catalog(path)
+    before = catalog.get_catalog()
+    assert catalog.get_version_info()['version'] == 1
+    
+    _write(path, ['Milk', 'Butter'])
+    assert catalog.reload(background=True)
+    catalog.wait_for_reload()
+    
+    info = catalog.get_version_info()
+    assert info['version'] == 2
+    assert info['product_count'] == 2
+    assert catalog.find_product('butter') is not None
+    # Readers holding the previous list are unaffected
+    assert [p['name'] for p in before] == ['Milk']
+
+
+def test_failed_reload_keeps_current_version(tmp_path):
+    """Test that an unparsable file leaves the active catalog in place"""
+    path = tmp_path / 'products.json'
+    _write(path, ['Milk'])
+    catalog = _catalog(path)
+    
+    path.write_text('not json', encoding='utf-8')
+    catalog.reload()
+    
+    info = catalog.get_version_info()
+    assert info['version'] == 1
+    assert info['product_count'] == 1
+    assert info['last_error']
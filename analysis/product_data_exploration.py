@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import itertools
 import json
 import sys
 from pathlib import Path
@@ -15,6 +16,7 @@ if str(REPO_ROOT) not in sys.path:
 from services.substitution_service.data_loaders import (
     DEFAULT_PRODUCT_JSON,
     get_data_dir,
+    iter_json_objects,
 )
 
 
@@ -23,63 +25,9 @@ def _stream_json_array_sample(file_path: Path, max_items: int = 5000) -> pd.Data
     Stream-parse a JSON array file and return up to max_items objects as a DataFrame.
     Avoids loading the entire 200MB+ file into memory.
     """
-    records: List[dict] = []
-    with file_path.open("r", encoding="utf-8") as f:
-        # Seek to first '['
-        ch = f.read(1)
-        while ch and ch.isspace():
-            ch = f.read(1)
-        if ch != "[":
-            # Not an array JSON; bail out
-            raise ValueError("Expected JSON array starting with '['")
-        in_string = False
-        escape = False
-        brace_depth = 0
-        buf_chars: List[str] = []
-        while True:
-            ch = f.read(1)
-            if not ch:
-                break
-            if in_string:
-                buf_chars.append(ch)
-                if escape:
-                    escape = False
-                elif ch == "\\":
-                    escape = True
-                elif ch == '"':
-                    in_string = False
-                continue
-            # not in string
-            if brace_depth == 0:
-                if ch == "{":
-                    brace_depth = 1
-                    buf_chars = ["{"]
-                elif ch == "]":
-                    break
-                else:
-                    # skip commas/whitespace between objects
-                    continue
-            else:
-                buf_chars.append(ch)
-                if ch == '"':
-                    in_string = True
-                    escape = False
-                elif ch == "{":
-                    brace_depth += 1
-                elif ch == "}":
-                    brace_depth -= 1
-                    if brace_depth == 0:
-                        try:
-                            rec = json.loads("".join(buf_chars))
-                            if isinstance(rec, dict):
-                                records.append(rec)
-                        except json.JSONDecodeError:
-                            pass
-                        if len(records) >= max_items:
-                            break
-                        buf_chars = []
-        if not records:
-            raise ValueError("No objects parsed from JSON array")
+    records: List[dict] = list(itertools.islice(iter_json_objects(file_path), max_items))
+    if not records:
+        raise ValueError("No objects parsed from JSON array")
     return pd.DataFrame.from_records(records)
 
 
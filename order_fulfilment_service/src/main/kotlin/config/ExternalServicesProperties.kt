@@ -6,6 +6,7 @@ import org.springframework.boot.context.properties.ConfigurationProperties
 data class ExternalServicesProperties(
     val predictOrderUrl: String,
     val substitutionSuggestUrl: String,
+    val substitutionSuggestBatchUrl: String,
     val shortageUrl: String
 )
 
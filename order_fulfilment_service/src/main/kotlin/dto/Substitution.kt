@@ -11,3 +11,11 @@ data class SubstitutionResponse(
     val lineId: Int,
     val suggestedLineIds: List<Int>  // только id товаров-замен
 )
+
+data class SubstitutionBatchRequest(
+    val items: List<SubstitutionRequest>
+)
+
+data class SubstitutionBatchResponse(
+    val results: List<SubstitutionResponse>
+)
@@ -7,6 +7,8 @@ import org.example.dto.ShortageAction
 import org.example.dto.ShortageDecision
 import org.example.dto.ShortageProactiveRequest
 import org.example.dto.ShortageProactiveResponse
+import org.example.dto.SubstitutionBatchRequest
+import org.example.dto.SubstitutionBatchResponse
 import org.example.dto.SubstitutionRequest
 import org.example.dto.SubstitutionResponse
 import org.slf4j.LoggerFactory
@@ -61,6 +63,41 @@ class ExternalOrderServicesClient(
         }
     }
 
+    /**
+     * Whole-order variant of [getSubstitutionsForItem]: one round trip per [MAX_BATCH_ITEMS] lines
+     * (the batch endpoint rejects larger requests).
+     * Returns suggestions keyed by lineId; lines missing from the response get no suggestions.
+     */
+    fun getSubstitutionsForItems(requests: List<SubstitutionRequest>): Map<Int, List<Int>> {
+        if (requests.isEmpty()) {
+            return emptyMap()
+        }
+
+        val suggestions = mutableMapOf<Int, List<Int>>()
+        requests.chunked(MAX_BATCH_ITEMS).forEach { chunk ->
+            suggestions.putAll(postSubstitutionBatch(chunk))
+        }
+        return suggestions
+    }
+
+    private fun postSubstitutionBatch(requests: List<SubstitutionRequest>): Map<Int, List<Int>> {
+        return try {
+            val response = restTemplate.postForObject(
+                externalServicesProperties.substitutionSuggestBatchUrl,
+                SubstitutionBatchRequest(requests),
+                SubstitutionBatchResponse::class.java
+            ) ?: SubstitutionBatchResponse(emptyList())
+            response.results.associate { it.lineId to it.suggestedLineIds }
+        } catch (ex: RestClientException) {
+            logger.warn(
+                "Substitution batch service unavailable ({}). Defaulting to empty suggestions for {} lines.",
+                ex.message,
+                requests.size
+            )
+            emptyMap()
+        }
+    }
+
     fun getShortageDecisions(request: ShortageProactiveRequest): ShortageProactiveResponse {
         return try {
             restTemplate.postForObject(
@@ -80,4 +117,9 @@ class ExternalOrderServicesClient(
             ShortageProactiveResponse(fallback)
         }
     }
+
+    companion object {
+        /** Upper bound on items per /substitution/suggest/batch call; matches the service's request cap. */
+        const val MAX_BATCH_ITEMS = 500
+    }
 }
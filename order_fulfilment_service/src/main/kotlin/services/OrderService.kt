@@ -13,6 +13,7 @@ import org.example.dto.ShortageDecisionResponse
 import org.example.dto.ShortageItemRequest
 import org.example.dto.ShortageLine
 import org.example.dto.ShortageProactiveRequest
+import org.example.dto.SubstitutionRequest
 import org.example.dto.WarehouseItem
 import org.example.repositories.OrderRepository
 import org.example.repositories.WarehouseItemRepository
@@ -46,23 +47,26 @@ class OrderService(
             lineIdsToReplace
         )
 
-        // 2. Для каждого такого id берём список id-замен из /substitution/suggest
+        // 2. Для всех таких id одним запросом берём списки id-замен из /substitution/suggest/batch
+        val substitutionRequests = lineIdsToReplace.mapNotNull { lineId ->
+            order.items.firstOrNull { it.lineId == lineId }?.let { item ->
+                SubstitutionRequest(
+                    lineId = item.lineId,
+                    productCode = item.productCode,
+                    qty = item.qty,
+                    name = item.name
+                )
+            }
+        }
+        val batchSuggestions = externalClient.getSubstitutionsForItems(substitutionRequests)
         val substitutionsMap: MutableMap<Int, List<Int>> = mutableMapOf()
-        for (lineId in lineIdsToReplace) {
-            val item = order.items.firstOrNull { it.lineId == lineId } ?: continue
-
-            val substitutionResponse = externalClient.getSubstitutionsForItem(
-                lineId = item.lineId,
-                productCode = item.productCode,
-                qty = item.qty,
-                name = item.name
-            )
-
-            substitutionsMap[lineId] = substitutionResponse.suggestedLineIds
+        for (request in substitutionRequests) {
+            val suggestedLineIds = batchSuggestions[request.lineId] ?: emptyList()
+            substitutionsMap[request.lineId] = suggestedLineIds
             logger.info(
                 "Substitution service suggestions for line {} -> {}",
-                lineId,
-                substitutionResponse.suggestedLineIds
+                request.lineId,
+                suggestedLineIds
             )
         }
 
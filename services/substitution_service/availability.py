@@ -1,76 +1,320 @@
 from __future__ import annotations
 
+import logging
 import os
-from typing import Dict, Iterable, List, Optional
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 import psycopg
-from psycopg.rows import dict_row
 
+from .db_pool import (  # noqa: F401  (get_db_conninfo re-exported)
+    CONNECT_TIMEOUT,
+    async_warehouse_connection,
+    get_db_conninfo,
+    warehouse_connection,
+)
+from .metrics import observe_stage
 
-def _env(key: str, default: Optional[str] = None) -> Optional[str]:
-    v = os.getenv(key)
-    return v if v is not None else default
+logger = logging.getLogger(__name__)
 
+# Stock rows are cached per GTIN; TTL bounds staleness when change notifications are unavailable
+AVAILABILITY_CACHE_ENABLED = bool(int(os.getenv("AVAILABILITY_CACHE_ENABLED", "1")))
+AVAILABILITY_CACHE_TTL_SECONDS = float(os.getenv("AVAILABILITY_CACHE_TTL_SECONDS", "30"))
+AVAILABILITY_CACHE_MAX_ENTRIES = int(os.getenv("AVAILABILITY_CACHE_MAX_ENTRIES", "200000"))
+# LISTEN on the channel fed by the warehouse_items trigger (warehouse-db/db/init.sql)
+AVAILABILITY_CACHE_LISTEN = bool(int(os.getenv("AVAILABILITY_CACHE_LISTEN", "1")))
+WAREHOUSE_ITEMS_CHANNEL = "warehouse_items_changed"
 
-def get_db_conninfo() -> str:
-    host = _env("WAREHOUSE_DB_HOST", "localhost")
-    port = _env("WAREHOUSE_DB_PORT", "6000")
-    db = _env("WAREHOUSE_DB_NAME", "warehouse")
-    user = _env("WAREHOUSE_DB_USER", "warehouse_user")
-    pwd = _env("WAREHOUSE_DB_PASSWORD", "warehouse_pass")
-    return f"host={host} port={port} dbname={db} user={user} password={pwd}"
+# Codes are bound as one text[] parameter (= ANY(%s)) so the statement text is identical for any
+# number of GTINs and the server can reuse its prepared plan.
+_WAREHOUSE_ITEMS_QUERY = """
+    SELECT line_id, product_code, qty, unit
+    FROM warehouse_items
+    WHERE product_code = ANY(%s)
+"""
 
 
-def get_availability_for_gtins(gtins: Iterable[str]) -> Dict[str, float]:
+class WarehouseItem(NamedTuple):
+    line_id: int
+    qty: float
+    unit: str
+
+
+def _items_from_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, WarehouseItem]:
+    result: Dict[str, WarehouseItem] = {}
+    for row in rows:
+        code = str(row["product_code"])
+        item = WarehouseItem(int(row["line_id"]), float(row["qty"]), str(row["unit"]))
+        prev = result.get(code)
+        if prev is None or item.qty > prev.qty:
+            result[code] = item
+    return result
+
+
+# Every warehouse round trip (cache misses only) is recorded under the "availability" endpoint label
+def _query_warehouse_items(codes: List[str]) -> Dict[str, WarehouseItem]:
+    started = time.perf_counter()
+    try:
+        with warehouse_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_WAREHOUSE_ITEMS_QUERY, (codes,))
+                return _items_from_rows(cur.fetchall())
+    finally:
+        observe_stage("availability", "db_query", (time.perf_counter() - started) * 1000.0)
+
+
+async def _query_warehouse_items_async(codes: List[str]) -> Dict[str, WarehouseItem]:
+    started = time.perf_counter()
+    try:
+        async with async_warehouse_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(_WAREHOUSE_ITEMS_QUERY, (codes,))
+                return _items_from_rows(await cur.fetchall())
+    finally:
+        observe_stage("availability", "db_query_async", (time.perf_counter() - started) * 1000.0)
+
+
+class AvailabilityCache:
     """
-    Query warehouse_items for the provided product codes (GTINs) and return qty per product_code.
+    Per-GTIN cache of warehouse_items rows.
+
+    Lookups return cached rows that have not expired and fetch every missing/expired code in one bulk
+    query; codes absent from the warehouse are cached too, so they are not re-queried each request.
+    Entries are dropped early by invalidate(), which the LISTEN thread calls for every changed product_code.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[List[str]], Dict[str, WarehouseItem]],
+        ttl_seconds: float = AVAILABILITY_CACHE_TTL_SECONDS,
+        max_entries: int = AVAILABILITY_CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: Dict[str, Tuple[Optional[WarehouseItem], float]] = {}
+        self._lock = threading.Lock()
+        # Codes invalidated while a bulk refresh was in flight; those rows may be stale and are not stored
+        self._in_flight: Dict[object, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_many(self, codes: Iterable[str]) -> Dict[str, WarehouseItem]:
+        result, stale, token = self._begin(codes)
+        if not stale:
+            return result
+        try:
+            fetched = self._fetch(stale)
+        except BaseException:
+            self._finish(token, stale, None)
+            raise
+        result.update(fetched)
+        self._finish(token, stale, fetched)
+        return result
+
+    async def get_many_async(
+        self,
+        codes: Iterable[str],
+        fetch: Callable[[List[str]], Awaitable[Dict[str, WarehouseItem]]],
+    ) -> Dict[str, WarehouseItem]:
+        """
+        get_many for the async handlers: same entries, misses refreshed with an awaitable bulk fetch.
+        """
+        result, stale, token = self._begin(codes)
+        if not stale:
+            return result
+        try:
+            fetched = await fetch(stale)
+        except BaseException:
+            self._finish(token, stale, None)
+            raise
+        result.update(fetched)
+        self._finish(token, stale, fetched)
+        return result
+
+    def _begin(self, codes: Iterable[str]) -> Tuple[Dict[str, WarehouseItem], List[str], object]:
+        # Split codes into fresh hits and codes to refresh; registers the refresh as in flight
+        wanted = [c for c in {str(c) for c in codes} if c]
+        result: Dict[str, WarehouseItem] = {}
+        stale: List[str] = []
+        now = self._clock()
+        token = object()
+        with self._lock:
+            for code in wanted:
+                entry = self._entries.get(code)
+                if entry is not None and entry[1] > now:
+                    if entry[0] is not None:
+                        result[code] = entry[0]
+                else:
+                    stale.append(code)
+            self.hits += len(wanted) - len(stale)
+            self.misses += len(stale)
+            if stale:
+                self._in_flight[token] = set()
+        return result, stale, token
+
+    def _finish(self, token: object, stale: List[str], fetched: Optional[Dict[str, WarehouseItem]]) -> None:
+        expires = self._clock() + self.ttl_seconds
+        with self._lock:
+            dirty = self._in_flight.pop(token)
+            if fetched is None or None in dirty:
+                return
+            if len(self._entries) + len(stale) > self.max_entries:
+                self._evict_expired()
+            for code in stale:
+                if code not in dirty:
+                    self._entries[code] = (fetched.get(code), expires)
+
+    def _evict_expired(self) -> None:
+        now = self._clock()
+        self._entries = {c: e for c, e in self._entries.items() if e[1] > now}
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+
+    def invalidate(self, codes: Optional[Iterable[str]] = None) -> None:
+        """
+        Drop the given codes, or everything when codes is None.
+        """
+        keys = None if codes is None else [str(c) for c in codes]
+        with self._lock:
+            self.invalidations += 1
+            for dirty in self._in_flight.values():
+                if keys is None:
+                    dirty.add(None)
+                else:
+                    dirty.update(keys)
+            if keys is None:
+                self._entries.clear()
+            else:
+                for code in keys:
+                    self._entries.pop(code, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+class _ChangeListener(threading.Thread):
+    """
+    Daemon thread that LISTENs on WAREHOUSE_ITEMS_CHANNEL and invalidates changed product codes.
+    Uses its own connection (LISTEN needs a dedicated session); reconnects with backoff and flushes
+    the whole cache whenever it (re)connects, since notifications may have been missed meanwhile.
+    """
+
+    def __init__(self, cache: AvailabilityCache) -> None:
+        super().__init__(name="availability-listener", daemon=True)
+        self.cache = cache
+        self.connected = False
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            try:
+                conninfo = get_db_conninfo()
+                with psycopg.connect(conninfo, autocommit=True, connect_timeout=CONNECT_TIMEOUT) as conn:
+                    conn.execute(f"LISTEN {WAREHOUSE_ITEMS_CHANNEL}")
+                    self.cache.invalidate()
+                    self.connected = True
+                    backoff = 1.0
+                    while not self._stop_event.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            # Empty payload (TRUNCATE) means "everything changed"
+                            self.cache.invalidate([notify.payload] if notify.payload else None)
+            except psycopg.Error as exc:
+                logger.warning("Availability change feed unavailable (%s); relying on TTL", exc)
+            self.connected = False
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+
+_CACHE: Optional[AvailabilityCache] = None
+_LISTENER: Optional[_ChangeListener] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def availability_cache() -> Optional[AvailabilityCache]:
+    """
+    Process-wide availability cache (None when disabled); the change listener starts with it.
+    """
+    global _CACHE, _LISTENER
+    if not AVAILABILITY_CACHE_ENABLED:
+        return None
+    if _CACHE is not None:
+        return _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = AvailabilityCache(_query_warehouse_items)
+            if AVAILABILITY_CACHE_LISTEN:
+                _LISTENER = _ChangeListener(_CACHE)
+                _LISTENER.start()
+    return _CACHE
+
+
+def invalidate_availability_cache(gtins: Optional[Iterable[str]] = None) -> None:
+    if _CACHE is not None:
+        _CACHE.invalidate(gtins)
+
+
+def availability_cache_stats() -> Dict[str, Any]:
+    cache = _CACHE
+    if cache is None:
+        return {"enabled": AVAILABILITY_CACHE_ENABLED, "initialized": False}
+    stats: Dict[str, Any] = {"enabled": True, "initialized": True}
+    stats.update(cache.stats())
+    stats["listening"] = bool(_LISTENER is not None and _LISTENER.connected)
+    return stats
+
+
+def get_warehouse_items_for_gtins(gtins: Iterable[str]) -> Dict[str, WarehouseItem]:
+    """
+    Map product_code (GTIN) -> (line_id, qty, unit) in a single round trip (or none, on a full cache hit).
+    If a code has several rows, the one with the largest qty wins.
     """
     codes = [g for g in {str(g) for g in gtins} if g]
     if not codes:
         return {}
-    conninfo = get_db_conninfo()
-    result: Dict[str, float] = {}
-    # Use a simple IN clause; psycopg can expand list with ANY as well
-    placeholders = ", ".join(["%s"] * len(codes))
-    query = f"""
-        SELECT product_code, qty
-        FROM warehouse_items
-        WHERE product_code IN ({placeholders})
-    """
-    with psycopg.connect(conninfo, row_factory=dict_row) as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, codes)
-            for row in cur.fetchall():
-                code = str(row["product_code"])
-                qty = float(row["qty"])
-                # Keep max qty if duplicates (shouldn't happen with PK, but safe)
-                prev = result.get(code)
-                result[code] = max(qty, prev if prev is not None else 0.0)
-    return result
+    cache = availability_cache()
+    if cache is not None:
+        return cache.get_many(codes)
+    return _query_warehouse_items(codes)
 
 
-def get_line_ids_for_gtins(gtins: Iterable[str]) -> Dict[str, int]:
+async def get_warehouse_items_for_gtins_async(gtins: Iterable[str]) -> Dict[str, WarehouseItem]:
     """
-    Map product_code (GTIN) -> line_id from warehouse_items for the provided GTINs.
+    Awaitable get_warehouse_items_for_gtins over the async pool; shares the availability cache.
     """
-    codes = [str(g) for g in {str(g) for g in gtins} if g]
+    codes = [g for g in {str(g) for g in gtins} if g]
     if not codes:
         return {}
-    conninfo = get_db_conninfo()
-    result: Dict[str, int] = {}
-    placeholders = ", ".join(["%s"] * len(codes))
-    query = f"""
-        SELECT line_id, product_code
-        FROM warehouse_items
-        WHERE product_code IN ({placeholders})
+    cache = availability_cache()
+    if cache is not None:
+        return await cache.get_many_async(codes, _query_warehouse_items_async)
+    return await _query_warehouse_items_async(codes)
+
+
+def get_availability_for_gtins(gtins: Iterable[str]) -> Dict[str, float]:
     """
-    with psycopg.connect(conninfo, row_factory=dict_row) as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, codes)
-            for row in cur.fetchall():
-                code = str(row["product_code"])
-                line_id = int(row["line_id"])
-                result[code] = line_id
-    return result
+    Query warehouse_items for the provided product codes (GTINs) and return qty per product_code.
+    """
+    return {code: item.qty for code, item in get_warehouse_items_for_gtins(gtins).items()}
 
 
+def get_line_ids_for_gtins(gtins: Iterable[str]) -> Dict[str, int]:
+    """
+    Map product_code (GTIN) -> line_id from warehouse_items for the provided GTINs.
+    """
+    return {code: item.line_id for code, item in get_warehouse_items_for_gtins(gtins).items()}
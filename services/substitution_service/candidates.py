@@ -1,16 +1,83 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple, Set
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
-import math
+import heapq
+import logging
+import os
+import time
+from dataclasses import dataclass
 from functools import lru_cache
 
+import numpy as np
 import pandas as pd
 
-from .features import compute_pair_features
-from .data_loaders import product_data_df
-from .utils_text import simple_tokenize, jaccard_similarity
-# Heuristic-only scorer (model intentionally not used for MVP)
+from .catalog_version import on_catalog_swap
+from .customer_profiles import CustomerProfile, customer_profile
+from .data_loaders import (
+    _normalize_id,
+    build_gtin_index,
+    product_data_df,
+    product_gtin_index,
+    product_record,
+)
+from .feature_store import (
+    FEATURE_NAMES,
+    ProductFeatureStore,
+    pair_feature_matrix,
+    pair_features,
+    product_feature_store,
+)
+from .metrics import stage_timer
+from .model import ModelScorer, load_default_model
+from .name_embeddings import product_name_index
+from .popularity import product_popularity
+from .substitution_graph import product_substitution_graph
+from .token_index import product_token_index
+from .topk_table import product_topk_table
+from .utils_text import simple_tokenize
+# Heuristic scoring by default; the trained model is opt-in via SCORING_MODE
+
+
+# Heuristic feature weights; shared by the scalar and the batch (NumPy) scoring paths
+HEURISTIC_WEIGHTS: Dict[str, float] = {
+    "name_jaccard": 1.5,
+    "size_similarity": 0.8,
+    "diet_compatible": 0.4,
+    "vendor_match": 0.3,
+    "allergen_conflict": -1.0,
+    "temperature_abs_diff": -0.05,
+    "popularity_overall": 0.3,
+    "popularity_by_category": 0.5,
+}
+_HEURISTIC_WEIGHT_VECTOR = np.asarray([HEURISTIC_WEIGHTS.get(fn, 0.0) for fn in FEATURE_NAMES], dtype=np.float64)
+
+# A/B switch between batch NumPy scoring and the per-pair scalar loop
+VECTORIZED_SCORING = bool(int(os.getenv("SUBSTITUTION_VECTORIZED_SCORING", "1")))
+
+# "heuristic" (weighted features), "model" (trained RF probabilities, one predict_proba per pool) or
+# "hybrid" (heuristic shortlist of HYBRID_SHORTLIST_SIZE, re-ranked by the model)
+SCORING_MODES = ("heuristic", "model", "hybrid")
+SCORING_MODE = os.getenv("SUBSTITUTION_SCORING_MODE", "heuristic")
+HYBRID_SHORTLIST_SIZE = int(os.getenv("SUBSTITUTION_HYBRID_SHORTLIST_SIZE", "50"))
+
+# Categories up to this size are scored exhaustively; larger ones are pre-filtered first (approximate mode)
+APPROX_CATEGORY_SIZE = int(os.getenv("SUBSTITUTION_APPROX_CATEGORY_SIZE", "5000"))
+# Approximate-mode candidate generator: "names" (name-embedding neighbours) or "prefilter" (token / size band)
+APPROX_RETRIEVAL = os.getenv("SUBSTITUTION_APPROX_RETRIEVAL", "names")
+# Number of lexically closest same-category products fetched by the "names" generator
+NAME_RETRIEVAL_SIZE = int(os.getenv("SUBSTITUTION_NAME_RETRIEVAL_SIZE", "300"))
+# The "prefilter" generator keeps candidates sharing a name token with the original or within this unit-size ratio
+APPROX_SIZE_BAND = float(os.getenv("SUBSTITUTION_APPROX_SIZE_BAND", "2.0"))
+# Optional scoring budget (0 disables): once a chunk crosses it, the rest of the pool is narrowed with the
+# approximate pre-filter (_prefilter_positions) instead of being scored in full; the first chunk is always scored
+SCORING_BUDGET_MS = float(os.getenv("SUBSTITUTION_SCORING_BUDGET_MS", "0"))
+_SCORING_CHUNK = 4096
+# Historical replacements from the mined substitution graph (see substitution_graph) join the pool even
+# across categories; at most GRAPH_CANDIDATES per product
+GRAPH_CANDIDATES = int(os.getenv("SUBSTITUTION_GRAPH_CANDIDATES", "20"))
+
+logger = logging.getLogger(__name__)
 
 
 def heuristic_score(feats: Dict[str, float]) -> float:
@@ -18,56 +85,24 @@ def heuristic_score(feats: Dict[str, float]) -> float:
     Heuristic scoring used when no trained model is applied.
     Higher is better.
     """
-    return (
-        1.5 * feats["name_jaccard"]
-        + 0.8 * feats["size_similarity"]
-        + 0.4 * feats["diet_compatible"]
-        + 0.3 * feats["vendor_match"]
-        - 1.0 * feats["allergen_conflict"]
-        - 0.05 * feats["temperature_abs_diff"]
-        + 0.3 * feats.get("popularity_overall", 0.0)
-        + 0.5 * feats.get("popularity_by_category", 0.0)
-    )
+    return sum(w * feats.get(name, 0.0) for name, w in HEURISTIC_WEIGHTS.items())
 
 
-def _normalize_id(val: Any) -> Optional[str]:
-    if val is None:
-        return None
-    if isinstance(val, (int,)):
-        return str(val)
-    if isinstance(val, float):
-        # NaN guard
-        if math.isnan(val):
-            return None
-        # Convert 6408430001071.0 -> "6408430001071"
-        i = int(round(val))
-        if abs(val - i) < 1e-9:
-            return str(i)
-        return str(val)
-    s = str(val)
-    # Handle textual NaN/None/empty
-    sl = s.strip().lower()
-    if sl in ("nan", "none", ""):
-        return None
-    if s.endswith(".0"):
-        return s[:-2]
-    return s
+def heuristic_scores(feature_matrix: np.ndarray) -> np.ndarray:
+    """
+    Batch variant of heuristic_score for a pair_feature_matrix (columns in FEATURE_NAMES order).
+    """
+    return feature_matrix @ _HEURISTIC_WEIGHT_VECTOR
 
 
 def _select_by_gtin(df: pd.DataFrame, gtin: str) -> Optional[Dict[str, Any]]:
-    # Try direct on salesUnitGtin
-    if "salesUnitGtin" in df.columns:
-        s = df["salesUnitGtin"].apply(_normalize_id)
-        hits = df[s == gtin]
-        if not hits.empty:
-            return hits.iloc[0].to_dict()
-    # Try synkkaData.gtin if present
-    if "synkkaData" in df.columns:
-        for _, row in df.iterrows():
-            sd = row.get("synkkaData")
-            if isinstance(sd, dict) and _normalize_id(sd.get("gtin")) == gtin:
-                return row.to_dict()
-    return None
+    # Reuse the process-wide index for the cached catalog; index ad-hoc frames on the fly
+    index = product_gtin_index() if df is product_data_df() else build_gtin_index(df)
+    key = _normalize_id(gtin)
+    pos = index.get(key) if key is not None else None
+    if pos is None:
+        return None
+    return df.iloc[pos].to_dict()
 
 
 def _safe_get_category(product: Dict[str, Any]) -> Optional[str]:
@@ -75,61 +110,157 @@ def _safe_get_category(product: Dict[str, Any]) -> Optional[str]:
     return str(cat) if cat is not None else None
 
 
-def suggest_candidates_by_gtin(
+def _resolve_original_position(sku: str, fallback_name: Optional[str] = None) -> Optional[int]:
+    index = product_gtin_index()
+    key = _normalize_id(sku) or sku
+    pos = index.get(key)
+    if pos is None and fallback_name:
+        token_key = _normalize_token_key(fallback_name)
+        gtin = _lookup_gtin_by_tokens(token_key) if token_key is not None else None
+        if gtin:
+            pos = index.get(gtin)
+    return pos
+
+
+def _approximate_positions(
+    store: ProductFeatureStore,
+    orig_pos: int,
+    category: str,
+    positions: np.ndarray,
+    k: int,
+) -> np.ndarray:
+    """
+    Candidate generation for oversized categories; see APPROX_RETRIEVAL.
+    """
+    if APPROX_RETRIEVAL == "names":
+        index = product_name_index()
+        if index is not None:
+            retrieved, _sims = index.nearest_in_category(orig_pos, category, max(NAME_RETRIEVAL_SIZE, k))
+            # Back to category order so equal scores rank as in exact mode
+            return np.sort(retrieved)
+    return _prefilter_positions(store, orig_pos, positions, k)
+
+
+def _prefilter_positions(store: ProductFeatureStore, orig_pos: int, positions: np.ndarray, k: int) -> np.ndarray:
+    """
+    Approximate-mode pre-filter for oversized categories: keep candidates that share at least one
+    name token with the original or whose unit size is within APPROX_SIZE_BAND of it.
+    Order is preserved; the full set is returned if fewer than k survive.
+    """
+    shared = (store.token_matrix[positions] @ store.token_matrix[orig_pos].T).toarray().ravel() > 0
+    keep = shared
+    o_size = store.unit_size[orig_pos]
+    if o_size > 0:
+        ratio = store.unit_size[positions] / o_size
+        keep = keep | ((ratio >= 1.0 / APPROX_SIZE_BAND) & (ratio <= APPROX_SIZE_BAND))
+    if int(keep.sum()) < k:
+        return positions
+    return positions[keep]
+
+
+def _graph_positions(store: ProductFeatureStore, orig_pos: int) -> List[int]:
+    """
+    Catalog positions of the original's strongest historical replacements outside its category.
+    """
+    graph = product_substitution_graph() if GRAPH_CANDIDATES > 0 else None
+    orig_gtin = store.gtins[orig_pos]
+    if graph is None or not orig_gtin:
+        return []
+    index = product_gtin_index()
+    out: List[int] = []
+    for neighbor in graph.neighbors(orig_gtin, limit=GRAPH_CANDIDATES):
+        pos = index.get(neighbor.code)
+        if pos is not None and store.category_codes[pos] != store.category_codes[orig_pos]:
+            out.append(pos)
+    return out
+
+
+@dataclass
+class CandidatePool:
+    """
+    Resolved original product and its candidate positions (original excluded): the same category,
+    followed by historical replacements from other categories.
+    """
+
+    orig_pos: Optional[int]
+    orig: Dict[str, Any]
+    positions: List[int]
+    # True when the category was pre-filtered instead of scored in full
+    approximate: bool = False
+    # True when positions is the original's precomputed top-k row (see topk_table), ranked from the table
+    table: bool = False
+
+    def gtins(self, store: ProductFeatureStore) -> List[str]:
+        return [store.gtins[p] for p in self.positions if store.gtins[p]]
+
+
+def build_candidate_pool(
     sku: str,
-    k: int = 3,
-    max_pool: int = 500,
-    available_qty_by_code: Optional[Dict[str, float]] = None,
-    required_qty: Optional[float] = None,
+    max_pool: Optional[int] = None,
     fallback_name: Optional[str] = None,
-) -> Tuple[Dict[str, Any], List[Tuple[str, float, Dict[str, Any]]]]:
+    k: int = 3,
+    timings: Optional[Dict[str, float]] = None,
+) -> CandidatePool:
     """
-    Returns:
-      original_product, list of (candidate_gtin, score, candidate_row_dict)
+    Whole same-category pool for sku plus its graph neighbors from other categories. Categories larger
+    than max_pool (default: APPROX_CATEGORY_SIZE) are narrowed with _approximate_positions; the result
+    is deterministic either way. GTIN lookup and pool build times go to timings ("resolve", "pool").
     """
-    products = product_data_df()
-    normalized_sku = _normalize_id(sku) or sku
-    orig = _select_by_gtin(products, normalized_sku)
-    if (not orig) and fallback_name:
-        orig = _select_by_name(products, fallback_name)
-    if orig is None:
-        return {}, []
+    with stage_timer(timings, "resolve"):
+        orig_pos = _resolve_original_position(sku, fallback_name)
+    if orig_pos is None:
+        return CandidatePool(None, {}, [])
+    with stage_timer(timings, "pool"):
+        return _pool_for_position(orig_pos, max_pool, k)
+
+
+def _pool_for_position(orig_pos: int, max_pool: Optional[int], k: int) -> CandidatePool:
+    orig = product_record(orig_pos)
 
     cat = _safe_get_category(orig)
     if not cat:
-        return orig, []
-
-    # Build pool: same category, excluding original
-    same_cat = products[products["category"].astype(str) == cat].copy()
-    # Randomly limit pool size for speed
-    if len(same_cat) > max_pool:
-        same_cat = same_cat.sample(n=max_pool, random_state=42)
+        return CandidatePool(orig_pos, orig, [])
+
+    # Build pool: same category (precomputed partition), excluding original
+    store = product_feature_store()
+    same_cat = store.category_members.get(cat)
+    if same_cat is None:
+        return CandidatePool(orig_pos, orig, [])
+    limit = APPROX_CATEGORY_SIZE if max_pool is None else max_pool
+    approximate = len(same_cat) > limit
+    if approximate:
+        same_cat = _approximate_positions(store, orig_pos, cat, same_cat, k)
     # Exclude original by GTIN
-    orig_gtin = _normalize_id(orig.get("salesUnitGtin")) or _normalize_id(orig.get("synkkaData", {}).get("gtin"))
-    def not_same(row: pd.Series) -> bool:
-        r_gtin = _normalize_id(row.get("salesUnitGtin")) or _normalize_id((row.get("synkkaData") or {}).get("gtin"))
-        return r_gtin != orig_gtin
-    pool = same_cat[same_cat.apply(not_same, axis=1)]
+    orig_gtin = store.gtins[orig_pos]
+    positions = [int(p) for p in same_cat if store.gtins[p] != orig_gtin]
+    positions.extend(p for p in _graph_positions(store, orig_pos) if store.gtins[p] != orig_gtin)
+    return CandidatePool(orig_pos, orig, positions, approximate)
 
-    # If no availability map provided, attempt to resolve via callback from DB (optional, imported at API layer)
-    if available_qty_by_code is None:
-        try:
-            # Create the candidate list of GTINs to resolve availability for
-            cand_gtins: List[str] = []
-            for _, row in pool.iterrows():
-                cand = row.to_dict()
-                cg = _normalize_id(cand.get("salesUnitGtin")) or _normalize_id((cand.get("synkkaData") or {}).get("gtin"))
-                if cg:
-                    cand_gtins.append(cg)
-            # Lazy import to avoid hard dependency if DB not used
-            from .availability import get_availability_for_gtins  # type: ignore
-            available_qty_by_code = get_availability_for_gtins(cand_gtins)
-            if not available_qty_by_code:
-                # Treat empty map the same as no availability snapshot so we don't reject every candidate.
-                available_qty_by_code = None
-        except Exception:
-            available_qty_by_code = None
 
+def _lookup_availability(gtins: List[str]) -> Optional[Dict[str, float]]:
+    """
+    Warehouse stock for the given GTINs (empty when none is stocked), or None when the lookup failed.
+    """
+    try:
+        # Lazy import to avoid hard dependency if DB not used
+        from .availability import get_availability_for_gtins  # type: ignore
+        return get_availability_for_gtins(gtins)
+    except Exception:
+        return None
+
+
+def _resolve_availability(gtins: List[str]) -> Optional[Dict[str, float]]:
+    """
+    Availability snapshot from the warehouse DB for the given GTINs, or None when unknown.
+    """
+    # Treat empty map the same as no availability snapshot so we don't reject every candidate.
+    return _lookup_availability(gtins) or None
+
+
+def _availability_filter(
+    available_qty_by_code: Optional[Dict[str, float]],
+    required_qty: Optional[float],
+) -> Callable[[Optional[str]], bool]:
     def _is_available(candidate_gtin: Optional[str]) -> bool:
         if available_qty_by_code is None:
             return True
@@ -142,47 +273,385 @@ def suggest_candidates_by_gtin(
             return qty_avail > 0
         return qty_avail >= float(required_qty)
 
-    scored: List[Tuple[str, float, Dict[str, Any]]] = []
-    scorer = None  # force heuristic-only scoring
-    for _, row in pool.iterrows():
-        cand = row.to_dict()
-        feats = compute_pair_features(orig, cand)
-        # Heuristic weighted scoring
-        score = heuristic_score(feats)
-        cand_gtin = _normalize_id(cand.get("salesUnitGtin")) or _normalize_id((cand.get("synkkaData") or {}).get("gtin"))
-        if cand_gtin and _is_available(cand_gtin):
-            scored.append((cand_gtin, float(score), cand))
-
-    # Sort and take top-k
-    scored.sort(key=lambda x: x[1], reverse=True)
-    return orig, scored[:k]
-
-
-def _collect_candidate_names(product: Dict[str, Any]) -> List[str]:
-    names: List[str] = []
-    synkka = product.get("synkkaData")
-    if isinstance(synkka, dict):
-        entries = synkka.get("names")
-        if isinstance(entries, list):
-            for entry in entries:
-                if isinstance(entry, dict):
-                    value = entry.get("value")
-                    if isinstance(value, str) and value:
-                        names.append(value)
-    vendor = product.get("vendorName")
-    if isinstance(vendor, str) and vendor:
-        names.append(vendor)
-    brand = product.get("brand")
-    if isinstance(brand, str) and brand:
-        names.append(brand)
-    return names
-
-
-def _name_tokens(product: Dict[str, Any]) -> Set[str]:
-    tokens: Set[str] = set()
-    for text in _collect_candidate_names(product):
-        tokens |= simple_tokenize(text)
-    return tokens
+    return _is_available
+
+
+def _serve_from_table(orig_pos: int, mode: str, profile: Optional[CustomerProfile]) -> bool:
+    # The table ranks same-category candidates only and without customer preferences; products with
+    # cross-category history and customers with a profile are scored live
+    return mode == "heuristic" and profile is None and not _graph_positions(product_feature_store(), orig_pos)
+
+
+def _rank_from_table(
+    orig_pos: int,
+    k: int,
+    available_qty_by_code: Optional[Dict[str, float]],
+    required_qty: Optional[float],
+    resolve_availability: bool = True,
+) -> Optional[List[Tuple[str, float, Dict[str, Any]]]]:
+    """
+    Serve top-k from the precomputed table, filtering by stock only. None means "score live instead":
+    no table, or a truncated row that ran out of available candidates.
+    Stock looked up here covers the row only, so an empty lookup means none of the row is available
+    (not "no snapshot"); only a caller-supplied None serves the row unfiltered.
+    """
+    table = product_topk_table()
+    if table is None or orig_pos >= len(table):
+        return None
+    positions, scores, complete = table.row(orig_pos)
+    gtins = product_feature_store().gtins
+    if available_qty_by_code is None and resolve_availability and len(positions):
+        available_qty_by_code = _lookup_availability([gtins[p] for p in positions])
+        if available_qty_by_code is None:
+            return None
+    _is_available = _availability_filter(available_qty_by_code, required_qty)
+    top: List[Tuple[int, float]] = []
+    for p, score in zip(positions.tolist(), scores.tolist()):
+        if _is_available(gtins[p]):
+            top.append((p, score))
+            if len(top) == k:
+                break
+    if len(top) < k and not complete:
+        return None
+    return [(gtins[p], score, product_record(p)) for p, score in top]
+
+
+def resolve_scoring_mode(mode: Optional[str]) -> str:
+    """
+    Requested scoring mode (default SCORING_MODE); model-based modes degrade to "heuristic" without a usable model.
+    """
+    mode = mode or SCORING_MODE
+    if mode not in SCORING_MODES:
+        raise ValueError(f"Unknown scoring mode: {mode}")
+    if mode != "heuristic" and load_default_model() is None:
+        return "heuristic"
+    return mode
+
+
+def rank_candidate_pool(
+    pool: CandidatePool,
+    k: int = 3,
+    available_qty_by_code: Optional[Dict[str, float]] = None,
+    required_qty: Optional[float] = None,
+    vectorized: Optional[bool] = None,
+    mode: Optional[str] = None,
+    shortlist_size: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
+    profile: Optional[CustomerProfile] = None,
+) -> List[Tuple[str, float, Dict[str, Any]]]:
+    """
+    Filter a pool by availability and return the top-k (candidate_gtin, score, candidate_row_dict).
+    In "hybrid" mode the heuristic keeps the best shortlist_size (default HYBRID_SHORTLIST_SIZE) candidates
+    and the model orders those; scores are then model probabilities. Stage times go to timings (ms).
+    A customer profile adds its boosts to heuristic scores (and so to the hybrid shortlist).
+    """
+    if pool.orig_pos is None or not pool.positions:
+        return []
+    store = product_feature_store()
+    with stage_timer(timings, "filter"):
+        _is_available = _availability_filter(available_qty_by_code, required_qty)
+        eligible = [p for p in pool.positions if store.gtins[p] and _is_available(store.gtins[p])]
+    if vectorized is None:
+        vectorized = VECTORIZED_SCORING
+    deadline = time.perf_counter() + SCORING_BUDGET_MS / 1000.0 if SCORING_BUDGET_MS > 0 else None
+    mode = resolve_scoring_mode(mode)
+    if mode == "model":
+        with stage_timer(timings, "model"):
+            top = _top_k_model(store, pool.orig_pos, eligible, k, load_default_model())
+    else:
+        m = k
+        if mode == "hybrid":
+            m = max(k, shortlist_size if shortlist_size is not None else HYBRID_SHORTLIST_SIZE)
+        with stage_timer(timings, "heuristic"):
+            if vectorized:
+                top = _top_k_vectorized(store, pool.orig_pos, eligible, m, deadline, profile)
+            else:
+                top = _top_k_scalar(store, pool.orig_pos, eligible, m, deadline, profile)
+        if mode == "hybrid":
+            with stage_timer(timings, "model"):
+                # Ties keep the heuristic order of the shortlist
+                top = _top_k_model(store, pool.orig_pos, [p for p, _s in top], k, load_default_model())
+    # Only the winners are materialized as row dicts
+    with stage_timer(timings, "materialize"):
+        return [(store.gtins[p], score, product_record(p)) for p, score in top]
+
+
+def suggest_candidates_by_gtin(
+    sku: str,
+    k: int = 3,
+    max_pool: Optional[int] = None,
+    available_qty_by_code: Optional[Dict[str, float]] = None,
+    required_qty: Optional[float] = None,
+    fallback_name: Optional[str] = None,
+    vectorized: Optional[bool] = None,
+    mode: Optional[str] = None,
+    shortlist_size: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
+    customer_id: Optional[str] = None,
+) -> Tuple[Dict[str, Any], List[Tuple[str, float, Dict[str, Any]]]]:
+    """
+    Returns:
+      original_product, list of (candidate_gtin, score, candidate_row_dict)
+    vectorized selects the NumPy batch scorer (default: VECTORIZED_SCORING); rankings match the scalar loop.
+    mode is one of SCORING_MODES (default SCORING_MODE); shortlist_size is the hybrid shortlist length.
+    When a precomputed top-k table is available (see topk_table) the heuristic ranking is read from it over
+    the whole category and only stock filtering happens here; unknown GTINs fall back to live scoring.
+    If a timings dict is passed, per-stage wall times (ms) are added to it.
+    customer_id selects a precomputed preference profile (see customer_profiles) that boosts heuristic scores.
+    """
+    with stage_timer(timings, "resolve"):
+        orig_pos = _resolve_original_position(sku, fallback_name)
+    if orig_pos is None:
+        return {}, []
+    with stage_timer(timings, "profile"):
+        profile = customer_profile(customer_id)
+    mode = resolve_scoring_mode(mode)
+    if _serve_from_table(orig_pos, mode, profile):
+        with stage_timer(timings, "table"):
+            served = _rank_from_table(orig_pos, k, available_qty_by_code, required_qty)
+        if served is not None:
+            return product_record(orig_pos), served
+    with stage_timer(timings, "pool"):
+        pool = _pool_for_position(orig_pos, max_pool, k)
+    # If no availability map provided, attempt to resolve via callback from DB (optional, imported at API layer)
+    if available_qty_by_code is None and pool.positions:
+        with stage_timer(timings, "availability"):
+            available_qty_by_code = _resolve_availability(pool.gtins(product_feature_store()))
+    ranked = rank_candidate_pool(
+        pool, k, available_qty_by_code, required_qty, vectorized, mode, shortlist_size, timings, profile
+    )
+    return pool.orig, ranked
+
+
+def candidate_pools(
+    lines: Sequence[Tuple[str, Optional[float], Optional[str]]],
+    k: int = 3,
+    max_pool: Optional[int] = None,
+    mode: Optional[str] = None,
+    use_table: bool = True,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[CandidatePool]:
+    """
+    Candidate pool per (sku, required_qty, fallback_name) line, for callers that look stock up
+    themselves before ranking the same pools with rank_candidate_pools.
+    Lines the precomputed top-k table can serve (as in suggest_candidates_by_gtin) get the table row
+    instead of the whole category, so only the row's GTINs need a stock lookup; use_table=False
+    always builds the whole pool.
+    """
+    mode = resolve_scoring_mode(mode)
+    table = product_topk_table() if use_table and mode == "heuristic" else None
+    pools: List[CandidatePool] = []
+    for sku, _qty, name in lines:
+        with stage_timer(timings, "resolve"):
+            orig_pos = _resolve_original_position(sku, name)
+        if orig_pos is None:
+            pools.append(CandidatePool(None, {}, []))
+        elif table is not None and orig_pos < len(table) and _serve_from_table(orig_pos, mode, None):
+            with stage_timer(timings, "table"):
+                row = table.row(orig_pos)[0].tolist()
+                pools.append(CandidatePool(orig_pos, product_record(orig_pos), row, table=True))
+        else:
+            with stage_timer(timings, "pool"):
+                pools.append(_pool_for_position(orig_pos, max_pool, k))
+    return pools
+
+
+def rank_candidate_pools(
+    pools: Sequence[CandidatePool],
+    lines: Sequence[Tuple[str, Optional[float], Optional[str]]],
+    k: int = 3,
+    available_qty_by_code: Optional[Dict[str, float]] = None,
+    vectorized: Optional[bool] = None,
+    mode: Optional[str] = None,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[Optional[Tuple[Dict[str, Any], List[Tuple[str, float, Dict[str, Any]]]]]]:
+    """
+    (original, top-k) per pool, filtering by each line's required quantity; no availability lookup.
+    None marks a truncated table row that ran out of available candidates: pool that line again
+    with use_table=False and rank it with stock for the whole pool.
+    """
+    ranked: List[Optional[Tuple[Dict[str, Any], List[Tuple[str, float, Dict[str, Any]]]]]] = []
+    for pool, (_sku, qty, _name) in zip(pools, lines):
+        if pool.table and pool.orig_pos is not None:
+            with stage_timer(timings, "table"):
+                served = _rank_from_table(pool.orig_pos, k, available_qty_by_code, qty, resolve_availability=False)
+            ranked.append((pool.orig, served) if served is not None else None)
+        else:
+            top = rank_candidate_pool(pool, k, available_qty_by_code, qty, vectorized, mode, timings=timings)
+            ranked.append((pool.orig, top))
+    return ranked
+
+
+def suggest_candidates_batch(
+    lines: Sequence[Tuple[str, Optional[float], Optional[str]]],
+    k: int = 3,
+    max_pool: Optional[int] = None,
+    available_qty_by_code: Optional[Dict[str, float]] = None,
+    vectorized: Optional[bool] = None,
+    mode: Optional[str] = None,
+    resolve_availability: bool = True,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[Tuple[Dict[str, Any], List[Tuple[str, float, Dict[str, Any]]]]]:
+    """
+    Batch variant of suggest_candidates_by_gtin for whole-order shortages.
+    lines are (sku, required_qty, fallback_name); availability for the union of all pools is
+    resolved with a single DB query, unless resolve_availability is False (callers that already
+    looked stock up; None then means "no snapshot"). GTINs missing from a resolved lookup count as
+    out of stock, so table rows with nothing available fall back to their whole pool.
+    Results are returned in input order.
+    Stage times summed over all lines go to timings (ms).
+    """
+    resolve = available_qty_by_code is None and resolve_availability
+    pools = candidate_pools(lines, k=k, max_pool=max_pool, mode=mode, timings=timings)
+    if resolve:
+        available_qty_by_code = _pools_availability(pools, None, timings)
+    ranked = rank_candidate_pools(pools, lines, k, available_qty_by_code, vectorized, mode, timings)
+    retry = [i for i, r in enumerate(ranked) if r is None]
+    if retry:
+        # Table rows that ran out of stock: rank those lines over their whole pool
+        retry_lines = [lines[i] for i in retry]
+        full = candidate_pools(retry_lines, k=k, max_pool=max_pool, mode=mode, use_table=False, timings=timings)
+        if resolve:
+            available_qty_by_code = _pools_availability(full, available_qty_by_code, timings)
+        retried = rank_candidate_pools(full, retry_lines, k, available_qty_by_code, vectorized, mode, timings)
+        for i, r in zip(retry, retried):
+            ranked[i] = r
+    return [r for r in ranked if r is not None]
+
+
+def _pools_availability(
+    pools: Sequence[CandidatePool],
+    known: Optional[Dict[str, float]],
+    timings: Optional[Dict[str, float]],
+) -> Optional[Dict[str, float]]:
+    """
+    known plus one DB lookup for the pools' GTINs it does not cover yet. An empty result stays empty
+    (nothing in stock); None only when no lookup succeeded.
+    """
+    store = product_feature_store()
+    union = sorted({g for pool in pools for g in pool.gtins(store)} - set(known or ()))
+    if not union:
+        return known
+    with stage_timer(timings, "availability"):
+        fetched = _lookup_availability(union)
+    if fetched is None:
+        return known
+    return {**(known or {}), **fetched}
+
+
+def _over_budget(deadline: Optional[float], scored: int, total: int) -> bool:
+    if deadline is None or time.perf_counter() <= deadline:
+        return False
+    logger.warning(
+        "Scoring budget of %.0f ms exhausted after %d/%d candidates; pre-filtering the rest",
+        SCORING_BUDGET_MS,
+        scored,
+        total,
+    )
+    return True
+
+
+def _scoring_chunks(
+    store: ProductFeatureStore,
+    orig_pos: int,
+    positions: np.ndarray,
+    deadline: Optional[float],
+) -> Iterator[np.ndarray]:
+    """
+    Pool positions in _SCORING_CHUNK slices. Past the deadline the remainder is cut down to the candidates
+    that pass _prefilter_positions, so likely substitutes late in the pool are still scored.
+    """
+    for start in range(0, len(positions), _SCORING_CHUNK):
+        if start and _over_budget(deadline, start, len(positions)):
+            rest = _prefilter_positions(store, orig_pos, positions[start:], 0)
+            for rest_start in range(0, len(rest), _SCORING_CHUNK):
+                yield rest[rest_start: rest_start + _SCORING_CHUNK]
+            return
+        yield positions[start: start + _SCORING_CHUNK]
+
+
+def _top_k_scalar(
+    store: ProductFeatureStore,
+    orig_pos: int,
+    pool: List[int],
+    k: int,
+    deadline: Optional[float] = None,
+    profile: Optional[CustomerProfile] = None,
+) -> List[Tuple[int, float]]:
+    top: List[Tuple[int, float]] = []
+    popularity = product_popularity()
+
+    def score(p: int) -> float:
+        if popularity is None:
+            feats = pair_features(store, orig_pos, p)
+        else:
+            feats = pair_features(store, orig_pos, p, popularity.overall[p], popularity.by_category[p])
+        bonus = profile.boost(store, p) if profile is not None else 0.0
+        return float(heuristic_score(feats)) + bonus
+
+    for positions in _scoring_chunks(store, orig_pos, np.asarray(pool, dtype=np.int64), deadline):
+        # Heuristic weighted scoring over precomputed per-product features
+        chunk = [(p, score(p)) for p in positions.tolist()]
+        # nlargest is stable: equal scores keep pool order, and earlier winners precede the new chunk
+        top = heapq.nlargest(k, top + chunk, key=lambda x: x[1])
+    return top
+
+
+def _stable_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k largest scores, best first, ties in index order (same as a stable full sort).
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if len(scores) > k:
+        kth = np.partition(-scores, k - 1)[k - 1]
+        idx = np.flatnonzero(-scores <= kth)
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx], kind="stable")][:k]
+
+
+def _top_k_vectorized(
+    store: ProductFeatureStore,
+    orig_pos: int,
+    pool: List[int],
+    k: int,
+    deadline: Optional[float] = None,
+    profile: Optional[CustomerProfile] = None,
+) -> List[Tuple[int, float]]:
+    positions = np.asarray(pool, dtype=np.int64)
+    popularity = product_popularity()
+    best_pos = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float64)
+    for chunk in _scoring_chunks(store, orig_pos, positions, deadline):
+        cand_pos = np.concatenate([best_pos, chunk])
+        features = pair_feature_matrix(store, orig_pos, chunk, popularity)
+        chunk_scores = heuristic_scores(features)
+        if profile is not None:
+            chunk_scores = chunk_scores + profile.boosts(store, chunk)
+        cand_scores = np.concatenate([best_scores, chunk_scores])
+        order = _stable_top_k(cand_scores, k)
+        best_pos, best_scores = cand_pos[order], cand_scores[order]
+    return [(int(p), float(s)) for p, s in zip(best_pos, best_scores)]
+
+
+def _top_k_model(
+    store: ProductFeatureStore,
+    orig_pos: int,
+    pool: List[int],
+    k: int,
+    scorer: ModelScorer,
+) -> List[Tuple[int, float]]:
+    # Whole pool in one predict_proba call, with the same popularity priors as the heuristic path
+    positions = np.asarray(pool, dtype=np.int64)
+    features = pair_feature_matrix(store, orig_pos, positions, product_popularity())
+    scores = scorer.score_batch(features, FEATURE_NAMES)
+    order = _stable_top_k(scores, k)
+    return [(int(positions[i]), float(scores[i])) for i in order]
+
+
+# Minimum name-token Jaccard for the GTIN fallback lookup
+NAME_MATCH_MIN_JACCARD = 0.2
 
 
 def _normalize_token_key(name: str) -> Optional[Tuple[str, ...]]:
@@ -194,35 +663,25 @@ def _normalize_token_key(name: str) -> Optional[Tuple[str, ...]]:
 
 @lru_cache(maxsize=2048)
 def _lookup_gtin_by_tokens(token_key: Tuple[str, ...]) -> Optional[str]:
-    df = product_data_df()
-    target = set(token_key)
-    best_score = 0.0
-    best_gtin: Optional[str] = None
-    for _, row in df.iterrows():
-        product = row.to_dict()
-        tokens = _name_tokens(product)
-        if not tokens:
-            continue
-        score = jaccard_similarity(target, tokens)
-        if score > best_score:
-            candidate_gtin = _normalize_id(product.get("salesUnitGtin")) or _normalize_id(
-                (product.get("synkkaData") or {}).get("gtin")
-            )
-            if candidate_gtin:
-                best_score = score
-                best_gtin = candidate_gtin
-    if best_score < 0.2:
+    best = product_token_index().best(token_key, min_score=NAME_MATCH_MIN_JACCARD)
+    if best is None:
         return None
-    return best_gtin
+    return product_feature_store().gtins[best[0]]
 
 
-def _select_by_name(df: pd.DataFrame, name: str) -> Optional[Dict[str, Any]]:
-    token_key = _normalize_token_key(name)
-    if token_key is None:
-        return None
-    gtin = _lookup_gtin_by_tokens(token_key)
-    if not gtin:
-        return None
-    return _select_by_gtin(df, gtin)
+on_catalog_swap(lambda _version: _lookup_gtin_by_tokens.cache_clear())
 
 
+def lookup_gtins_by_name(
+    name: str,
+    k: int = 5,
+    min_score: float = NAME_MATCH_MIN_JACCARD,
+) -> List[Tuple[str, float]]:
+    """
+    Ranked (gtin, jaccard) alternatives for a free-text product name.
+    """
+    token_key = _normalize_token_key(name)
+    if token_key is None:
+        return []
+    gtins = product_feature_store().gtins
+    return [(gtins[pos], score) for pos, score in product_token_index().top_k(token_key, k, min_score=min_score)]
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 2
+_META_FILE = "meta.json"
+
+
+def source_key(source: Path) -> str:
+    """
+    Freshness key for a source file: size + mtime, so any rewrite of the JSON invalidates the snapshot.
+    """
+    st = Path(source).stat()
+    raw = f"{SNAPSHOT_FORMAT_VERSION}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("ascii")).hexdigest()[:16]
+
+
+def snapshot_dir(source: Path, cache_dir: Path) -> Path:
+    return Path(cache_dir) / f"{Path(source).stem}.snapshot"
+
+
+class StringTable:
+    """
+    Read-only column of optional strings stored as one UTF-8 blob plus int64 offsets.
+    Both files are memory-mapped; rows are decoded on access. The *_bytes methods return the
+    raw row bytes, for tables written with write_bytes.
+    """
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray, nulls: np.ndarray) -> None:
+        self.offsets = offsets
+        self.blob = blob
+        self.nulls = nulls
+
+    @classmethod
+    def open(cls, base: Path) -> "StringTable":
+        offsets = np.load(f"{base}.offsets.npy", mmap_mode="r")
+        nulls = np.load(f"{base}.nulls.npy", mmap_mode="r")
+        blob_path = Path(f"{base}.utf8")
+        if blob_path.stat().st_size:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            blob = np.empty(0, dtype=np.uint8)
+        return cls(offsets, blob, nulls)
+
+    @staticmethod
+    def write(base: Path, values: Sequence[Optional[str]]) -> None:
+        StringTable.write_bytes(base, [v.encode("utf-8") if v is not None else None for v in values])
+
+    @staticmethod
+    def write_bytes(base: Path, values: Sequence[Optional[bytes]]) -> None:
+        encoded = [v if v is not None else b"" for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        np.save(f"{base}.offsets.npy", offsets)
+        np.save(f"{base}.nulls.npy", np.asarray([v is None for v in values], dtype=bool))
+        with open(f"{base}.utf8", "wb") as f:
+            for e in encoded:
+                f.write(e)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        raw = self.get_bytes(i)
+        return raw.decode("utf-8") if raw is not None else None
+
+    def get_bytes(self, i: int) -> Optional[bytes]:
+        if self.nulls[i]:
+            return None
+        return bytes(self.blob[self.offsets[i]: self.offsets[i + 1]])
+
+    def to_list(self) -> List[Optional[str]]:
+        return [v.decode("utf-8") if v is not None else None for v in self.to_bytes_list()]
+
+    def to_bytes_list(self) -> List[Optional[bytes]]:
+        data = bytes(self.blob)
+        offsets = self.offsets.tolist()
+        nulls = self.nulls.tolist()
+        return [None if nulls[i] else data[offsets[i]: offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _column_kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    if all(isinstance(v, str) or _is_missing(v) for v in series.tolist()):
+        return "str"
+    # Nested dicts/lists or mixed scalars: one pickle per row
+    return "object"
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    # Decoding builds millions of small containers; generational GC passes over them cost ~40% of the load
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def decode_object(raw: bytes) -> Any:
+    """
+    Decode one cell of an "object" snapshot column (see write_catalog_snapshot).
+    """
+    return pickle.loads(raw)
+
+
+def _file_stem(i: int) -> str:
+    return f"col{i:03d}"
+
+
+def write_catalog_snapshot(df: pd.DataFrame, source: Path, cache_dir: Path) -> Path:
+    """
+    Write a columnar snapshot of df next to the other cache files and return its directory.
+    Numeric columns become .npy arrays, string columns string tables and nested columns tables of
+    per-row pickles, which decode about twice as fast as the same rows as JSON.
+    The snapshot is staged in a temp dir and renamed into place, so readers never see a partial write.
+    """
+    target = snapshot_dir(source, cache_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".staging-", dir=target.parent))
+    try:
+        columns: List[Dict[str, Any]] = []
+        for i, name in enumerate(df.columns):
+            series = df[name]
+            kind = _column_kind(series)
+            base = staging / _file_stem(i)
+            if kind == "numeric":
+                np.save(f"{base}.npy", series.to_numpy())
+            elif kind == "str":
+                StringTable.write(base, [None if _is_missing(v) else v for v in series.tolist()])
+            else:
+                rows = [pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL) for v in series.tolist()]
+                StringTable.write_bytes(base, rows)
+            columns.append({"name": str(name), "kind": kind, "file": _file_stem(i)})
+        meta = {
+            "format": SNAPSHOT_FORMAT_VERSION,
+            "source": Path(source).name,
+            "key": source_key(source),
+            "rows": int(len(df)),
+            "columns": columns,
+        }
+        (staging / _META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def read_snapshot_meta(source: Path, cache_dir: Path) -> Optional[Dict[str, Any]]:
+    """
+    Snapshot metadata if a snapshot exists and matches the current source file, else None.
+    """
+    meta_path = snapshot_dir(source, cache_dir) / _META_FILE
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != SNAPSHOT_FORMAT_VERSION or meta.get("key") != source_key(source):
+        return None
+    return meta
+
+
+def load_catalog_snapshot(
+    source: Path,
+    cache_dir: Path,
+    usecols: Optional[Sequence[str]] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Load a fresh snapshot of source as a DataFrame (numeric columns memory-mapped), or None if stale/missing.
+    Only the requested columns are read when usecols is given.
+    """
+    meta = read_snapshot_meta(source, cache_dir)
+    if meta is None:
+        return None
+    root = snapshot_dir(source, cache_dir)
+    wanted = set(usecols) if usecols else None
+    data: Dict[str, Any] = {}
+    for col in meta["columns"]:
+        if wanted is not None and col["name"] not in wanted:
+            continue
+        base = root / col["file"]
+        if col["kind"] == "numeric":
+            data[col["name"]] = np.load(f"{base}.npy", mmap_mode="r")
+        elif col["kind"] == "str":
+            data[col["name"]] = pd.Series(StringTable.open(base).to_list(), dtype=object)
+        else:
+            rows = StringTable.open(base).to_bytes_list()
+            with _gc_paused():
+                data[col["name"]] = pd.Series([decode_object(v) for v in rows], dtype=object)
+    return pd.DataFrame(data, copy=False)
+
+
+def main() -> None:
+    # Ensure repo root is on sys.path so `services.*` imports work
+    repo_root = Path(__file__).resolve().parents[2]
+    if str(repo_root) not in sys.path:
+        sys.path.insert(0, str(repo_root))
+    from services.substitution_service.data_loaders import (
+        DEFAULT_PRODUCT_JSON,
+        _resolve_path,
+        catalog_cache_dir,
+    )
+
+    parser = argparse.ArgumentParser(description="Convert the product catalog JSON into a columnar snapshot.")
+    parser.add_argument("--json", type=str, default=None, help="Catalog JSON path (default: VALIO_DATA_DIR)")
+    parser.add_argument("--cache-dir", type=str, default=None, help="Snapshot directory (default: VALIO_CACHE_DIR)")
+    args = parser.parse_args()
+
+    source = _resolve_path(Path(args.json) if args.json else None, DEFAULT_PRODUCT_JSON)
+    cache_dir = Path(args.cache_dir) if args.cache_dir else catalog_cache_dir()
+    df = pd.read_json(source)
+    out = write_catalog_snapshot(df, source, cache_dir)
+    print(f"[snapshot] Wrote {len(df)} rows x {len(df.columns)} columns to {out}")
+
+
+if __name__ == "__main__":
+    main()
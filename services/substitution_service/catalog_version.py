@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import functools
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_SEQUENCE = itertools.count(1)
+
+
+class CatalogVersion:
+    """
+    One generation of the catalog and everything derived from it (DataFrame, GTIN index,
+    feature store, ...). Structures are built lazily on first use and then shared by every reader
+    of this generation; a reload builds a new generation next to it and swaps the active pointer.
+    """
+
+    def __init__(self) -> None:
+        self.sequence = next(_SEQUENCE)
+        self.created_at = time.time()
+        self.source_key: Optional[str] = None
+        self._values: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._meta_lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        return f"{self.sequence}-{self.source_key}" if self.source_key else str(self.sequence)
+
+    def get(self, key: str, build: Callable[[], T]) -> T:
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        with self._meta_lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        # Per-key locks: concurrent first readers build once, unrelated structures build in parallel
+        with lock:
+            if key not in self._values:
+                self._values[key] = build()
+            return self._values[key]
+
+    def discard(self, key: str) -> None:
+        self._values.pop(key, None)
+
+    def built(self) -> List[str]:
+        return sorted(self._values)
+
+
+_ACTIVE: Optional[CatalogVersion] = None
+_ACTIVE_LOCK = threading.Lock()
+_PINNED: contextvars.ContextVar[Optional[CatalogVersion]] = contextvars.ContextVar("catalog_version", default=None)
+_SWAP_LISTENERS: List[Callable[[CatalogVersion], None]] = []
+
+
+def active_catalog() -> CatalogVersion:
+    """
+    Generation served to new requests.
+    """
+    global _ACTIVE
+    active = _ACTIVE
+    if active is None:
+        with _ACTIVE_LOCK:
+            if _ACTIVE is None:
+                _ACTIVE = CatalogVersion()
+            active = _ACTIVE
+    return active
+
+
+def current_catalog() -> CatalogVersion:
+    """
+    Generation pinned by the enclosing pinned_catalog() block, else the active one.
+    """
+    return _PINNED.get() or active_catalog()
+
+
+@contextlib.contextmanager
+def pinned_catalog(version: Optional[CatalogVersion] = None) -> Iterator[CatalogVersion]:
+    """
+    Resolve every catalog accessor inside the block against one generation, so a swap in the
+    middle of a request cannot mix row positions from two catalogs.
+    """
+    version = version or current_catalog()
+    token = _PINNED.set(version)
+    try:
+        yield version
+    finally:
+        _PINNED.reset(token)
+
+
+def catalog_cached(fn: Callable[[], T]) -> Callable[[], T]:
+    """
+    Drop-in for lru_cache(maxsize=1) on zero-argument catalog accessors: the value is cached
+    per catalog generation. cache_clear() drops it from the current generation only.
+    """
+    key = f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper() -> T:
+        return current_catalog().get(key, fn)
+
+    wrapper.cache_clear = lambda: current_catalog().discard(key)  # type: ignore[attr-defined]
+    wrapper.cache_key = key  # type: ignore[attr-defined]
+    return wrapper
+
+
+def on_catalog_swap(listener: Callable[[CatalogVersion], None]) -> None:
+    """
+    Register a callback run after every swap (e.g. to flush caches keyed by request, not generation).
+    """
+    _SWAP_LISTENERS.append(listener)
+
+
+def swap_catalog(version: CatalogVersion) -> CatalogVersion:
+    """
+    Make version the active generation and return the previous one. Readers already holding
+    the old generation keep using it until they finish.
+    """
+    global _ACTIVE
+    with _ACTIVE_LOCK:
+        previous, _ACTIVE = _ACTIVE, version
+    for listener in list(_SWAP_LISTENERS):
+        try:
+            listener(version)
+        except Exception:
+            logger.exception("Catalog swap listener %r failed", listener)
+    return previous or version
+
+
+def reset_catalog() -> None:
+    """
+    Drop the active generation; the next access starts a fresh one (tests, forced reloads).
+    """
+    swap_catalog(CatalogVersion())
+
+
+class CatalogReloader:
+    """
+    Builds a new catalog generation in a background thread (warming the given accessors under
+    pinned_catalog) and swaps it in only when everything is built, so requests never wait for a rebuild.
+    """
+
+    def __init__(self, warm: Sequence[Callable[[], Any]]) -> None:
+        self._warm = list(warm)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+        self.last_duration_s: Optional[float] = None
+
+    @property
+    def reloading(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def build(self) -> CatalogVersion:
+        """
+        Build and swap in a new generation synchronously.
+        """
+        started = time.perf_counter()
+        version = CatalogVersion()
+        with pinned_catalog(version):
+            for accessor in self._warm:
+                accessor()
+        swap_catalog(version)
+        self.last_duration_s = time.perf_counter() - started
+        logger.info("Catalog version %s active (built in %.2fs)", version.version, self.last_duration_s)
+        return version
+
+    def _run(self) -> None:
+        try:
+            self.build()
+            self.last_error = None
+        except Exception as exc:
+            # The previous generation stays active
+            logger.exception("Catalog reload failed")
+            self.last_error = f"{type(exc).__name__}: {exc}"
+
+    def start(self) -> bool:
+        """
+        Start a background reload; returns False if one is already running.
+        """
+        with self._lock:
+            if self.reloading:
+                return False
+            self._thread = threading.Thread(target=self._run, name="catalog-reload", daemon=True)
+            self._thread.start()
+            return True
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
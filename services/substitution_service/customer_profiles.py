@@ -0,0 +1,401 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .catalog_cache import StringTable, source_key
+from .catalog_version import catalog_cached
+from .data_loaders import (
+    DEFAULT_REPLACEMENTS_CSV,
+    DEFAULT_SALES_DELIVERIES_CSV,
+    _normalize_id,
+    _resolve_path,
+    catalog_cache_dir,
+    load_replacement_orders_csv,
+    load_sales_deliveries_csv,
+    product_gtin_index,
+    product_record,
+)
+from .feature_store import ProductFeatureStore, product_feature_store
+
+logger = logging.getLogger(__name__)
+
+PROFILES_FORMAT_VERSION = 1
+# Score bonus per profile signal (each signal is in [0, 1]); added to the heuristic score
+PROFILE_WEIGHTS: Dict[str, float] = {
+    "accepted": 0.6,
+    "vendors": 0.2,
+    "brands": 0.2,
+}
+# Entries kept per customer and signal (strongest first)
+PROFILE_MAX_ITEMS = int(os.getenv("SUBSTITUTION_PROFILE_MAX_ITEMS", "50"))
+# Resolved profiles of the most recently seen customers kept in memory (0 disables the LRU)
+PROFILE_CACHE_SIZE = int(os.getenv("SUBSTITUTION_PROFILE_CACHE_SIZE", "4096"))
+PROFILE_CHUNK_ROWS = int(os.getenv("SUBSTITUTION_PROFILE_CHUNK_ROWS", "500000"))
+_META_FILE = "meta.json"
+# accepted: replacement product codes the customer took; vendors/brands: names from their regular orders
+FACETS = ("accepted", "vendors", "brands")
+
+
+@dataclass(frozen=True)
+class ProfileFacet:
+    """
+    One signal for all customers as CSR arrays: row i (customers[i]) lists keys[ids[j]] with weights[j].
+    """
+
+    keys: List[str]
+    indptr: np.ndarray
+    ids: np.ndarray
+    weights: np.ndarray
+
+    def row(self, i: int) -> Dict[str, float]:
+        start, end = int(self.indptr[i]), int(self.indptr[i + 1])
+        return {self.keys[int(k)]: float(w) for k, w in zip(self.ids[start:end], self.weights[start:end])}
+
+
+@dataclass(frozen=True)
+class ProfileStore:
+    """
+    Precomputed substitution preferences for every customer seen in the history files, independent of
+    the catalog version: product codes and vendor / brand names, each weighted in [0, 1].
+    """
+
+    customers: List[str]
+    facets: Mapping[str, ProfileFacet]
+    _customer_index: Dict[str, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "_customer_index", {c: i for i, c in enumerate(self.customers)})
+
+    def __len__(self) -> int:
+        return len(self.customers)
+
+    def raw_profile(self, customer: str) -> Optional[Dict[str, Dict[str, float]]]:
+        i = self._customer_index.get(customer)
+        if i is None:
+            return None
+        return {name: facet.row(i) for name, facet in self.facets.items()}
+
+
+def _lookup(keys: np.ndarray, weights: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    weights[keys == v] for each v in values (0 where v is not a key); keys must be sorted.
+    """
+    out = np.zeros(len(values), dtype=np.float64)
+    if not len(keys):
+        return out
+    idx = np.minimum(np.searchsorted(keys, values), len(keys) - 1)
+    hit = keys[idx] == values
+    out[hit] = weights[idx[hit]]
+    return out
+
+
+def _sorted_arrays(pairs: Mapping[int, float]) -> Tuple[np.ndarray, np.ndarray]:
+    keys = np.asarray(sorted(pairs), dtype=np.int64)
+    return keys, np.asarray([pairs[k] for k in keys.tolist()], dtype=np.float64)
+
+
+@dataclass(frozen=True)
+class CustomerProfile:
+    """
+    A customer's profile resolved against one catalog version: catalog positions of accepted replacements
+    and vendor / brand codes of the feature store, with PROFILE_WEIGHTS already applied.
+    """
+
+    customer: str
+    positions: np.ndarray
+    position_boosts: np.ndarray
+    vendor_codes: np.ndarray
+    vendor_boosts: np.ndarray
+    brand_codes: np.ndarray
+    brand_boosts: np.ndarray
+
+    def boosts(self, store: ProductFeatureStore, positions: np.ndarray) -> np.ndarray:
+        positions = np.asarray(positions, dtype=np.int64)
+        return (
+            _lookup(self.positions, self.position_boosts, positions)
+            + _lookup(self.vendor_codes, self.vendor_boosts, store.vendor_codes[positions])
+            + _lookup(self.brand_codes, self.brand_boosts, store.brand_codes[positions])
+        )
+
+    def boost(self, store: ProductFeatureStore, pos: int) -> float:
+        return float(self.boosts(store, np.asarray([pos]))[0])
+
+
+def _label_codes(store: ProductFeatureStore, codes: np.ndarray, column: str) -> Dict[str, int]:
+    """
+    Catalog name -> feature-store code for a dictionary-encoded column, reading one record per code.
+    """
+    values, first = np.unique(codes, return_index=True)
+    out: Dict[str, int] = {}
+    for code, pos in zip(values.tolist(), first.tolist()):
+        if code < 0:
+            continue
+        name = product_record(int(pos)).get(column)
+        if isinstance(name, str):
+            out[name] = int(code)
+    return out
+
+
+class CustomerProfiles:
+    """
+    Profile lookups for one catalog version. Resolved profiles of hot customers stay in an LRU so repeat
+    requests only pay for the score lookups; nothing touches the history files at request time.
+    """
+
+    def __init__(self, store: ProfileStore, max_entries: int = PROFILE_CACHE_SIZE) -> None:
+        self.store = store
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Optional[CustomerProfile]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._labels: Optional[Tuple[Dict[str, int], Dict[str, int]]] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _label_maps(self) -> Tuple[Dict[str, int], Dict[str, int]]:
+        if self._labels is None:
+            features = product_feature_store()
+            self._labels = (
+                _label_codes(features, features.vendor_codes, "vendorName"),
+                _label_codes(features, features.brand_codes, "brand"),
+            )
+        return self._labels
+
+    def _resolve(self, customer: str) -> Optional[CustomerProfile]:
+        raw = self.store.raw_profile(customer)
+        if raw is None:
+            return None
+        index = product_gtin_index()
+        vendors, brands = self._label_maps()
+        resolved: List[Tuple[np.ndarray, np.ndarray]] = []
+        for name, lookup in (("accepted", index), ("vendors", vendors), ("brands", brands)):
+            weight = PROFILE_WEIGHTS[name]
+            pairs: Dict[int, float] = {}
+            for key, value in raw.get(name, {}).items():
+                code = lookup.get(key)
+                if code is not None:
+                    pairs[int(code)] = max(pairs.get(int(code), 0.0), weight * value)
+            resolved.append(_sorted_arrays(pairs))
+        (positions, position_boosts), (vendor_codes, vendor_boosts), (brand_codes, brand_boosts) = resolved
+        return CustomerProfile(
+            customer, positions, position_boosts, vendor_codes, vendor_boosts, brand_codes, brand_boosts
+        )
+
+    def profile(self, customer: str) -> Optional[CustomerProfile]:
+        with self._lock:
+            if customer in self._entries:
+                self._entries.move_to_end(customer)
+                self.hits += 1
+                return self._entries[customer]
+            self.misses += 1
+        resolved = self._resolve(customer)
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[customer] = resolved
+                self._entries.move_to_end(customer)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return resolved
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "customers": len(self.store),
+                "resident": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _normalized_rows(counts: pd.DataFrame, log_scale: bool) -> pd.DataFrame:
+    """
+    Per customer: the PROFILE_MAX_ITEMS largest counts, scaled so the customer's top entry is 1.
+    """
+    counts = counts.sort_values(["customer", "count", "label"], ascending=[True, False, True], ignore_index=True)
+    counts = counts.groupby("customer", sort=False).head(PROFILE_MAX_ITEMS).reset_index(drop=True)
+    values = counts["count"].to_numpy(dtype=np.float64)
+    if log_scale:
+        values = np.log1p(values)
+    top = pd.Series(values).groupby(counts["customer"].to_numpy()).transform("max").to_numpy()
+    return counts.assign(weight=np.divide(values, top, out=np.zeros_like(values), where=top > 0))
+
+
+def _customer_code_counts(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    parts: List[pd.DataFrame] = []
+    for chunk in chunks:
+        frame = pd.DataFrame(
+            {
+                "customer": chunk["customer_number"].astype("string").str.strip(),
+                "code": chunk["product_code"].astype("string").str.strip(),
+            }
+        ).dropna()
+        parts.append(frame.groupby(["customer", "code"]).size().rename("count").reset_index())
+    if not parts:
+        return pd.DataFrame({"customer": [], "code": [], "count": []})
+    merged = pd.concat(parts, ignore_index=True)
+    return merged.groupby(["customer", "code"], as_index=False)["count"].sum()
+
+
+def _label_counts(code_counts: pd.DataFrame, column: str) -> pd.DataFrame:
+    """
+    (customer, code, count) -> (customer, <column>, count) through the catalog record of each code.
+    """
+    index = product_gtin_index()
+    labels: Dict[str, Optional[str]] = {}
+    for code in code_counts["code"].unique().tolist():
+        key = _normalize_id(code)
+        pos = index.get(key) if key is not None else None
+        value = product_record(pos).get(column) if pos is not None else None
+        labels[code] = value if isinstance(value, str) and value else None
+    out = code_counts.assign(label=code_counts["code"].map(labels)).dropna(subset=["label"])
+    return out.groupby(["customer", "label"], as_index=False)["count"].sum()
+
+
+def build_profile_store(accepted_counts: pd.DataFrame, order_counts: pd.DataFrame) -> ProfileStore:
+    """
+    accepted_counts and order_counts are (customer, code, count) aggregates of the replacement and sales
+    files. Accepted replacements are log-scaled; vendor and brand preferences are order-row shares
+    relative to the customer's most ordered vendor / brand.
+    """
+    rows = {
+        "accepted": _normalized_rows(accepted_counts.rename(columns={"code": "label"}), log_scale=True),
+        "vendors": _normalized_rows(_label_counts(order_counts, "vendorName"), log_scale=False),
+        "brands": _normalized_rows(_label_counts(order_counts, "brand"), log_scale=False),
+    }
+    customers = sorted(set().union(*(set(r["customer"]) for r in rows.values())))
+    customer_index = {c: i for i, c in enumerate(customers)}
+    facets: Dict[str, ProfileFacet] = {}
+    for name, frame in rows.items():
+        keys = sorted(set(frame["label"]))
+        key_index = {k: i for i, k in enumerate(keys)}
+        rows_idx = frame["customer"].map(customer_index).to_numpy(dtype=np.int64)
+        order = np.argsort(rows_idx, kind="stable")
+        indptr = np.zeros(len(customers) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows_idx, minlength=len(customers)), out=indptr[1:])
+        facets[name] = ProfileFacet(
+            keys=keys,
+            indptr=indptr,
+            ids=frame["label"].map(key_index).to_numpy(dtype=np.int32)[order],
+            weights=frame["weight"].to_numpy(dtype=np.float32)[order],
+        )
+    return ProfileStore(customers=customers, facets=facets)
+
+
+def compute_profile_store(chunksize: int = PROFILE_CHUNK_ROWS) -> ProfileStore:
+    """
+    Aggregate both history files chunk by chunk (customer and product code columns only).
+    """
+    usecols = ["customer_number", "product_code"]
+    accepted = _customer_code_counts(load_replacement_orders_csv(usecols=usecols, chunksize=chunksize))
+    orders = _customer_code_counts(load_sales_deliveries_csv(usecols=usecols, chunksize=chunksize))
+    return build_profile_store(accepted, orders)
+
+
+def profiles_dir(cache_dir: Optional[Path] = None) -> Path:
+    return Path(cache_dir or catalog_cache_dir()) / "customer_profiles"
+
+
+def write_profile_store(profiles: ProfileStore, meta: Dict[str, Any], cache_dir: Optional[Path] = None) -> Path:
+    target = profiles_dir(cache_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".staging-profiles-", dir=target.parent))
+    try:
+        StringTable.write(staging / "customers", profiles.customers)
+        for name, facet in profiles.facets.items():
+            StringTable.write(staging / f"{name}_keys", facet.keys)
+            for array in ("indptr", "ids", "weights"):
+                np.save(staging / f"{name}_{array}.npy", getattr(facet, array))
+        full_meta = dict(meta, format=PROFILES_FORMAT_VERSION, customers=len(profiles))
+        (staging / _META_FILE).write_text(json.dumps(full_meta, indent=2), encoding="utf-8")
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def load_profile_store(cache_dir: Optional[Path] = None) -> Optional[ProfileStore]:
+    """
+    Memory-map built profiles, or None if there are none (the builder is an offline job).
+    """
+    root = profiles_dir(cache_dir)
+    try:
+        meta = json.loads((root / _META_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != PROFILES_FORMAT_VERSION:
+        logger.warning("Ignoring customer profiles with unknown format at %s", root)
+        return None
+    facets = {
+        name: ProfileFacet(
+            keys=StringTable.open(root / f"{name}_keys").to_list(),
+            indptr=np.load(root / f"{name}_indptr.npy", mmap_mode="r"),
+            ids=np.load(root / f"{name}_ids.npy", mmap_mode="r"),
+            weights=np.load(root / f"{name}_weights.npy", mmap_mode="r"),
+        )
+        for name in FACETS
+    }
+    return ProfileStore(customers=StringTable.open(root / "customers").to_list(), facets=facets)
+
+
+@catalog_cached
+def customer_profiles() -> Optional[CustomerProfiles]:
+    profiles = load_profile_store()
+    return CustomerProfiles(profiles) if profiles is not None else None
+
+
+def customer_profile(customer: Optional[str]) -> Optional[CustomerProfile]:
+    """
+    Resolved profile for a customer number, or None (no customer, no built profiles, unknown customer).
+    """
+    key = _normalize_id(customer) if customer is not None else None
+    profiles = customer_profiles() if key is not None else None
+    return profiles.profile(key) if profiles is not None else None
+
+
+def customer_profile_stats() -> Optional[Dict[str, Any]]:
+    profiles = customer_profiles()
+    return profiles.stats() if profiles is not None else None
+
+
+def main() -> None:
+    # Ensure repo root is on sys.path so `services.*` imports work
+    repo_root = Path(__file__).resolve().parents[2]
+    if str(repo_root) not in sys.path:
+        sys.path.insert(0, str(repo_root))
+    parser = argparse.ArgumentParser(description="Precompute per-customer substitution preference profiles.")
+    parser.add_argument("--chunksize", type=int, default=PROFILE_CHUNK_ROWS, help="CSV rows per chunk")
+    parser.add_argument("--cache-dir", type=str, default=None, help="Output directory (default: VALIO_CACHE_DIR)")
+    args = parser.parse_args()
+
+    profiles = compute_profile_store(args.chunksize)
+    meta = {
+        "sales_key": source_key(_resolve_path(None, DEFAULT_SALES_DELIVERIES_CSV)),
+        "replacements_key": source_key(_resolve_path(None, DEFAULT_REPLACEMENTS_CSV)),
+        "max_items": PROFILE_MAX_ITEMS,
+    }
+    out = write_profile_store(profiles, meta, Path(args.cache_dir) if args.cache_dir else None)
+    print(f"[profiles] {len(profiles)} customers -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,27 @@
+import json
+import logging
+import math
 import os
 from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Optional, Sequence
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Union
 
 import pandas as pd
 from dotenv import load_dotenv
 
+from .catalog_cache import load_catalog_snapshot, source_key, write_catalog_snapshot
+from .catalog_version import catalog_cached, current_catalog
+from .history_store import (
+    PURCHASES_SCHEMA,
+    REPLACEMENTS_SCHEMA,
+    SALES_SCHEMA,
+    fresh_history_parquet,
+    read_history_csv,
+    read_history_parquet,
+)
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_PRODUCT_JSON = "valio_aimo_product_data_junction_2025.json"
 DEFAULT_REPLACEMENTS_CSV = "valio_aimo_replacement_orders_junction_2025.csv"
@@ -13,6 +29,30 @@ DEFAULT_SALES_DELIVERIES_CSV = "valio_aimo_sales_and_deliveries_junction_2025.cs
 DEFAULT_PURCHASES_CSV = "valio_aimo_purchases_junction_2025.csv"
 
 
+def _normalize_id(val: Any) -> Optional[str]:
+    if val is None:
+        return None
+    if isinstance(val, (int,)):
+        return str(val)
+    if isinstance(val, float):
+        # NaN guard
+        if math.isnan(val):
+            return None
+        # Convert 6408430001071.0 -> "6408430001071"
+        i = int(round(val))
+        if abs(val - i) < 1e-9:
+            return str(i)
+        return str(val)
+    s = str(val)
+    # Handle textual NaN/None/empty
+    sl = s.strip().lower()
+    if sl in ("nan", "none", ""):
+        return None
+    if s.endswith(".0"):
+        return s[:-2]
+    return s
+
+
 def get_data_dir() -> Path:
     """
     Resolve the data directory from environment variable VALIO_DATA_DIR or default to repo_root/Data.
@@ -25,6 +65,30 @@ def get_data_dir() -> Path:
     return Path(__file__).resolve().parents[2] / "Data"
 
 
+def catalog_cache_dir() -> Path:
+    """
+    Directory for derived catalog snapshots: VALIO_CACHE_DIR or <data dir>/.cache.
+    """
+    configured = os.getenv("VALIO_CACHE_DIR")
+    if configured:
+        return Path(configured).expanduser().resolve()
+    return get_data_dir() / ".cache"
+
+
+def _snapshots_enabled() -> bool:
+    return os.getenv("VALIO_CATALOG_SNAPSHOT", "1") != "0"
+
+
+def _history_parquet_enabled() -> bool:
+    # Serve history loads from the Parquet copies written by history_store when they are fresh
+    return os.getenv("VALIO_HISTORY_PARQUET", "1") != "0"
+
+
+def _shared_catalog_enabled() -> bool:
+    # Multi-worker mode: attach to memory-mapped catalog files (see shared_catalog) instead of loading a DataFrame
+    return os.getenv("VALIO_SHARED_CATALOG", "0") != "0"
+
+
 def _resolve_path(path_or_dir: Optional[Path], default_filename: str) -> Path:
     """
     If a file path is provided, return it. If a directory or None is provided, append default_filename.
@@ -37,62 +101,195 @@ def _resolve_path(path_or_dir: Optional[Path], default_filename: str) -> Path:
     return path.resolve()
 
 
+_STREAM_CHUNK_CHARS = 1 << 20
+_JSON_DECODER = json.JSONDecoder()
+
+
+def iter_json_objects(file_path: Path, chunk_chars: int = _STREAM_CHUNK_CHARS) -> Iterator[Dict[str, Any]]:
+    """
+    Stream objects one at a time from a JSON array or JSON Lines file.
+    Only the current object (plus one read chunk) is held in memory.
+    """
+    with Path(file_path).open("r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+        while True:
+            # Skip array brackets, separators and whitespace between objects
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] in "[],"):
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    return
+                buf = f.read(chunk_chars)
+                pos = 0
+                eof = not buf
+                continue
+            try:
+                obj, end = _JSON_DECODER.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Object spans the chunk boundary: keep the tail and read more
+                more = f.read(chunk_chars)
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            pos = end
+            if isinstance(obj, dict):
+                yield obj
+
+
+def _project(record: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """
+    Keep only the given (possibly dotted) field paths, preserving nesting: "synkkaData.names" ->
+    {"synkkaData": {"names": ...}}. Missing paths are left out.
+    """
+    out: Dict[str, Any] = {}
+    for field in fields:
+        parts = field.split(".")
+        cur: Any = record
+        for p in parts:
+            if not isinstance(cur, dict) or p not in cur:
+                break
+            cur = cur[p]
+        else:
+            dst = out
+            for p in parts[:-1]:
+                nxt = dst.get(p)
+                if not isinstance(nxt, dict):
+                    nxt = dst[p] = {}
+                dst = nxt
+            dst[parts[-1]] = cur
+    return out
+
+
+def iter_product_batches(
+    path_or_dir: Optional[Path] = None,
+    fields: Optional[Sequence[str]] = None,
+    batch_size: int = 1000,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Stream the product catalog in batches of (optionally projected) records.
+    fields accepts top-level names and dotted nested paths, e.g. ["category", "synkkaData.names", "units"].
+    """
+    file_path = _resolve_path(path_or_dir, DEFAULT_PRODUCT_JSON)
+    batch: List[Dict[str, Any]] = []
+    for record in iter_json_objects(file_path):
+        batch.append(_project(record, fields) if fields else record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def load_product_data_json(
     path_or_dir: Optional[Path] = None,
     usecols: Optional[Sequence[str]] = None,
 ) -> pd.DataFrame:
     """
-    Load product data JSON. Tries JSON Lines first, then array JSON.
+    Load product data JSON. Serves a fresh columnar snapshot when one exists (see catalog_cache);
+    otherwise parses the JSON and writes the snapshot for the next process.
+    With usecols (top-level names or dotted nested paths) and no snapshot, the file is streamed and
+    projected record by record, so peak memory stays close to the projected size.
+    A snapshot hit returns whole top-level columns for nested paths. When none of the requested
+    columns exist the full frame is returned, as without usecols.
     """
     file_path = _resolve_path(path_or_dir, DEFAULT_PRODUCT_JSON)
-    df = pd.read_json(file_path)
+    top_level = list(dict.fromkeys(c.split(".", 1)[0] for c in usecols)) if usecols else None
+    if _snapshots_enabled():
+        cached = load_catalog_snapshot(file_path, catalog_cache_dir(), usecols=top_level)
+        if cached is not None and top_level and not len(cached.columns):
+            # None of the requested columns exist: serve the full frame, as the JSON path does
+            cached = load_catalog_snapshot(file_path, catalog_cache_dir())
+        if cached is not None:
+            return cached
     if usecols:
-        existing = [c for c in usecols if c in df.columns]
-        if existing:
-            df = df[existing]
+        records: List[Dict[str, Any]] = []
+        for batch in iter_product_batches(file_path, fields=usecols):
+            records.extend(batch)
+        keys = {key for r in records for key in r}
+        present = [c for c in top_level if c in keys]
+        if present:
+            return pd.DataFrame.from_records(records, columns=present)
+    df = pd.read_json(file_path)
+    if _snapshots_enabled():
+        try:
+            write_catalog_snapshot(df, file_path, catalog_cache_dir())
+        except OSError as exc:
+            # Read-only data dirs just keep the JSON path
+            logger.warning("Could not write catalog snapshot for %s: %s", file_path, exc)
     return df
 
 
+HistoryFrames = Union[pd.DataFrame, Iterator[pd.DataFrame]]
+
+
+def _load_history(
+    file_path: Path,
+    schema: Mapping[str, str],
+    usecols: Optional[Sequence[str]],
+    dtype: Optional[Dict[str, Any]],
+    chunksize: Optional[int],
+) -> HistoryFrames:
+    if _history_parquet_enabled():
+        parquet = fresh_history_parquet(file_path, catalog_cache_dir())
+        if parquet is not None:
+            return read_history_parquet(parquet, schema, usecols=usecols, dtype=dtype, chunksize=chunksize)
+    return read_history_csv(file_path, schema, usecols=usecols, dtype=dtype, chunksize=chunksize)
+
+
 def load_replacement_orders_csv(
     path_or_dir: Optional[Path] = None,
     usecols: Optional[Sequence[str]] = None,
     dtype: Optional[Dict[str, Any]] = None,
-) -> pd.DataFrame:
+    chunksize: Optional[int] = None,
+) -> HistoryFrames:
     """
     Load replacement orders CSV (historical original->replacement pairs).
+    Columns get the compact history_store types; with chunksize an iterator of DataFrames is returned.
     """
     file_path = _resolve_path(path_or_dir, DEFAULT_REPLACEMENTS_CSV)
-    return pd.read_csv(file_path, usecols=usecols, dtype=dtype)
+    return _load_history(file_path, REPLACEMENTS_SCHEMA, usecols, dtype, chunksize)
 
 
 def load_sales_deliveries_csv(
     path_or_dir: Optional[Path] = None,
     usecols: Optional[Sequence[str]] = None,
     dtype: Optional[Dict[str, Any]] = None,
-) -> pd.DataFrame:
+    chunksize: Optional[int] = None,
+) -> HistoryFrames:
     """
     Load sales & deliveries CSV (ordered vs delivered, product-level stats).
+    Columns get the compact history_store types; with chunksize an iterator of DataFrames is returned.
     """
     file_path = _resolve_path(path_or_dir, DEFAULT_SALES_DELIVERIES_CSV)
-    return pd.read_csv(file_path, usecols=usecols, dtype=dtype)
+    return _load_history(file_path, SALES_SCHEMA, usecols, dtype, chunksize)
 
 
 def load_purchases_csv(
     path_or_dir: Optional[Path] = None,
     usecols: Optional[Sequence[str]] = None,
     dtype: Optional[Dict[str, Any]] = None,
-) -> pd.DataFrame:
+    chunksize: Optional[int] = None,
+) -> HistoryFrames:
     """
     Load purchases CSV (supplier patterns, lead times, partial deliveries).
+    Columns get the compact history_store types; with chunksize an iterator of DataFrames is returned.
     """
     file_path = _resolve_path(path_or_dir, DEFAULT_PURCHASES_CSV)
-    return pd.read_csv(file_path, usecols=usecols, dtype=dtype)
+    return _load_history(file_path, PURCHASES_SCHEMA, usecols, dtype, chunksize)
 
 
-# Cached convenience wrappers (use defaults)
-@lru_cache(maxsize=1)
+# Cached convenience wrappers (use defaults); catalog accessors are cached per catalog version
+@catalog_cached
 def product_data_df() -> pd.DataFrame:
-    return load_product_data_json()
+    source = _resolve_path(None, DEFAULT_PRODUCT_JSON)
+    if source.exists():
+        current_catalog().source_key = source_key(source)
+    return load_product_data_json(source)
 
 
 @lru_cache(maxsize=1)
@@ -110,3 +307,57 @@ def purchases_df() -> pd.DataFrame:
     return load_purchases_csv()
 
 
+def build_gtin_index(df: pd.DataFrame) -> Mapping[str, int]:
+    """
+    Map normalized GTIN -> row position in df.
+    salesUnitGtin takes precedence over synkkaData.gtin; the first row wins on duplicates.
+    """
+    index: Dict[str, int] = {}
+    if "salesUnitGtin" in df.columns:
+        for pos, raw in enumerate(df["salesUnitGtin"].tolist()):
+            gtin = _normalize_id(raw)
+            if gtin is not None:
+                index.setdefault(gtin, pos)
+    if "synkkaData" in df.columns:
+        for pos, sd in enumerate(df["synkkaData"].tolist()):
+            if isinstance(sd, dict):
+                gtin = _normalize_id(sd.get("gtin"))
+                if gtin is not None:
+                    index.setdefault(gtin, pos)
+    return MappingProxyType(index)
+
+
+@catalog_cached
+def product_gtin_index() -> Mapping[str, int]:
+    """
+    Read-only GTIN -> row position index over product_data_df(), built once per catalog version.
+    """
+    if _shared_catalog_enabled():
+        from .shared_catalog import load_shared_gtin_index
+
+        return load_shared_gtin_index()
+    return build_gtin_index(product_data_df())
+
+
+def product_record(pos: int) -> Dict[str, Any]:
+    """
+    Return the catalog row at position pos as a plain dict.
+    """
+    if _shared_catalog_enabled():
+        from .shared_catalog import shared_rows
+
+        return shared_rows().record(pos)
+    return product_data_df().iloc[pos].to_dict()
+
+
+def find_product_by_gtin(gtin: Any) -> Optional[Dict[str, Any]]:
+    """
+    O(1) catalog lookup by salesUnitGtin or synkkaData.gtin.
+    """
+    key = _normalize_id(gtin)
+    if key is None:
+        return None
+    pos = product_gtin_index().get(key)
+    if pos is None:
+        return None
+    return product_record(pos)
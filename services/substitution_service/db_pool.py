@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import psycopg
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+
+def _env(key: str, default: Optional[str] = None) -> Optional[str]:
+    v = os.getenv(key)
+    return v if v is not None else default
+
+
+def get_db_conninfo() -> str:
+    host = _env("WAREHOUSE_DB_HOST", "localhost")
+    port = _env("WAREHOUSE_DB_PORT", "6000")
+    db = _env("WAREHOUSE_DB_NAME", "warehouse")
+    user = _env("WAREHOUSE_DB_USER", "warehouse_user")
+    pwd = _env("WAREHOUSE_DB_PASSWORD", "warehouse_pass")
+    return f"host={host} port={port} dbname={db} user={user} password={pwd}"
+
+
+POOL_MIN_SIZE = int(_env("WAREHOUSE_DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(_env("WAREHOUSE_DB_POOL_MAX_SIZE", "10"))
+# Seconds a caller waits for a free connection before PoolTimeout; kept short so an unreachable DB
+# degrades to "availability unknown" quickly instead of stalling requests.
+POOL_TIMEOUT = float(_env("WAREHOUSE_DB_POOL_TIMEOUT", "2"))
+POOL_MAX_IDLE = float(_env("WAREHOUSE_DB_POOL_MAX_IDLE", "300"))
+CONNECT_TIMEOUT = int(_env("WAREHOUSE_DB_CONNECT_TIMEOUT", "3"))
+
+_POOL: Optional[ConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+_ASYNC_POOL: Optional[AsyncConnectionPool] = None
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Process-wide warehouse connection pool, created on first use.
+    Connections are health-checked (SELECT 1 round trip) before being handed out.
+    """
+    global _POOL
+    if _POOL is not None:
+        return _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ConnectionPool(
+                conninfo=get_db_conninfo(),
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                timeout=POOL_TIMEOUT,
+                max_idle=POOL_MAX_IDLE,
+                kwargs={"row_factory": dict_row, "connect_timeout": CONNECT_TIMEOUT},
+                check=ConnectionPool.check_connection,
+                name="warehouse",
+                open=True,
+            )
+    return _POOL
+
+
+@contextmanager
+def warehouse_connection() -> Iterator[psycopg.Connection]:
+    """
+    Borrow a pooled connection (dict rows). The transaction is committed on clean exit.
+    """
+    with get_pool().connection() as conn:
+        yield conn
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """
+    Async counterpart of get_pool for the event loop of the async API handlers, opened on first use.
+    Same sizing/timeout settings; the two pools are independent.
+    """
+    global _ASYNC_POOL
+    if _ASYNC_POOL is None:
+        _ASYNC_POOL = AsyncConnectionPool(
+            conninfo=get_db_conninfo(),
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            timeout=POOL_TIMEOUT,
+            max_idle=POOL_MAX_IDLE,
+            kwargs={"row_factory": dict_row, "connect_timeout": CONNECT_TIMEOUT},
+            check=AsyncConnectionPool.check_connection,
+            name="warehouse-async",
+            open=False,
+        )
+    # No-op once open; safe to call from concurrent first requests
+    await _ASYNC_POOL.open()
+    return _ASYNC_POOL
+
+
+@asynccontextmanager
+async def async_warehouse_connection() -> AsyncIterator[psycopg.AsyncConnection]:
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        yield conn
+
+
+def _stats(pool: Optional[Any]) -> Dict[str, Any]:
+    if pool is None:
+        return {"initialized": False}
+    stats: Dict[str, Any] = {"initialized": True, "min_size": pool.min_size, "max_size": pool.max_size}
+    stats.update(pool.get_stats())
+    return stats
+
+
+def pool_stats() -> Dict[str, Any]:
+    """
+    Pool counters for /health endpoints; does not create the pool.
+    """
+    return _stats(_POOL)
+
+
+def async_pool_stats() -> Dict[str, Any]:
+    return _stats(_ASYNC_POOL)
+
+
+def close_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.close()
+
+
+async def close_async_pool() -> None:
+    global _ASYNC_POOL
+    pool, _ASYNC_POOL = _ASYNC_POOL, None
+    if pool is not None:
+        await pool.close()
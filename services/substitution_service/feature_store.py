@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .catalog_version import catalog_cached
+from .data_loaders import _normalize_id, _shared_catalog_enabled, product_data_df
+from .features import (
+    _collect_names,
+    _extract_preferred_unit_size,
+    allergen_vocabulary_size,
+    extract_allergen_masks,
+)
+from .utils_text import simple_tokenize
+
+if TYPE_CHECKING:
+    from .popularity import PopularityTable
+
+
+def _encode(values: List[Any]) -> Tuple[np.ndarray, List[str]]:
+    """
+    Dictionary-encode string values into int32 codes; anything that is not a str becomes -1.
+    """
+    vocab: Dict[str, int] = {}
+    codes = np.full(len(values), -1, dtype=np.int32)
+    for i, v in enumerate(values):
+        if isinstance(v, str):
+            codes[i] = vocab.setdefault(v, len(vocab))
+    return codes, list(vocab)
+
+
+# Column order of pair_feature_matrix; matches the keys of features.compute_pair_features
+FEATURE_NAMES: List[str] = [
+    "category_match",
+    "vendor_match",
+    "brand_match",
+    "same_sales_unit",
+    "size_similarity",
+    "temperature_abs_diff",
+    "allergen_conflict",
+    "diet_compatible",
+    "name_jaccard",
+    "popularity_overall",
+    "popularity_by_category",
+]
+_COL = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+
+def _incidence_matrix(sets: List[FrozenSet[str]]) -> Tuple[sparse.csr_matrix, Dict[str, int]]:
+    """
+    Binary products x vocabulary CSR matrix for per-product token sets, plus the token -> column map.
+    """
+    vocab: Dict[str, int] = {}
+    indptr = [0]
+    indices: List[int] = []
+    for items in sets:
+        indices.extend(vocab.setdefault(t, len(vocab)) for t in items)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    matrix = sparse.csr_matrix(
+        (data, np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(sets), max(len(vocab), 1)),
+    )
+    return matrix, vocab
+
+
+def _mask_words(masks: List[int], n_bits: int) -> np.ndarray:
+    """
+    Split Python-int bitmasks into an (n, words) uint64 array so pools can be tested with NumPy bitwise ops.
+    """
+    words = max(1, -(-n_bits // 64))
+    out = np.zeros((len(masks), words), dtype=np.uint64)
+    for i, m in enumerate(masks):
+        for w in range(words):
+            out[i, w] = (m >> (64 * w)) & 0xFFFFFFFFFFFFFFFF
+    return out
+
+
+def _as_float(value: Any) -> float:
+    # Missing numbers (None, NaN, non-numeric) are stored as NaN
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return math.nan
+
+
+class TokenSets(Sequence):
+    """
+    Per-product token sets decoded on access from the token incidence matrix,
+    for stores whose matrix is memory-mapped rather than built in-process.
+    """
+
+    def __init__(self, token_matrix: sparse.csr_matrix, vocabulary: List[str]) -> None:
+        self._matrix = token_matrix
+        self._vocabulary = vocabulary
+
+    def __len__(self) -> int:
+        return self._matrix.shape[0]
+
+    def __getitem__(self, i: int) -> FrozenSet[str]:
+        start, end = self._matrix.indptr[i], self._matrix.indptr[i + 1]
+        return frozenset(self._vocabulary[j] for j in self._matrix.indices[start:end])
+
+
+@dataclass(frozen=True)
+class ProductFeatureStore:
+    """
+    Per-product attributes extracted once from the catalog, aligned with product_data_df() row positions.
+    """
+
+    gtins: List[Optional[str]]
+    category_members: Mapping[str, np.ndarray]
+    category_codes: np.ndarray
+    vendor_codes: np.ndarray
+    brand_codes: np.ndarray
+    sales_unit_codes: np.ndarray
+    unit_size: np.ndarray
+    temperature: np.ndarray
+    tokens: Sequence[FrozenSet[str]]
+    # Allergen CONTAINS / FREE_FROM bitmasks over features' global allergen vocabulary, shape (n, words)
+    contains_mask: np.ndarray
+    free_from_mask: np.ndarray
+    # Sparse token incidence matrix for the batch scoring path
+    token_matrix: sparse.csr_matrix
+    token_vocabulary: Mapping[str, int]
+    token_counts: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.gtins)
+
+
+def build_feature_store(df: pd.DataFrame) -> ProductFeatureStore:
+    records: List[Dict[str, Any]] = df.to_dict("records")
+    gtins: List[Optional[str]] = []
+    tokens: List[FrozenSet[str]] = []
+    contains: List[int] = []
+    free_from: List[int] = []
+    unit_size = np.full(len(records), np.nan, dtype=np.float64)
+    temperature = np.full(len(records), np.nan, dtype=np.float64)
+    members: Dict[str, List[int]] = {}
+    for pos, product in enumerate(records):
+        gtins.append(
+            _normalize_id(product.get("salesUnitGtin"))
+            or _normalize_id((product.get("synkkaData") or {}).get("gtin"))
+        )
+        toks: set = set()
+        for n in _collect_names(product):
+            toks |= simple_tokenize(n)
+        tokens.append(frozenset(toks))
+        c, f = extract_allergen_masks(product)
+        contains.append(c)
+        free_from.append(f)
+        size = _extract_preferred_unit_size(product)
+        if size is not None:
+            unit_size[pos] = size
+        temperature[pos] = _as_float(product.get("temperatureCondition"))
+        cat = product.get("category")
+        if cat is not None:
+            # Same key as the request-time filter: str() of the raw category value
+            members.setdefault(str(cat), []).append(pos)
+
+    category_codes, _ = _encode([str(p.get("category")) if p.get("category") is not None else None for p in records])
+    vendor_codes, _ = _encode([p.get("vendorName") for p in records])
+    brand_codes, _ = _encode([p.get("brand") for p in records])
+    sales_unit_codes, _ = _encode([p.get("salesUnit") for p in records])
+    n_bits = allergen_vocabulary_size()
+    token_matrix, token_vocabulary = _incidence_matrix(tokens)
+    return ProductFeatureStore(
+        gtins=gtins,
+        category_members={cat: np.asarray(pos, dtype=np.int32) for cat, pos in members.items()},
+        category_codes=category_codes,
+        vendor_codes=vendor_codes,
+        brand_codes=brand_codes,
+        sales_unit_codes=sales_unit_codes,
+        unit_size=unit_size,
+        temperature=temperature,
+        tokens=tokens,
+        contains_mask=_mask_words(contains, n_bits),
+        free_from_mask=_mask_words(free_from, n_bits),
+        token_matrix=token_matrix,
+        token_vocabulary=token_vocabulary,
+        token_counts=np.asarray([len(t) for t in tokens], dtype=np.float32),
+    )
+
+
+@catalog_cached
+def product_feature_store() -> ProductFeatureStore:
+    """
+    Feature store over product_data_df(), built once per catalog version
+    (or attached to the shared memory-mapped files when VALIO_SHARED_CATALOG is set).
+    """
+    if _shared_catalog_enabled():
+        from .shared_catalog import load_shared_feature_store
+
+        return load_shared_feature_store()
+    return build_feature_store(product_data_df())
+
+
+def _same_code(codes: np.ndarray, a: int, b: int) -> int:
+    return 1 if codes[a] >= 0 and codes[a] == codes[b] else 0
+
+
+def pair_features(
+    store: ProductFeatureStore,
+    orig: int,
+    cand: int,
+    popularity_overall: Optional[float] = None,
+    popularity_by_category: Optional[float] = None,
+) -> Dict[str, float]:
+    """
+    Same feature dict as features.compute_pair_features, computed from precomputed store rows.
+    """
+    o_size = store.unit_size[orig]
+    c_size = store.unit_size[cand]
+    if o_size > 0 and c_size > 0:
+        size_sim = math.exp(-abs(math.log(o_size / c_size)))
+    else:
+        size_sim = 0.0
+    o_temp = store.temperature[orig]
+    c_temp = store.temperature[cand]
+    if math.isnan(o_temp) or math.isnan(c_temp):
+        temp_diff = 999.0
+    else:
+        temp_diff = abs(float(o_temp) - float(c_temp))
+
+    orig_free_from = store.free_from_mask[orig]
+    allergen_conflict = 1 if np.any(store.contains_mask[cand] & orig_free_from) else 0
+    diet_compatible = 1 if not np.any(orig_free_from & ~store.free_from_mask[cand]) else 0
+
+    o_tokens = store.tokens[orig]
+    c_tokens = store.tokens[cand]
+    union = len(o_tokens | c_tokens)
+    name_jaccard = len(o_tokens & c_tokens) / union if union else 0.0
+
+    return {
+        "category_match": float(store.category_codes[orig] == store.category_codes[cand]),
+        "vendor_match": float(_same_code(store.vendor_codes, orig, cand)),
+        "brand_match": float(_same_code(store.brand_codes, orig, cand)),
+        "same_sales_unit": float(store.sales_unit_codes[orig] == store.sales_unit_codes[cand]),
+        "size_similarity": float(size_sim),
+        "temperature_abs_diff": float(temp_diff),
+        "allergen_conflict": float(allergen_conflict),
+        "diet_compatible": float(diet_compatible),
+        "name_jaccard": float(name_jaccard),
+        "popularity_overall": float(popularity_overall) if popularity_overall is not None else 0.0,
+        "popularity_by_category": float(popularity_by_category) if popularity_by_category is not None else 0.0,
+    }
+
+
+def pair_feature_matrix(
+    store: ProductFeatureStore,
+    orig: int,
+    cands: np.ndarray,
+    popularity: Optional["PopularityTable"] = None,
+) -> np.ndarray:
+    """
+    Feature matrix (len(cands) x len(FEATURE_NAMES)) for one original against a candidate pool.
+    Row i equals pair_features(store, orig, cands[i]) in FEATURE_NAMES order, with the candidate's
+    replacement-history priors in the popularity columns (0 without a popularity table).
+    """
+    cands = np.asarray(cands, dtype=np.int64)
+    out = np.zeros((len(cands), len(FEATURE_NAMES)), dtype=np.float64)
+    if len(cands) == 0:
+        return out
+
+    out[:, _COL["category_match"]] = store.category_codes[cands] == store.category_codes[orig]
+    for name, codes in (
+        ("vendor_match", store.vendor_codes),
+        ("brand_match", store.brand_codes),
+    ):
+        if codes[orig] >= 0:
+            out[:, _COL[name]] = codes[cands] == codes[orig]
+    out[:, _COL["same_sales_unit"]] = store.sales_unit_codes[cands] == store.sales_unit_codes[orig]
+
+    o_size = store.unit_size[orig]
+    c_size = store.unit_size[cands]
+    if o_size > 0:
+        valid = c_size > 0
+        out[valid, _COL["size_similarity"]] = np.exp(-np.abs(np.log(o_size / c_size[valid])))
+
+    c_temp = store.temperature[cands]
+    out[:, _COL["temperature_abs_diff"]] = np.where(
+        np.isnan(c_temp) | np.isnan(store.temperature[orig]),
+        999.0,
+        np.abs(store.temperature[orig] - c_temp),
+    )
+
+    orig_free = store.free_from_mask[orig]
+    out[:, _COL["allergen_conflict"]] = np.any(store.contains_mask[cands] & orig_free, axis=1)
+    out[:, _COL["diet_compatible"]] = ~np.any(orig_free & ~store.free_from_mask[cands], axis=1)
+
+    inter = (store.token_matrix[cands] @ store.token_matrix[orig].T).toarray().ravel().astype(np.float64)
+    union = store.token_counts[orig] + store.token_counts[cands] - inter
+    nonzero = union > 0
+    out[nonzero, _COL["name_jaccard"]] = inter[nonzero] / union[nonzero]
+
+    if popularity is not None:
+        out[:, _COL["popularity_overall"]] = popularity.overall[cands]
+        out[:, _COL["popularity_by_category"]] = popularity.by_category[cands]
+    return out
@@ -76,6 +76,46 @@ def _extract_allergen_sets(product: Dict[str, Any]) -> Tuple[set, set]:
     return contains, free_from
 
 
+# Global allergen-id vocabulary: id -> bit position. Append-only, so masks stay valid as it grows.
+_ALLERGEN_BITS: Dict[str, int] = {}
+
+
+def allergen_bit(allergen_id: str) -> int:
+    bit = _ALLERGEN_BITS.get(allergen_id)
+    if bit is None:
+        bit = _ALLERGEN_BITS.setdefault(allergen_id, len(_ALLERGEN_BITS))
+    return bit
+
+
+def allergen_vocabulary_size() -> int:
+    return len(_ALLERGEN_BITS)
+
+
+def encode_allergen_mask(allergen_ids: Iterable[str]) -> int:
+    mask = 0
+    for a in allergen_ids:
+        mask |= 1 << allergen_bit(a)
+    return mask
+
+
+def extract_allergen_masks(product: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Bitmask form of _extract_allergen_sets: (contains_mask, free_from_mask) over the global vocabulary.
+    """
+    contains, free_from = _extract_allergen_sets(product)
+    return encode_allergen_mask(contains), encode_allergen_mask(free_from)
+
+
+def allergen_conflict_from_masks(orig_free_from: int, cand_contains: int) -> int:
+    # Conflict if candidate CONTAINS something original explicitly FREE_FROM
+    return _bool(cand_contains & orig_free_from)
+
+
+def diet_compatible_from_masks(orig_free_from: int, cand_free_from: int) -> int:
+    # If original claims FREE_FROM_X, candidate should also be FREE_FROM_X (subset condition)
+    return _bool((orig_free_from & ~cand_free_from) == 0)
+
+
 def _extract_preferred_unit_size(product: Dict[str, Any]) -> Optional[float]:
     """
     Heuristic for a comparable size value:
@@ -148,13 +188,11 @@ def compute_pair_features(
     # Temperature proximity
     temp_diff = _temperature_diff(original, candidate)
 
-    # Allergen/diet compatibility
-    cand_contains, cand_free_from = _extract_allergen_sets(candidate)
-    orig_contains, orig_free_from = _extract_allergen_sets(original)
-    # Conflict if candidate CONTAINS something original explicitly FREE_FROM
-    allergen_conflict = _bool(len(cand_contains & orig_free_from) > 0)
-    # Diet compatibility: if original claims FREE_FROM_X, candidate should also be FREE_FROM_X (subset condition)
-    diet_compatible = _bool(orig_free_from.issubset(cand_free_from) if orig_free_from else True)
+    # Allergen/diet compatibility as bitwise ops on encoded masks
+    cand_contains, cand_free_from = extract_allergen_masks(candidate)
+    _orig_contains, orig_free_from = extract_allergen_masks(original)
+    allergen_conflict = allergen_conflict_from_masks(orig_free_from, cand_contains)
+    diet_compatible = diet_compatible_from_masks(orig_free_from, cand_free_from)
 
     # Name similarity (multilingual names concatenated)
     name_tokens_o = set()
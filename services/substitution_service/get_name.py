@@ -10,25 +10,16 @@ REPO_ROOT = Path(__file__).resolve().parents[2]
 if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
-from services.substitution_service.data_loaders import product_data_df  # noqa: E402
+from services.substitution_service.data_loaders import find_product_by_gtin  # noqa: E402
 from services.substitution_service.main import _extract_display_name  # noqa: E402
-from services.substitution_service.candidates import _normalize_id  # noqa: E402
-from services.substitution_service.availability import (  # noqa: E402
-    get_db_conninfo,
-)
-import psycopg
-from psycopg.rows import dict_row
+from services.substitution_service.db_pool import warehouse_connection  # noqa: E402
 
 
 def get_name_by_sku(gtin: str) -> Optional[str]:
-    df = product_data_df()
-    # Normalize GTINs so we can match even if stored as floats like 6408430001071.0
-    df = df.assign(_gtin=df["salesUnitGtin"].apply(_normalize_id))
-    target = _normalize_id(gtin) or str(gtin)
-    row = df[df["_gtin"] == target].head(1)
-    if row.empty:
+    # Index lookup normalizes GTINs, so floats like 6408430001071.0 still match
+    prod = find_product_by_gtin(gtin)
+    if prod is None:
         return None
-    prod = row.iloc[0].to_dict()
     return _extract_display_name(prod)
 
 
@@ -36,8 +27,7 @@ def get_name_by_line_id(line_id: int) -> Optional[str]:
     """
     Lookup warehouse_items by line_id and return its `name` column.
     """
-    conninfo = get_db_conninfo()
-    with psycopg.connect(conninfo, row_factory=dict_row) as conn:
+    with warehouse_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "SELECT name FROM warehouse_items WHERE line_id = %s",
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, Mapping, Optional, Sequence, Union
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .catalog_cache import source_key
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - Parquet conversion is optional
+    pa = None
+    pq = None
+
+HISTORY_FORMAT_VERSION = 1
+# Rows parsed per CSV chunk; whole-file loads are built chunk by chunk so only one raw chunk is alive
+HISTORY_CHUNK_ROWS = int(os.getenv("VALIO_HISTORY_CHUNK_ROWS", "500000"))
+
+# Compact column types for the history files. "category" columns keep their values as strings,
+# "date" columns are parsed to datetime64 and integer columns are nullable where the data has gaps.
+ORDER_ROW_SCHEMA: Mapping[str, str] = {
+    "order_number": "Int64",
+    "order_created_date": "date",
+    "order_created_time": "Int32",
+    "requested_delivery_date": "date",
+    "customer_number": "category",
+    "order_row_number": "Int32",
+    "product_code": "category",
+    "order_qty": "float32",
+    "sales_unit": "category",
+    "delivery_number": "Int32",
+    "plant": "Int32",
+    "storage_location": "Int32",
+    "delivered_qty": "float32",
+    "transfer_number": "Int32",
+    "warehouse_number": "Int32",
+    "picking_confirmed_date": "date",
+    "picking_confirmed_time": "Int32",
+    "picking_picked_qty": "float32",
+}
+# Sales & deliveries and replacement orders share the order-row layout
+SALES_SCHEMA = ORDER_ROW_SCHEMA
+REPLACEMENTS_SCHEMA = ORDER_ROW_SCHEMA
+PURCHASES_SCHEMA: Mapping[str, str] = {
+    "order_number": "Int64",
+    "po_row_number": "Int32",
+    "customer_number": "category",
+    "po_created_date": "date",
+    "requested_delivery_date": "date",
+    "product_code": "category",
+    "plant": "Int32",
+    "storage_location": "Int32",
+    "ordered_qty": "float32",
+    "unit": "category",
+    "received_qty": "float32",
+}
+
+Frames = Union[pd.DataFrame, Iterator[pd.DataFrame]]
+
+
+def _csv_dtypes(schema: Mapping[str, str], overrides: Mapping[str, Any]) -> Dict[str, Any]:
+    dtypes: Dict[str, Any] = {}
+    for col, kind in schema.items():
+        if kind == "category":
+            dtypes[col] = "category"
+        elif kind == "date":
+            dtypes[col] = str
+        elif kind == "float32":
+            dtypes[col] = "float32"
+        else:
+            # Integers are parsed as floats first: the files mix "123", "123.0" and empty cells
+            dtypes[col] = "float64"
+    dtypes.update(overrides)
+    return dtypes
+
+
+def _coerce(df: pd.DataFrame, schema: Mapping[str, str], overrides: Mapping[str, Any]) -> pd.DataFrame:
+    for col in df.columns:
+        kind = schema.get(col)
+        if kind is None or col in overrides:
+            continue
+        if kind == "date":
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], format="ISO8601", errors="coerce")
+        elif df[col].dtype != kind:
+            df[col] = df[col].astype(kind)
+    return df
+
+
+def concat_frames(frames: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate chunks without losing categoricals: per-chunk categories are unioned instead of
+    falling back to object columns.
+    """
+    if not frames:
+        return pd.DataFrame()
+    first = frames[0]
+    cats = [c for c in first.columns if isinstance(first[c].dtype, pd.CategoricalDtype)]
+    out = pd.concat([f.drop(columns=cats) for f in frames], ignore_index=True)
+    for col in cats:
+        out[col] = union_categoricals([f[col] for f in frames])
+    return out[list(first.columns)]
+
+
+def read_history_csv(
+    file_path: Path,
+    schema: Mapping[str, str],
+    usecols: Optional[Sequence[str]] = None,
+    dtype: Optional[Mapping[str, Any]] = None,
+    chunksize: Optional[int] = None,
+) -> Frames:
+    """
+    Read a history CSV with the compact schema types; dtype entries override the schema per column.
+    With chunksize, returns an iterator of DataFrames (each chunk has its own categories).
+    """
+    overrides = dict(dtype or {})
+    reader = pd.read_csv(
+        file_path,
+        usecols=list(usecols) if usecols else None,
+        dtype=_csv_dtypes(schema, overrides),
+        chunksize=chunksize or HISTORY_CHUNK_ROWS,
+    )
+    chunks = (_coerce(chunk, schema, overrides) for chunk in reader)
+    if chunksize:
+        return chunks
+    return concat_frames(list(chunks))
+
+
+def parquet_enabled() -> bool:
+    return pa is not None
+
+
+def history_parquet_path(source: Path, cache_dir: Path) -> Path:
+    return Path(cache_dir) / f"{Path(source).stem}.parquet"
+
+
+def _meta_path(parquet: Path) -> Path:
+    return parquet.with_name(parquet.name + ".json")
+
+
+def fresh_history_parquet(source: Path, cache_dir: Path) -> Optional[Path]:
+    """
+    The Parquet copy of source if one exists, matches the current CSV and pyarrow is installed, else None.
+    """
+    if not parquet_enabled():
+        return None
+    parquet = history_parquet_path(source, cache_dir)
+    try:
+        meta = json.loads(_meta_path(parquet).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != HISTORY_FORMAT_VERSION or meta.get("key") != source_key(source):
+        return None
+    return parquet if parquet.exists() else None
+
+
+def _arrow_type(kind: Optional[str], series: pd.Series) -> "pa.DataType":
+    if kind == "category":
+        return pa.string()
+    if kind == "date":
+        return pa.timestamp("ns")
+    if kind in ("Int32", "int32"):
+        return pa.int32()
+    if kind in ("Int64", "int64"):
+        return pa.int64()
+    if kind == "float32":
+        return pa.float32()
+    return pa.Array.from_pandas(series).type
+
+
+def _arrow_table(chunk: pd.DataFrame, arrow_schema: "pa.Schema") -> "pa.Table":
+    data = {}
+    for col in chunk.columns:
+        series = chunk[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Plain strings on disk: per-chunk dictionaries would give every row group a different schema
+            series = series.astype(object)
+        data[col] = series
+    return pa.Table.from_pandas(pd.DataFrame(data), schema=arrow_schema, preserve_index=False)
+
+
+def write_history_parquet(
+    source: Path,
+    schema: Mapping[str, str],
+    cache_dir: Path,
+    chunksize: int = HISTORY_CHUNK_ROWS,
+) -> Path:
+    """
+    Convert a history CSV to Parquet chunk by chunk (one row group per chunk) and return the file path.
+    The file is written under a temp name and renamed into place, so readers never see a partial write.
+    """
+    if not parquet_enabled():
+        raise RuntimeError("Parquet conversion needs pyarrow (pip install pyarrow)")
+    target = history_parquet_path(source, cache_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=".staging-", suffix=".parquet", dir=target.parent)
+    os.close(fd)
+    staging = Path(tmp_name)
+    rows = 0
+    writer = None
+    try:
+        for chunk in read_history_csv(source, schema, chunksize=chunksize):
+            if writer is None:
+                arrow_schema = pa.schema([(c, _arrow_type(schema.get(c), chunk[c])) for c in chunk.columns])
+                writer = pq.ParquetWriter(staging, arrow_schema)
+            writer.write_table(_arrow_table(chunk, arrow_schema))
+            rows += len(chunk)
+        if writer is None:
+            raise ValueError(f"{source} has no rows to convert")
+        writer.close()
+        writer = None
+        os.replace(staging, target)
+        meta = {"format": HISTORY_FORMAT_VERSION, "source": Path(source).name, "key": source_key(source), "rows": rows}
+        _meta_path(target).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        staging.unlink(missing_ok=True)
+        raise
+    return target
+
+
+def read_history_parquet(
+    parquet: Path,
+    schema: Mapping[str, str],
+    usecols: Optional[Sequence[str]] = None,
+    dtype: Optional[Mapping[str, Any]] = None,
+    chunksize: Optional[int] = None,
+) -> Frames:
+    """
+    Parquet counterpart of read_history_csv: same columns, types and chunking behaviour.
+    """
+    overrides = {c: t for c, t in (dtype or {}).items() if not usecols or c in usecols}
+    columns = list(usecols) if usecols else None
+    if not chunksize:
+        return _coerce(pd.read_parquet(parquet, columns=columns).astype(overrides), schema, overrides)
+    batches = pq.ParquetFile(parquet).iter_batches(batch_size=chunksize, columns=columns)
+    return (_coerce(batch.to_pandas().astype(overrides), schema, overrides) for batch in batches)
+
+
+def main() -> None:
+    # Ensure repo root is on sys.path so `services.*` imports work
+    repo_root = Path(__file__).resolve().parents[2]
+    if str(repo_root) not in sys.path:
+        sys.path.insert(0, str(repo_root))
+    from services.substitution_service.data_loaders import (
+        DEFAULT_PURCHASES_CSV,
+        DEFAULT_REPLACEMENTS_CSV,
+        DEFAULT_SALES_DELIVERIES_CSV,
+        _resolve_path,
+        catalog_cache_dir,
+    )
+
+    parser = argparse.ArgumentParser(description="Convert the Valio history CSVs into compact Parquet files.")
+    parser.add_argument("--cache-dir", type=str, default=None, help="Output directory (default: VALIO_CACHE_DIR)")
+    parser.add_argument("--chunksize", type=int, default=HISTORY_CHUNK_ROWS, help="CSV rows per chunk / row group")
+    args = parser.parse_args()
+    if not parquet_enabled():
+        parser.error("pyarrow is not installed")
+
+    cache_dir = Path(args.cache_dir) if args.cache_dir else catalog_cache_dir()
+    files = [
+        (DEFAULT_SALES_DELIVERIES_CSV, SALES_SCHEMA),
+        (DEFAULT_REPLACEMENTS_CSV, REPLACEMENTS_SCHEMA),
+        (DEFAULT_PURCHASES_CSV, PURCHASES_SCHEMA),
+    ]
+    for filename, schema in files:
+        source = _resolve_path(None, filename)
+        if not source.exists():
+            print(f"[history] Skipping missing {source.name}")
+            continue
+        out = write_history_parquet(source, schema, cache_dir, args.chunksize)
+        print(f"[history] {source.name} -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,53 @@
-from typing import Any, Dict, List, Optional
+import asyncio
+from contextlib import asynccontextmanager
+import time
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field
 
-from .candidates import suggest_candidates_by_gtin
+from .candidates import resolve_scoring_mode
 from .candidates import _normalize_id  # reuse normalization for response
-from .availability import get_line_ids_for_gtins
+from .availability import availability_cache_stats, get_warehouse_items_for_gtins_async
+from .catalog_version import CatalogReloader, active_catalog, on_catalog_swap
+from .customer_profiles import customer_profile_stats, customer_profiles
+from .data_loaders import _shared_catalog_enabled, product_gtin_index
+from .feature_store import product_feature_store
+from .db_pool import async_pool_stats, close_async_pool, pool_stats
+from .metrics import SERVER_TIMING_ENABLED, observe_timings, render_metrics, server_timing_header, stage_timer
+from .model import load_default_model
+from .name_embeddings import product_name_index
+from .popularity import product_popularity
+from .response_cache import invalidate_response_cache, request_fingerprint, response_cache, response_cache_stats
+from .scoring_pool import (
+    PooledLines,
+    Ranked,
+    pool_lines_job,
+    rank_pooled_lines_job,
+    run_scoring,
+    run_scoring_in_process,
+    shutdown_scoring_executor,
+    suggest_debug_job,
+)
+from .substitution_graph import product_substitution_graph
+from .token_index import product_token_index
+from .topk_table import product_topk_table
+
+# Reloads build every structure a request touches before swapping, so the first request on a new version is not slow
+catalog_reloader = CatalogReloader(
+    warm=[
+        customer_profiles,
+        product_gtin_index,
+        product_feature_store,
+        product_name_index,
+        product_popularity,
+        product_substitution_graph,
+        product_token_index,
+        product_topk_table,
+    ]
+)
+on_catalog_swap(lambda _version: invalidate_response_cache())
 
 
 class SuggestRequest(BaseModel):
@@ -29,6 +71,17 @@ class SuggestRequest(BaseModel):
         default=None,
         description="Requested quantity for original line; if provided, candidates require >= this qty in availability map",
     )
+    mode: Optional[Literal["heuristic", "model", "hybrid"]] = Field(
+        default=None,
+        description="Ranking mode; hybrid shortlists with the heuristic and re-ranks with the trained model "
+        "(model modes fall back to heuristic if no model is loaded). Default: SUBSTITUTION_SCORING_MODE",
+    )
+    shortlist: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=5000,
+        description="Hybrid mode shortlist size M (default SUBSTITUTION_HYBRID_SHORTLIST_SIZE)",
+    )
 
 
 class Recommendation(BaseModel):
@@ -41,6 +94,9 @@ class SuggestResponse(BaseModel):
     sku: str
     name: Optional[str] = None
     recommendations: List[Recommendation]
+    mode: Optional[str] = None
+    # Wall time per ranking stage in milliseconds, plus "total"
+    timings: Optional[Dict[str, float]] = None
 
 
 class OrderSubstitutionRequest(BaseModel):
@@ -55,16 +111,105 @@ class OrderSubstitutionResponse(BaseModel):
     suggestedLineIds: List[int]
 
 
+class OrderSubstitutionBatchRequest(BaseModel):
+    # OrderService clients split larger orders into chunks of this size (ExternalOrderServicesClient)
+    items: List[OrderSubstitutionRequest] = Field(..., min_length=1, max_length=500)
+
+
+class OrderSubstitutionBatchResponse(BaseModel):
+    results: List[OrderSubstitutionResponse]
+
+
+class GraphNeighbor(BaseModel):
+    code: str
+    count: int
+    weight: float
+    customerCount: int = 0
+
+
+class GraphNeighborsResponse(BaseModel):
+    code: str
+    neighbors: List[GraphNeighbor]
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    # Load (memory-map) the trained model before serving instead of on the first model-scored request
+    load_default_model()
+    if _shared_catalog_enabled():
+        # With several uvicorn workers the first one builds the shared files, the rest wait and attach
+        from .shared_catalog import ensure_shared_catalog
+
+        ensure_shared_catalog()
+    # Approximate retrieval for oversized categories reads the name embeddings; build them before serving
+    product_name_index()
+    yield
+    shutdown_scoring_executor()
+    await close_async_pool()
+
+
 app = FastAPI(
     title="Valio Aimo Substitution Service",
     version="0.1.0",
     description="Suggests replacement SKUs for unavailable items.",
+    lifespan=lifespan,
 )
 
 
 @app.get("/health")
-def health() -> Dict[str, str]:
-    return {"status": "ok"}
+def health() -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "db_pool": pool_stats(),
+        "db_pool_async": async_pool_stats(),
+        "availability_cache": availability_cache_stats(),
+        "response_cache": response_cache_stats(),
+        "customer_profiles": customer_profile_stats(),
+        "catalog": _catalog_status(),
+    }
+
+
+def _catalog_status() -> Dict[str, Any]:
+    version = active_catalog()
+    return {
+        "version": version.version,
+        "created_at": version.created_at,
+        "built": version.built(),
+        "reloading": catalog_reloader.reloading,
+        "last_reload_seconds": catalog_reloader.last_duration_s,
+        "last_error": catalog_reloader.last_error,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """
+    Per-stage latency histograms in the Prometheus text exposition format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _record_timings(endpoint: str, timings: Dict[str, float], response: Response) -> None:
+    observe_timings(endpoint, timings)
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+
+
+@app.get("/admin/catalog")
+def catalog_status() -> Dict[str, Any]:
+    return _catalog_status()
+
+
+@app.post("/admin/catalog/reload", status_code=202)
+async def reload_catalog(wait: bool = False) -> Dict[str, Any]:
+    """
+    Build a new catalog version in the background and swap it in when complete; requests keep
+    using the current version meanwhile. wait=true returns after the swap (or failure).
+    """
+    started = catalog_reloader.start()
+    if wait:
+        await asyncio.to_thread(catalog_reloader.join)
+    return {"started": started, **_catalog_status()}
 
 
 def _extract_display_name(prod: Dict[str, Any]) -> Optional[str]:
@@ -99,8 +244,15 @@ def _extract_display_name(prod: Dict[str, Any]) -> Optional[str]:
     return None
 
 
+def _context_customer(context: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not isinstance(context, dict):
+        return None
+    value = context.get("customer_id", context.get("customerId"))
+    return _normalize_id(value) if isinstance(value, (str, int)) and not isinstance(value, bool) else None
+
+
 @app.post("/substitution/suggest_debug", response_model=SuggestResponse)
-def suggest_substitutions_debug(request: SuggestRequest) -> SuggestResponse:
+async def suggest_substitutions_debug(request: SuggestRequest, response: Response) -> SuggestResponse:
     # For MVP, treat sku as GTIN (salesUnitGtin or synkkaData.gtin)
     # Build availability map if provided; assume productCode corresponds to candidate GTIN
     avail_map: Optional[Dict[str, float]] = None
@@ -118,13 +270,44 @@ def suggest_substitutions_debug(request: SuggestRequest) -> SuggestResponse:
                 tmp[norm] = float(max(qty, prev if prev is not None else 0.0))
         avail_map = tmp if tmp else None
 
-    orig, scored = suggest_candidates_by_gtin(
-        request.sku,
+    customer_id = _context_customer(request.context)
+
+    started = time.perf_counter()
+    mode = resolve_scoring_mode(request.mode)
+    # The UI re-requests the same preview; serve repeats from the LRU+TTL cache. Only previews for a
+    # caller-supplied stock snapshot are cached: without one the ranking reads live warehouse stock
+    cache = response_cache() if avail_map is not None else None
+    key = request_fingerprint(
+        sku=request.sku,
+        name=request.name,
         k=request.k,
-        available_qty_by_code=avail_map,
-        required_qty=request.requiredQty,
-        fallback_name=request.name,
+        requiredQty=request.requiredQty,
+        availability=avail_map,
+        mode=mode,
+        shortlist=request.shortlist,
+        customer=customer_id,
+    )
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        elapsed = (time.perf_counter() - started) * 1000.0
+        _record_timings("suggest_debug", {"cache": elapsed, "total": elapsed}, response)
+        return cached.model_copy(update={"timings": {"cache": round(elapsed, 3), "total": round(elapsed, 3)}})
+
+    # Without a snapshot the job reads warehouse stock: keep it in this process (DB pool, availability cache)
+    runner = run_scoring if avail_map is not None else run_scoring_in_process
+    orig, scored, timings = await runner(
+        suggest_debug_job,
+        request.sku,
+        request.k,
+        avail_map,
+        request.requiredQty,
+        request.name,
+        mode,
+        request.shortlist,
+        customer_id,
     )
+    timings["total"] = (time.perf_counter() - started) * 1000.0
+    _record_timings("suggest_debug", timings, response)
     recs: List[Recommendation] = []
     for cand_gtin, score, cand in scored:
         recs.append(
@@ -134,15 +317,81 @@ def suggest_substitutions_debug(request: SuggestRequest) -> SuggestResponse:
                 name=_extract_display_name(cand),
             )
         )
-    return SuggestResponse(
+    result = SuggestResponse(
         sku=request.sku,
         name=_extract_display_name(orig) if isinstance(orig, dict) else None,
         recommendations=recs,
+        mode=mode,
+        timings={stage: round(ms, 3) for stage, ms in timings.items()},
     )
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+def _merge_timings(timings: Dict[str, float], more: Dict[str, float]) -> None:
+    for stage, ms in more.items():
+        timings[stage] = timings.get(stage, 0.0) + ms
+
+
+async def _rank_with_stock(
+    lines: List[Tuple[str, Optional[float], Optional[str]]],
+    pooled: PooledLines,
+    stock: Dict[str, Any],
+    timings: Dict[str, float],
+) -> List[Optional[Tuple[Dict[str, Any], Ranked]]]:
+    """
+    Look up stock for the pooled GTINs not in stock yet (stock is updated in place) and rank the pools with it.
+    """
+    missing = sorted({g for gtins in pooled.gtins for g in gtins} - set(stock))
+    with stage_timer(timings, "warehouse"):
+        if missing:
+            stock.update(await get_warehouse_items_for_gtins_async(missing))
+    # Stock covers every pooled GTIN, so products missing from it are out of stock; an empty lookup must
+    # not mean "no snapshot" or table rows would be served unfiltered instead of falling back to the pool
+    available_qty_by_code = {code: item.qty for code, item in stock.items()}
+    ranked, rank_timings = await run_scoring(rank_pooled_lines_job, lines, pooled, 3, available_qty_by_code)
+    _merge_timings(timings, rank_timings)
+    return ranked
+
+
+async def _suggest_line_ids(
+    lines: List[Tuple[str, Optional[float], Optional[str]]],
+) -> Tuple[List[List[int]], Dict[str, float]]:
+    """
+    Top-3 substitute warehouse line ids per (productCode, qty, name) line, plus stage timings (ms).
+    Scoring runs off the event loop; the single warehouse query for the union of all candidate pools
+    is awaited on the async pool and gives both the stock used for filtering and the line ids.
+    The pools are built once and ranked as returned by the first job. Lines served from the precomputed
+    top-k table only need stock for their table row; a row that runs out of stock is pooled in full
+    and needs a second, smaller warehouse query.
+    """
+    started = time.perf_counter()
+    pooled, timings = await run_scoring(pool_lines_job, lines)
+    stock: Dict[str, Any] = {}
+    ranked = await _rank_with_stock(lines, pooled, stock, timings)
+    retry = [i for i, entry in enumerate(ranked) if entry is None]
+    if retry:
+        retry_lines = [lines[i] for i in retry]
+        retry_pooled, retry_timings = await run_scoring(pool_lines_job, retry_lines, 3, False)
+        _merge_timings(timings, retry_timings)
+        for i, entry in zip(retry, await _rank_with_stock(retry_lines, retry_pooled, stock, timings)):
+            ranked[i] = entry
+    results: List[List[int]] = []
+    with stage_timer(timings, "line_ids"):
+        for entry in ranked:
+            suggested_ids: List[int] = []
+            for g, _score, _cand in entry[1] if entry is not None else []:
+                item = stock.get(_normalize_id(g) or g)
+                if item is not None:
+                    suggested_ids.append(item.line_id)
+            results.append(suggested_ids)
+    timings["total"] = (time.perf_counter() - started) * 1000.0
+    return results, timings
 
 
 @app.post("/substitution/suggest", response_model=OrderSubstitutionResponse)
-def suggest_substitutions(request: OrderSubstitutionRequest) -> OrderSubstitutionResponse:
+async def suggest_substitutions(request: OrderSubstitutionRequest, response: Response) -> OrderSubstitutionResponse:
     """
     Order-fulfilment facing API compatible with SubstitutionRequest/SubstitutionResponse:
 
@@ -150,30 +399,60 @@ def suggest_substitutions(request: OrderSubstitutionRequest) -> OrderSubstitutio
       Response: { lineId, suggestedLineIds: [warehouse_items.line_id, ...] }
     """
     # Treat productCode as GTIN
-    sku = request.productCode
-    # Use DB-driven availability and requiredQty = requested qty
-    orig, scored = suggest_candidates_by_gtin(
-        sku,
-        k=3,
-        available_qty_by_code=None,
-        required_qty=request.qty,
-        fallback_name=request.name,
-    )
-    # Map recommended GTINs to warehouse line_ids
-    gtins = [_normalize_id(g) or g for (g, _score, _cand) in scored]
-    code_to_line_id = get_line_ids_for_gtins(gtins)
-    suggested_ids: List[int] = []
-    for g, _score, _cand in scored:
-        code = _normalize_id(g) or g
-        line_id = code_to_line_id.get(code)
-        if line_id is not None:
-            suggested_ids.append(line_id)
+    [suggested_ids], timings = await _suggest_line_ids([(request.productCode, request.qty, request.name)])
+    _record_timings("suggest", timings, response)
     return OrderSubstitutionResponse(
         lineId=request.lineId,
         suggestedLineIds=suggested_ids,
     )
 
 
+@app.post("/substitution/suggest/batch", response_model=OrderSubstitutionBatchResponse)
+async def suggest_substitutions_batch(
+    request: OrderSubstitutionBatchRequest, response: Response
+) -> OrderSubstitutionBatchResponse:
+    """
+    Whole-order variant of /substitution/suggest: one warehouse query (stock + line ids)
+    for the union of all lines' candidates.
+
+      Request:  { items: [{ lineId, productCode, qty, name? }, ...] }
+      Response: { results: [{ lineId, suggestedLineIds }, ...] }  (same order as items)
+    """
+    suggested, timings = await _suggest_line_ids([(item.productCode, item.qty, item.name) for item in request.items])
+    _record_timings("suggest_batch", timings, response)
+    return OrderSubstitutionBatchResponse(
+        results=[
+            OrderSubstitutionResponse(lineId=item.lineId, suggestedLineIds=ids)
+            for item, ids in zip(request.items, suggested)
+        ]
+    )
+
+
+@app.get("/substitution/graph/neighbors", response_model=GraphNeighborsResponse)
+def substitution_graph_neighbors(
+    code: str = Query(..., min_length=1, description="Original product code"),
+    customer: Optional[str] = Query(None, description="Customer number for per-customer counts"),
+    limit: int = Query(20, ge=1, le=500),
+) -> GraphNeighborsResponse:
+    """
+    Historical replacements of code from the mined substitution graph, highest recency-weighted first.
+    """
+    graph = product_substitution_graph()
+    if graph is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Substitution graph not built (python -m services.substitution_service.substitution_graph)",
+        )
+    key = _normalize_id(code) or code
+    return GraphNeighborsResponse(
+        code=key,
+        neighbors=[
+            GraphNeighbor(code=n.code, count=n.count, weight=round(n.weight, 6), customerCount=n.customer_count)
+            for n in graph.neighbors(key, limit=limit, customer=customer)
+        ],
+    )
+
+
 def _placeholder_recommendations(_: str, __: int) -> List[Recommendation]:
     # Deprecated: kept to avoid breaking imports; not used.
     return []
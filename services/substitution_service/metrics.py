@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+# Per-stage latency histograms, kept in process and rendered in the Prometheus text format on /metrics
+METRICS_ENABLED = bool(int(os.getenv("SUBSTITUTION_METRICS_ENABLED", "1")))
+# Also return stage timings to clients as a Server-Timing header (visible in browser dev tools)
+SERVER_TIMING_ENABLED = bool(int(os.getenv("SUBSTITUTION_SERVER_TIMING", "0")))
+# Upper bounds in milliseconds; rendered in seconds as Prometheus expects
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+METRIC_NAME = "substitution_stage_duration_seconds"
+
+
+@contextmanager
+def stage_timer(timings: Optional[Dict[str, float]], stage: str) -> Iterator[None]:
+    """
+    Add the wall time of the block to timings[stage] (milliseconds); no-op when timings is None.
+    """
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000.0
+
+
+class LatencyHistogram:
+    """
+    Cumulative-bucket histogram of durations in milliseconds (non-cumulative counts internally).
+    """
+
+    def __init__(self, buckets_ms: Sequence[float] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets_ms = tuple(buckets_ms)
+        # Last slot is the +Inf bucket
+        self.counts: List[int] = [0] * (len(self.buckets_ms) + 1)
+        self.sum_ms = 0.0
+        self.count = 0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.sum_ms += ms
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        out: List[int] = []
+        total = 0
+        for c in self.counts:
+            total += c
+            out.append(total)
+        return out
+
+
+class StageMetrics:
+    """
+    Histograms keyed by (endpoint, stage). Recording takes one lock and a bisect, cheap enough for the hot path.
+    """
+
+    def __init__(self, buckets_ms: Sequence[float] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets_ms = tuple(buckets_ms)
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, stage: str, ms: float) -> None:
+        with self._lock:
+            hist = self._histograms.get((endpoint, stage))
+            if hist is None:
+                hist = self._histograms[(endpoint, stage)] = LatencyHistogram(self.buckets_ms)
+            hist.observe(ms)
+
+    def observe_timings(self, endpoint: str, timings: Mapping[str, float]) -> None:
+        for stage, ms in timings.items():
+            self.observe(endpoint, stage, ms)
+
+    def snapshot(self) -> Dict[Tuple[str, str], Tuple[List[int], float, int]]:
+        with self._lock:
+            return {key: (h.cumulative(), h.sum_ms, h.count) for key, h in self._histograms.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {METRIC_NAME} Substitution service time spent per request stage.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        bounds = [_format_seconds(b) for b in self.buckets_ms] + ["+Inf"]
+        for (endpoint, stage), (cumulative, sum_ms, count) in sorted(self.snapshot().items()):
+            labels = f'endpoint="{_escape(endpoint)}",stage="{_escape(stage)}"'
+            for le, value in zip(bounds, cumulative):
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{le}"}} {value}')
+            lines.append(f"{METRIC_NAME}_sum{{{labels}}} {sum_ms / 1000.0:.6f}")
+            lines.append(f"{METRIC_NAME}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_seconds(ms: float) -> str:
+    return f"{ms / 1000.0:g}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_METRICS = StageMetrics()
+
+
+def stage_metrics() -> StageMetrics:
+    return _METRICS
+
+
+def observe_stage(endpoint: str, stage: str, ms: float) -> None:
+    if METRICS_ENABLED:
+        _METRICS.observe(endpoint, stage, ms)
+
+
+def observe_timings(endpoint: str, timings: Mapping[str, float]) -> None:
+    if METRICS_ENABLED:
+        _METRICS.observe_timings(endpoint, timings)
+
+
+def render_metrics() -> str:
+    return _METRICS.render()
+
+
+def reset_metrics() -> None:
+    _METRICS.reset()
+
+
+def server_timing_header(timings: Mapping[str, float]) -> str:
+    """
+    Server-Timing header value, e.g. "pool;dur=1.234, heuristic;dur=0.567, total;dur=2.001".
+    """
+    return ", ".join(f"{stage};dur={ms:.3f}" for stage, ms in timings.items())
@@ -1,14 +1,25 @@
 from __future__ import annotations
 
 import joblib
+import logging
+import os
+import threading
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_MODEL_PATHS = [
     Path("models/substitution_rf.joblib"),
+    Path(__file__).resolve().parents[2] / "models" / "substitution_rf.joblib",
 ]
+if os.getenv("SUBSTITUTION_MODEL_PATH"):
+    DEFAULT_MODEL_PATHS.insert(0, Path(os.environ["SUBSTITUTION_MODEL_PATH"]))
+
+# Memory-map the model's numpy arrays (tree node tables) instead of copying them into each process
+MODEL_MMAP_MODE: Optional[str] = os.getenv("SUBSTITUTION_MODEL_MMAP_MODE", "r") or None
 
 
 class ModelScorer:
@@ -18,41 +29,70 @@ class ModelScorer:
         if not self.model or not self.feature_names:
             raise ValueError("Invalid model artifact")
 
-    def score(self, feature_dict: Dict[str, float]) -> float:
-        x = np.asarray([[float(feature_dict.get(fn, 0.0)) for fn in self.feature_names]], dtype=np.float32)
-        proba = self.model.predict_proba(x)
+    def _positive_proba(self, proba: np.ndarray, n: int) -> np.ndarray:
         # Handle single-class models gracefully
         if proba.ndim == 2 and proba.shape[1] > 1:
-            pos = proba[:, 1]
-        else:
-            # If only one class present in the trained model, fall back to a neutral score
-            # (the caller should ideally avoid using single-class models)
-            if hasattr(self.model, "classes_") and len(getattr(self.model, "classes_", [])) == 1:
-                # If the single class is 1, use its probability; else use 1 - prob
-                cls = self.model.classes_[0]
-                base = proba.ravel()[0] if proba.size else 0.5
-                pos = np.asarray([base if cls == 1 else 1.0 - base], dtype=np.float32)
-            else:
-                pos = proba.ravel() if proba.size else np.asarray([0.5], dtype=np.float32)
-        return float(pos[0])
+            return proba[:, 1]
+        # If only one class present in the trained model, fall back to a neutral score
+        # (the caller should ideally avoid using single-class models)
+        if hasattr(self.model, "classes_") and len(getattr(self.model, "classes_", [])) == 1:
+            # If the single class is 1, use its probability; else use 1 - prob
+            cls = self.model.classes_[0]
+            base = proba.ravel() if proba.size else np.full(n, 0.5)
+            return base if cls == 1 else 1.0 - base
+        return proba.ravel() if proba.size else np.full(n, 0.5)
+
+    def score_batch(self, feature_matrix: np.ndarray, columns: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        Positive-class probabilities for every row of feature_matrix in one predict_proba call.
+        columns names the matrix columns (e.g. feature_store.FEATURE_NAMES); they are reordered to the
+        model's feature_names, missing features are 0. Without columns the matrix must already match.
+        """
+        x = np.asarray(feature_matrix, dtype=np.float32)
+        if x.ndim != 2:
+            raise ValueError("feature_matrix must be 2-D")
+        if columns is not None and list(columns) != self.feature_names:
+            col = {name: i for i, name in enumerate(columns)}
+            ordered = np.zeros((x.shape[0], len(self.feature_names)), dtype=np.float32)
+            for j, name in enumerate(self.feature_names):
+                if name in col:
+                    ordered[:, j] = x[:, col[name]]
+            x = ordered
+        if x.shape[0] == 0:
+            return np.empty(0, dtype=np.float64)
+        proba = self.model.predict_proba(x)
+        return np.asarray(self._positive_proba(proba, x.shape[0]), dtype=np.float64)
+
+    def score(self, feature_dict: Dict[str, float]) -> float:
+        x = np.asarray([[float(feature_dict.get(fn, 0.0)) for fn in self.feature_names]], dtype=np.float32)
+        return float(self.score_batch(x)[0])
 
 
 _SCORER: Optional[ModelScorer] = None
+_LOADED = False
+_LOAD_LOCK = threading.Lock()
 
 
 def load_default_model() -> Optional[ModelScorer]:
-    global _SCORER
-    if _SCORER is not None:
+    """
+    Load the trained model once per process (None if missing or unusable); later calls are free.
+    """
+    global _SCORER, _LOADED
+    if _LOADED:
         return _SCORER
-    for p in DEFAULT_MODEL_PATHS:
-        if p.exists():
-            artifact = joblib.load(p)
-            # Avoid using single-class models; fall back to heuristic
-            mdl = artifact.get("model")
-            if hasattr(mdl, "classes_") and len(getattr(mdl, "classes_", [])) < 2:
-                return None
-            _SCORER = ModelScorer(artifact)
+    with _LOAD_LOCK:
+        if _LOADED:
             return _SCORER
-    return None
-
-
+        for p in DEFAULT_MODEL_PATHS:
+            if p.exists():
+                artifact = joblib.load(p, mmap_mode=MODEL_MMAP_MODE)
+                # Avoid using single-class models; fall back to heuristic
+                mdl = artifact.get("model")
+                if hasattr(mdl, "classes_") and len(getattr(mdl, "classes_", [])) < 2:
+                    logger.warning("Model at %s has a single class; using heuristic scoring", p)
+                    break
+                _SCORER = ModelScorer(artifact)
+                logger.info("Loaded substitution model from %s", p)
+                break
+        _LOADED = True
+    return _SCORER
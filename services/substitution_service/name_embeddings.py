@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    EMBEDDINGS_AVAILABLE = True
+except ImportError:  # pragma: no cover - sklearn is in requirements.txt
+    EMBEDDINGS_AVAILABLE = False
+
+from .catalog_version import catalog_cached
+from .data_loaders import _shared_catalog_enabled, product_data_df
+from .features import _collect_names, _get
+from .feature_store import ProductFeatureStore, product_feature_store
+
+logger = logging.getLogger(__name__)
+
+NAME_EMBEDDING_DIM = int(os.getenv("SUBSTITUTION_NAME_EMBEDDING_DIM", "64"))
+
+
+def _name_text(product: Dict[str, Any]) -> str:
+    # All synkkaData name variants (fi/sv/en) in one document; vendor/brand only when a product has no names
+    names = [
+        n["value"]
+        for n in _get(product, ["synkkaData", "names"], []) or []
+        if isinstance(n, dict) and isinstance(n.get("value"), str)
+    ]
+    return " ".join(names or _collect_names(product)).lower()
+
+
+@dataclass(frozen=True)
+class NameEmbeddingIndex:
+    """
+    L2-normalized TF-IDF char n-gram + SVD embeddings of product names, stored grouped by category
+    so a category's neighbours are one contiguous matrix-vector product (brute force, BLAS).
+    """
+
+    embeddings: np.ndarray  # (n_products, dim), row i = product position i
+    block_embeddings: np.ndarray  # same rows reordered by category
+    block_positions: np.ndarray  # product position of each block_embeddings row
+    blocks: Mapping[str, Tuple[int, int]]  # category -> [start, end) in block_*
+
+    def nearest_in_category(self, orig_pos: int, category: str, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Up to n same-category positions most similar to orig_pos (cosine), best first; ties by position.
+        The original itself is excluded.
+        """
+        start, end = self.blocks.get(category, (0, 0))
+        positions = self.block_positions[start:end]
+        sims = self.block_embeddings[start:end] @ self.embeddings[orig_pos]
+        keep = positions != orig_pos
+        positions, sims = positions[keep], sims[keep]
+        if len(sims) > n:
+            kth = np.partition(-sims, n - 1)[n - 1]
+            idx = np.flatnonzero(-sims <= kth)
+        else:
+            idx = np.arange(len(sims))
+        idx = idx[np.argsort(-sims[idx], kind="stable")][:n]
+        return positions[idx], sims[idx]
+
+
+def embed_names(texts: Sequence[str], dim: int = NAME_EMBEDDING_DIM) -> np.ndarray:
+    """
+    (len(texts), <= dim) float32 matrix of L2-normalized name embeddings, one row per text.
+    """
+    vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 4), sublinear_tf=True, dtype=np.float32)
+    tfidf = vectorizer.fit_transform(texts)
+    n_components = min(dim, tfidf.shape[1] - 1, tfidf.shape[0] - 1)
+    if n_components >= 1:
+        dense = TruncatedSVD(n_components=n_components, random_state=42).fit_transform(tfidf)
+    else:
+        dense = tfidf.toarray()
+    dense = np.ascontiguousarray(dense, dtype=np.float32)
+    norms = np.linalg.norm(dense, axis=1, keepdims=True)
+    dense /= np.where(norms > 0, norms, 1.0)
+    return dense
+
+
+def build_name_embedding_index(
+    df: pd.DataFrame,
+    store: ProductFeatureStore,
+    dim: int = NAME_EMBEDDING_DIM,
+) -> NameEmbeddingIndex:
+    dense = embed_names([_name_text(p) for p in df.to_dict("records")], dim)
+    blocks: Dict[str, Tuple[int, int]] = {}
+    order: List[np.ndarray] = []
+    offset = 0
+    for cat, members in store.category_members.items():
+        blocks[cat] = (offset, offset + len(members))
+        order.append(members)
+        offset += len(members)
+    block_positions = np.concatenate(order).astype(np.int64) if order else np.empty(0, dtype=np.int64)
+    return NameEmbeddingIndex(
+        embeddings=dense,
+        block_embeddings=np.ascontiguousarray(dense[block_positions]),
+        block_positions=block_positions,
+        blocks=blocks,
+    )
+
+
+@catalog_cached
+def product_name_index() -> Optional[NameEmbeddingIndex]:
+    """
+    Name embedding index over product_data_df(), built on first use; None without scikit-learn.
+    In shared-catalog mode the embeddings are memory-mapped from the shared files instead.
+    """
+    if not EMBEDDINGS_AVAILABLE:
+        logger.warning("scikit-learn not available; name-embedding retrieval disabled")
+        return None
+    if _shared_catalog_enabled():
+        from .shared_catalog import load_shared_name_index
+
+        return load_shared_name_index()
+    return build_name_embedding_index(product_data_df(), product_feature_store())
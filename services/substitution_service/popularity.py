@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+import numpy as np
+
+from .catalog_cache import source_key
+from .catalog_version import catalog_cached
+from .data_loaders import (
+    DEFAULT_PRODUCT_JSON,
+    DEFAULT_REPLACEMENTS_CSV,
+    _normalize_id,
+    _resolve_path,
+    catalog_cache_dir,
+    load_replacement_orders_csv,
+    product_gtin_index,
+)
+from .feature_store import ProductFeatureStore, product_feature_store
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_FORMAT_VERSION = 1
+# Feed replacement-history priors into the popularity_* features (0 for every candidate when off)
+POPULARITY_ENABLED = bool(int(os.getenv("SUBSTITUTION_POPULARITY", "1")))
+_META_FILE = "meta.json"
+
+
+@dataclass(frozen=True)
+class PopularityTable:
+    """
+    Replacement-history priors aligned with product_data_df() row positions, both in [0, 1]:
+    overall[i] is product i's replacement frequency relative to the most replaced product,
+    by_category[i] the same relative to the most replaced product of i's category.
+    Frequencies are log-scaled (log1p) so a handful of very common replacements do not flatten the rest.
+    """
+
+    overall: np.ndarray
+    by_category: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.overall.shape[0])
+
+
+def replacement_counts(product_codes: Iterable[Any], gtin_index: Mapping[str, int], rows: int) -> np.ndarray:
+    """
+    Replacement rows per catalog position; codes that do not resolve to a catalog GTIN are ignored.
+    """
+    counts = np.zeros(rows, dtype=np.float64)
+    for code in product_codes:
+        key = _normalize_id(code)
+        pos = gtin_index.get(key) if key is not None else None
+        if pos is not None:
+            counts[pos] += 1.0
+    return counts
+
+
+def build_popularity_table(counts: np.ndarray, store: ProductFeatureStore) -> PopularityTable:
+    scaled = np.log1p(np.asarray(counts, dtype=np.float64))
+    overall = np.zeros(len(scaled), dtype=np.float32)
+    if len(scaled) and scaled.max() > 0:
+        overall[:] = scaled / scaled.max()
+    by_category = np.zeros(len(scaled), dtype=np.float32)
+    for members in store.category_members.values():
+        members = np.asarray(members, dtype=np.int64)
+        top = scaled[members].max() if len(members) else 0.0
+        if top > 0:
+            by_category[members] = scaled[members] / top
+    return PopularityTable(overall, by_category)
+
+
+def popularity_dir(cache_dir: Optional[Path] = None) -> Path:
+    return Path(cache_dir or catalog_cache_dir()) / "popularity"
+
+
+def popularity_meta() -> Optional[Dict[str, Any]]:
+    """
+    Freshness key for the table: catalog and replacement CSV versions; None when the CSV is missing.
+    """
+    replacements = _resolve_path(None, DEFAULT_REPLACEMENTS_CSV)
+    if not replacements.exists():
+        return None
+    return {
+        "catalog_key": source_key(_resolve_path(None, DEFAULT_PRODUCT_JSON)),
+        "replacements_key": source_key(replacements),
+    }
+
+
+def write_popularity_table(table: PopularityTable, meta: Dict[str, Any], cache_dir: Optional[Path] = None) -> Path:
+    target = popularity_dir(cache_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".staging-popularity-", dir=target.parent))
+    try:
+        np.save(staging / "overall.npy", table.overall)
+        np.save(staging / "by_category.npy", table.by_category)
+        full_meta = dict(meta, format=POPULARITY_FORMAT_VERSION, rows=len(table))
+        (staging / _META_FILE).write_text(json.dumps(full_meta, indent=2), encoding="utf-8")
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def load_popularity_table(expected_meta: Dict[str, Any], cache_dir: Optional[Path] = None) -> Optional[PopularityTable]:
+    root = popularity_dir(cache_dir)
+    try:
+        meta = json.loads((root / _META_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != POPULARITY_FORMAT_VERSION or any(meta.get(k) != v for k, v in expected_meta.items()):
+        return None
+    return PopularityTable(
+        overall=np.load(root / "overall.npy", mmap_mode="r"),
+        by_category=np.load(root / "by_category.npy", mmap_mode="r"),
+    )
+
+
+def compute_popularity_table() -> PopularityTable:
+    """
+    Aggregate replacement_orders product codes into a table for the current catalog (one pass, product_code only).
+    """
+    df = load_replacement_orders_csv(usecols=["product_code"], dtype={"product_code": str})
+    store = product_feature_store()
+    counts = replacement_counts(df["product_code"].tolist(), product_gtin_index(), len(store))
+    return build_popularity_table(counts, store)
+
+
+@catalog_cached
+def product_popularity() -> Optional[PopularityTable]:
+    """
+    Popularity table for the current catalog: the precomputed file when fresh, otherwise built from the
+    replacement CSV and written for the next process. None when disabled or the CSV is missing.
+    """
+    if not POPULARITY_ENABLED:
+        return None
+    meta = popularity_meta()
+    if meta is None:
+        return None
+    table = load_popularity_table(meta)
+    if table is not None:
+        return table
+    table = compute_popularity_table()
+    try:
+        write_popularity_table(table, meta)
+    except OSError as exc:
+        logger.warning("Could not write popularity table: %s", exc)
+    return table
+
+
+def main() -> None:
+    # Ensure repo root is on sys.path so `services.*` imports work
+    repo_root = Path(__file__).resolve().parents[2]
+    if str(repo_root) not in sys.path:
+        sys.path.insert(0, str(repo_root))
+    parser = argparse.ArgumentParser(description="Precompute replacement-history popularity priors for the catalog.")
+    parser.add_argument("--cache-dir", type=str, default=None, help="Output directory (default: VALIO_CACHE_DIR)")
+    args = parser.parse_args()
+    meta = popularity_meta()
+    if meta is None:
+        parser.error(f"{DEFAULT_REPLACEMENTS_CSV} not found in the data directory")
+    table = compute_popularity_table()
+    out = write_popularity_table(table, meta, Path(args.cache_dir) if args.cache_dir else None)
+    print(f"[popularity] {int((table.overall > 0).sum())}/{len(table)} products with replacement history -> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Mapping, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+# Debug/preview responses for a request-supplied stock snapshot, keyed by request fingerprint
+RESPONSE_CACHE_ENABLED = bool(int(os.getenv("SUBSTITUTION_RESPONSE_CACHE_ENABLED", "1")))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("SUBSTITUTION_RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("SUBSTITUTION_RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+
+def request_fingerprint(**fields: Any) -> str:
+    """
+    Canonical hash of request fields: key order, dict order and int/float spelling of numbers do not matter.
+    Availability maps should already be normalized (code -> qty) by the caller.
+    """
+
+    def canonical(value: Any) -> Any:
+        if isinstance(value, Mapping):
+            return {str(k): canonical(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [canonical(v) for v in value]
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        return value
+
+    raw = json.dumps(canonical(fields), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(Generic[V]):
+    """
+    Size-bounded LRU of responses with a per-entry TTL.
+    Expired entries count as misses and are dropped on access; the least recently used entry is evicted when full.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[V, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[V]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: V) -> None:
+        if self.max_entries <= 0:
+            return
+        expires = self._clock() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+_CACHE: Optional[ResponseCache[Any]] = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+
+
+def response_cache() -> Optional[ResponseCache[Any]]:
+    """
+    Process-wide cache for /substitution/suggest_debug responses (None when disabled).
+    """
+    return _CACHE
+
+
+def invalidate_response_cache() -> None:
+    """
+    Drop every cached response; call whenever the catalog, model or scoring configuration changes.
+    """
+    if _CACHE is not None:
+        _CACHE.invalidate()
+
+
+def response_cache_stats() -> Dict[str, Any]:
+    if _CACHE is None:
+        return {"enabled": False}
+    stats: Dict[str, Any] = {"enabled": True}
+    stats.update(_CACHE.stats())
+    return stats
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from .candidates import CandidatePool, candidate_pools, rank_candidate_pools, suggest_candidates_by_gtin
+from .catalog_version import on_catalog_swap, pinned_catalog
+from .feature_store import product_feature_store
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Worker processes for CPU-bound scoring from the async handlers; 0 runs scoring in the default thread pool
+SCORING_PROCESSES = int(os.getenv("SUBSTITUTION_SCORING_PROCESSES", "0"))
+
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+Line = Tuple[str, Optional[float], Optional[str]]
+Ranked = List[Tuple[str, float, Dict[str, Any]]]
+
+
+@dataclass
+class PooledLines:
+    """
+    Candidate pools built by pool_lines_job, plus their GTINs for the caller's stock lookup.
+    Pool positions refer to the catalog version they were built on.
+    """
+
+    catalog: str
+    pools: List[CandidatePool]
+    gtins: List[List[str]]
+    use_table: bool = True
+
+
+def _warm_worker() -> None:
+    # Build the catalog-derived structures once per worker instead of on its first job
+    from .feature_store import product_feature_store
+
+    product_feature_store()
+
+
+def scoring_executor() -> Optional[ProcessPoolExecutor]:
+    """
+    Bounded process pool shared by all requests (None when SCORING_PROCESSES is 0).
+    Workers are spawned, not forked, so they never inherit the server's threads or DB connections.
+    """
+    global _EXECUTOR
+    if SCORING_PROCESSES <= 0:
+        return None
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ProcessPoolExecutor(
+                max_workers=SCORING_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+    return _EXECUTOR
+
+
+def shutdown_scoring_executor(cancel_futures: bool = True) -> None:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        executor, _EXECUTOR = _EXECUTOR, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=cancel_futures)
+
+
+# Worker processes hold their own copy of the catalog: retire them after a reload (queued jobs still
+# finish on the old catalog) and let the next job spawn workers that load the new one.
+on_catalog_swap(lambda _version: shutdown_scoring_executor(cancel_futures=False))
+
+
+async def run_scoring(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a picklable module-level scoring function off the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(scoring_executor(), partial(fn, *args, **kwargs))
+
+
+async def run_scoring_in_process(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Like run_scoring, but always on this process's default thread pool: for jobs that look stock up
+    in the warehouse DB, so they use the API process's connection pool, availability cache and metrics
+    instead of each worker process opening its own.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(fn, *args, **kwargs))
+
+
+# Job functions: module level so they can be pickled to worker processes. Only suggest_debug_job
+# reads the DB (when no availability snapshot is passed); callers run it with run_scoring_in_process.
+# Each job pins one catalog version so a concurrent reload cannot swap it out mid-job, and returns
+# its stage timings (ms) so the API process can record them.
+
+def pool_lines_job(lines: Sequence[Line], k: int = 3, use_table: bool = True) -> Tuple[PooledLines, Dict[str, float]]:
+    timings: Dict[str, float] = {}
+    with pinned_catalog() as version:
+        pools = candidate_pools(lines, k=k, use_table=use_table, timings=timings)
+        store = product_feature_store()
+        pooled = PooledLines(version.version, pools, [pool.gtins(store) for pool in pools], use_table)
+    return pooled, timings
+
+
+def rank_pooled_lines_job(
+    lines: Sequence[Line],
+    pooled: PooledLines,
+    k: int,
+    available_qty_by_code: Optional[Dict[str, float]],
+) -> Tuple[List[Optional[Tuple[Dict[str, Any], Ranked]]], Dict[str, float]]:
+    # Ranks the pools from pool_lines_job as they are; they are only rebuilt if a reload swapped the catalog in between.
+    # None entries are table rows that ran out of stock (see rank_candidate_pools).
+    timings: Dict[str, float] = {}
+    with pinned_catalog() as version:
+        pools = pooled.pools
+        if pooled.catalog != version.version:
+            pools = candidate_pools(lines, k=k, use_table=pooled.use_table, timings=timings)
+        ranked = rank_candidate_pools(pools, lines, k, available_qty_by_code, timings=timings)
+    return ranked, timings
+
+
+def suggest_debug_job(
+    sku: str,
+    k: int,
+    available_qty_by_code: Optional[Dict[str, float]],
+    required_qty: Optional[float],
+    fallback_name: Optional[str],
+    mode: Optional[str],
+    shortlist_size: Optional[int],
+    customer_id: Optional[str] = None,
+) -> Tuple[Dict[str, Any], Ranked, Dict[str, float]]:
+    # Debug path keeps its own (blocking) availability lookup when no snapshot is passed; run it with
+    # run_scoring_in_process then
+    timings: Dict[str, float] = {}
+    with pinned_catalog():
+        orig, scored = suggest_candidates_by_gtin(
+            sku,
+            k=k,
+            available_qty_by_code=available_qty_by_code,
+            required_qty=required_qty,
+            fallback_name=fallback_name,
+            mode=mode,
+            shortlist_size=shortlist_size,
+            timings=timings,
+            customer_id=customer_id,
+        )
+    return orig, scored, timings
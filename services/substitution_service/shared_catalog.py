@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+from .catalog_cache import (
+    StringTable,
+    decode_object,
+    read_snapshot_meta,
+    snapshot_dir,
+    source_key,
+    write_catalog_snapshot,
+)
+from .catalog_version import catalog_cached, current_catalog
+from .data_loaders import DEFAULT_PRODUCT_JSON, _resolve_path, build_gtin_index, catalog_cache_dir, load_product_data_json
+from .feature_store import ProductFeatureStore, TokenSets, build_feature_store
+from .name_embeddings import NAME_EMBEDDING_DIM, NameEmbeddingIndex, _name_text, embed_names
+
+logger = logging.getLogger(__name__)
+
+SHARED_FORMAT_VERSION = 1
+_META_FILE = "meta.json"
+# Name embeddings are added to the shared dir on first use (see load_shared_name_index)
+_NAMES_META_FILE = "name_embeddings.json"
+_ARRAYS = (
+    "category_codes",
+    "vendor_codes",
+    "brand_codes",
+    "sales_unit_codes",
+    "unit_size",
+    "temperature",
+    "contains_mask",
+    "free_from_mask",
+    "token_counts",
+)
+
+
+def shared_dir(cache_dir: Optional[Path] = None) -> Path:
+    return Path(cache_dir or catalog_cache_dir()) / "shared"
+
+
+def _source() -> Path:
+    return _resolve_path(None, DEFAULT_PRODUCT_JSON)
+
+
+def write_shared_catalog(store: ProductFeatureStore, gtin_index: Mapping[str, int], key: str, cache_dir: Optional[Path] = None) -> Path:
+    """
+    Dump the feature store and GTIN index as flat .npy / string-table files (staged, then renamed).
+    """
+    target = shared_dir(cache_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".staging-shared-", dir=target.parent))
+    try:
+        for name in _ARRAYS:
+            np.save(staging / f"{name}.npy", np.asarray(getattr(store, name)))
+        matrix = store.token_matrix.tocsr()
+        np.save(staging / "token_data.npy", matrix.data)
+        np.save(staging / "token_indices.npy", matrix.indices)
+        np.save(staging / "token_indptr.npy", matrix.indptr)
+        StringTable.write(staging / "gtins", list(store.gtins))
+        categories = list(store.category_members)
+        members = [np.asarray(store.category_members[c], dtype=np.int32) for c in categories]
+        np.save(staging / "category_offsets.npy", np.cumsum([0] + [len(m) for m in members]).astype(np.int64))
+        np.save(staging / "category_positions.npy", np.concatenate(members) if members else np.empty(0, dtype=np.int32))
+        keys = list(gtin_index)
+        StringTable.write(staging / "gtin_keys", keys)
+        np.save(staging / "gtin_positions.npy", np.asarray([gtin_index[k] for k in keys], dtype=np.int64))
+        vocabulary = sorted(store.token_vocabulary, key=store.token_vocabulary.get)
+        meta = {
+            "format": SHARED_FORMAT_VERSION,
+            "catalog_key": key,
+            "rows": len(store),
+            "token_shape": list(matrix.shape),
+            "categories": categories,
+            "token_vocabulary": vocabulary,
+        }
+        (staging / _META_FILE).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def _read_meta(root: Path, key: str) -> Optional[Dict[str, Any]]:
+    try:
+        meta = json.loads((root / _META_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != SHARED_FORMAT_VERSION or meta.get("catalog_key") != key:
+        return None
+    return meta
+
+
+@contextlib.contextmanager
+def _build_lock(cache_dir: Path) -> Iterator[None]:
+    # First worker builds, the others block here and then attach to the result
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with open(cache_dir / ".shared.lock", "w") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def ensure_shared_catalog(cache_dir: Optional[Path] = None) -> Path:
+    """
+    Make sure the catalog snapshot and the shared feature files exist for the current catalog,
+    building them once (under a file lock) if not. Returns the shared directory.
+    """
+    cache_dir = Path(cache_dir or catalog_cache_dir())
+    source = _source()
+    key = source_key(source)
+    root = shared_dir(cache_dir)
+    if _read_meta(root, key) is not None and read_snapshot_meta(source, cache_dir) is not None:
+        return root
+    with _build_lock(cache_dir):
+        if _read_meta(root, key) is not None and read_snapshot_meta(source, cache_dir) is not None:
+            return root
+        logger.info("Building shared catalog files in %s", root)
+        df = load_product_data_json(source)
+        if read_snapshot_meta(source, cache_dir) is None:
+            write_catalog_snapshot(df, source, cache_dir)
+        write_shared_catalog(build_feature_store(df), build_gtin_index(df), key, cache_dir)
+    return root
+
+
+def load_shared_feature_store(cache_dir: Optional[Path] = None) -> ProductFeatureStore:
+    """
+    ProductFeatureStore whose arrays, token matrix and category members are read-only memory maps
+    of the shared files, so every worker shares the same page-cache copy. Only the GTIN list and
+    the token vocabulary are decoded into the worker's heap.
+    """
+    root = ensure_shared_catalog(cache_dir)
+    meta = json.loads((root / _META_FILE).read_text(encoding="utf-8"))
+    current_catalog().source_key = meta["catalog_key"]
+    arrays = {name: np.load(root / f"{name}.npy", mmap_mode="r") for name in _ARRAYS}
+    token_matrix = sparse.csr_matrix(
+        (
+            np.load(root / "token_data.npy", mmap_mode="r"),
+            np.load(root / "token_indices.npy", mmap_mode="r"),
+            np.load(root / "token_indptr.npy", mmap_mode="r"),
+        ),
+        shape=tuple(meta["token_shape"]),
+        copy=False,
+    )
+    vocabulary: List[str] = meta["token_vocabulary"]
+    offsets = np.load(root / "category_offsets.npy")
+    flat = np.load(root / "category_positions.npy", mmap_mode="r")
+    members = {cat: flat[offsets[i]: offsets[i + 1]] for i, cat in enumerate(meta["categories"])}
+    return ProductFeatureStore(
+        gtins=StringTable.open(root / "gtins").to_list(),
+        category_members=MappingProxyType(members),
+        tokens=TokenSets(token_matrix, vocabulary),
+        token_matrix=token_matrix,
+        token_vocabulary=MappingProxyType({t: i for i, t in enumerate(vocabulary)}),
+        **arrays,
+    )
+
+
+def load_shared_gtin_index(cache_dir: Optional[Path] = None) -> Mapping[str, int]:
+    root = ensure_shared_catalog(cache_dir)
+    keys = StringTable.open(root / "gtin_keys").to_list()
+    positions = np.load(root / "gtin_positions.npy").tolist()
+    return MappingProxyType(dict(zip(keys, positions)))
+
+
+class SnapshotRows:
+    """
+    Row access over the memory-mapped catalog snapshot, decoding only the requested row,
+    so workers can materialize candidate dicts without holding a DataFrame.
+    """
+
+    def __init__(self, source: Path, cache_dir: Path) -> None:
+        meta = read_snapshot_meta(source, cache_dir)
+        if meta is None:
+            raise FileNotFoundError(f"No fresh catalog snapshot for {source} in {cache_dir}")
+        root = snapshot_dir(source, cache_dir)
+        self.columns: List[Tuple[str, str, Any]] = []
+        for col in meta["columns"]:
+            base = root / col["file"]
+            if col["kind"] == "numeric":
+                data: Any = np.load(f"{base}.npy", mmap_mode="r")
+            else:
+                data = StringTable.open(base)
+            self.columns.append((col["name"], col["kind"], data))
+
+    def record(self, pos: int) -> Dict[str, Any]:
+        row: Dict[str, Any] = {}
+        for name, kind, data in self.columns:
+            if kind == "numeric":
+                row[name] = data[pos].item()
+            elif kind == "str":
+                row[name] = data[pos]
+            else:
+                row[name] = decode_object(data.get_bytes(pos))
+        return row
+
+
+def _read_names_meta(root: Path, key: str, dim: int) -> Optional[Dict[str, Any]]:
+    try:
+        meta = json.loads((root / _NAMES_META_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("catalog_key") != key or meta.get("dim") != dim:
+        return None
+    return meta
+
+
+def write_shared_name_embeddings(root: Path, rows: SnapshotRows, n_rows: int, key: str, dim: int) -> None:
+    """
+    Embed every product name (decoded row by row from the snapshot) and save the embeddings, plus a copy
+    grouped by category in category_positions order, next to the shared feature files.
+    """
+    embeddings = embed_names([_name_text(rows.record(pos)) for pos in range(n_rows)], dim)
+    block_positions = np.load(root / "category_positions.npy", mmap_mode="r")
+    for name, array in (
+        ("name_embeddings", embeddings),
+        ("name_block_embeddings", np.ascontiguousarray(embeddings[block_positions])),
+    ):
+        # Rename into place so attached workers never see a half-written file
+        fd, tmp = tempfile.mkstemp(prefix=f".{name}-", suffix=".npy", dir=root)
+        with os.fdopen(fd, "wb") as fh:
+            np.save(fh, array)
+        os.replace(tmp, root / f"{name}.npy")
+    (root / _NAMES_META_FILE).write_text(json.dumps({"catalog_key": key, "dim": dim}), encoding="utf-8")
+
+
+def load_shared_name_index(cache_dir: Optional[Path] = None, dim: int = NAME_EMBEDDING_DIM) -> NameEmbeddingIndex:
+    """
+    NameEmbeddingIndex over memory-mapped files in the shared dir. The first worker embeds the names
+    under the build lock; the others attach, so no worker loads the catalog DataFrame for it.
+    """
+    cache_dir = Path(cache_dir or catalog_cache_dir())
+    root = ensure_shared_catalog(cache_dir)
+    meta = json.loads((root / _META_FILE).read_text(encoding="utf-8"))
+    if _read_names_meta(root, meta["catalog_key"], dim) is None:
+        with _build_lock(cache_dir):
+            # Re-read under the lock: another worker may have rebuilt the directory meanwhile
+            meta = json.loads((root / _META_FILE).read_text(encoding="utf-8"))
+            key = meta["catalog_key"]
+            if _read_names_meta(root, key, dim) is None:
+                logger.info("Building shared name embeddings in %s", root)
+                write_shared_name_embeddings(root, SnapshotRows(_source(), cache_dir), meta["rows"], key, dim)
+    offsets = np.load(root / "category_offsets.npy").tolist()
+    return NameEmbeddingIndex(
+        embeddings=np.load(root / "name_embeddings.npy", mmap_mode="r"),
+        block_embeddings=np.load(root / "name_block_embeddings.npy", mmap_mode="r"),
+        block_positions=np.load(root / "category_positions.npy", mmap_mode="r"),
+        blocks=MappingProxyType({cat: (offsets[i], offsets[i + 1]) for i, cat in enumerate(meta["categories"])}),
+    )
+
+
+@catalog_cached
+def shared_rows() -> SnapshotRows:
+    cache_dir = catalog_cache_dir()
+    ensure_shared_catalog(cache_dir)
+    return SnapshotRows(_source(), cache_dir)
+
+
+def main() -> None:
+    # Ensure repo root is on sys.path so `services.*` imports work
+    repo_root = Path(__file__).resolve().parents[2]
+    if str(repo_root) not in sys.path:
+        sys.path.insert(0, str(repo_root))
+    parser = argparse.ArgumentParser(description="Prebuild the shared catalog files used by VALIO_SHARED_CATALOG=1 workers.")
+    parser.add_argument("--cache-dir", type=str, default=None, help="Output directory (default: VALIO_CACHE_DIR)")
+    args = parser.parse_args()
+    out = ensure_shared_catalog(Path(args.cache_dir) if args.cache_dir else None)
+    print(f"[shared] Catalog files ready in {out}")
+
+
+if __name__ == "__main__":
+    main()
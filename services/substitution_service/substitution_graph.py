@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .catalog_cache import StringTable, source_key
+from .catalog_version import catalog_cached
+from .data_loaders import (
+    DEFAULT_REPLACEMENTS_CSV,
+    DEFAULT_SALES_DELIVERIES_CSV,
+    _resolve_path,
+    catalog_cache_dir,
+    load_replacement_orders_csv,
+    load_sales_deliveries_csv,
+)
+
+logger = logging.getLogger(__name__)
+
+GRAPH_FORMAT_VERSION = 1
+# Recency decay of edge weights: an observation half_life days older than the newest one counts half
+GRAPH_HALF_LIFE_DAYS = float(os.getenv("SUBSTITUTION_GRAPH_HALF_LIFE_DAYS", "90"))
+# Replacement rows count for shortages of the same customer up to this many delivery days earlier
+GRAPH_MAX_LAG_DAYS = int(os.getenv("SUBSTITUTION_GRAPH_MAX_LAG_DAYS", "1"))
+GRAPH_CHUNK_ROWS = int(os.getenv("SUBSTITUTION_GRAPH_CHUNK_ROWS", "500000"))
+_META_FILE = "meta.json"
+
+_KEY_COLUMNS = ["customer_number", "product_code", "requested_delivery_date"]
+
+
+class GraphNeighbor(NamedTuple):
+    code: str
+    count: int
+    weight: float
+    # Observations for the customer passed to neighbors(); 0 when none was passed
+    customer_count: int
+
+
+def _key_frame(chunk: pd.DataFrame) -> pd.DataFrame:
+    out = pd.DataFrame(
+        {
+            "customer": chunk["customer_number"].astype("string").str.strip(),
+            "code": chunk["product_code"].astype("string").str.strip(),
+            "date": chunk["requested_delivery_date"],
+        }
+    )
+    return out.dropna()
+
+
+def collect_shortages(sales_csv: Path, chunksize: int = GRAPH_CHUNK_ROWS) -> pd.DataFrame:
+    """
+    Distinct (customer, code, date) of sales rows delivered short, read chunk by chunk so only the
+    shortages of the multi-million-row file are ever held in memory.
+    """
+    parts: List[pd.DataFrame] = []
+    usecols = _KEY_COLUMNS + ["order_qty", "delivered_qty"]
+    for chunk in load_sales_deliveries_csv(sales_csv, usecols=usecols, chunksize=chunksize):
+        short = chunk[chunk["delivered_qty"].fillna(0.0) < chunk["order_qty"]]
+        if len(short):
+            parts.append(_key_frame(short).drop_duplicates())
+    if not parts:
+        return pd.DataFrame(columns=["customer", "code", "date"])
+    return pd.concat(parts, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def collect_replacements(replacements_csv: Path, chunksize: int = GRAPH_CHUNK_ROWS) -> pd.DataFrame:
+    parts = [
+        _key_frame(chunk)
+        for chunk in load_replacement_orders_csv(replacements_csv, usecols=_KEY_COLUMNS, chunksize=chunksize)
+    ]
+    if not parts:
+        return pd.DataFrame(columns=["customer", "code", "date"])
+    return pd.concat(parts, ignore_index=True)
+
+
+def join_shortages(shortages: pd.DataFrame, replacements: pd.DataFrame, max_lag_days: int = GRAPH_MAX_LAG_DAYS) -> pd.DataFrame:
+    """
+    (orig, repl, customer, date) observations: a replacement row follows a shortage of a different product
+    for the same customer with a delivery date 0..max_lag_days later. Replacement orders carry their own
+    order numbers, so customer and delivery date are the join keys.
+    """
+    pairs: List[pd.DataFrame] = []
+    for lag in range(max_lag_days + 1):
+        shifted = shortages.assign(date=shortages["date"] + pd.Timedelta(days=lag))
+        merged = shifted.merge(replacements, on=["customer", "date"], suffixes=("_orig", "_repl"))
+        pairs.append(merged)
+    joined = pd.concat(pairs, ignore_index=True)
+    joined = joined[joined["code_orig"] != joined["code_repl"]]
+    # A replacement within the window of several lags is one observation
+    joined = joined.drop_duplicates(["customer", "code_orig", "code_repl", "date"], ignore_index=True)
+    return joined.rename(columns={"code_orig": "orig", "code_repl": "repl"})[["orig", "repl", "customer", "date"]]
+
+
+@dataclass(frozen=True)
+class SubstitutionGraph:
+    """
+    Weighted original -> replacement graph over product codes, stored as CSR arrays.
+    Row i lists the replacements observed for codes[i], best (highest decayed weight) first, so
+    neighbors() touches only that row. Per-customer counts form a second CSR of edges x customers.
+    """
+
+    codes: List[str]
+    indptr: np.ndarray
+    indices: np.ndarray
+    counts: np.ndarray
+    weights: np.ndarray
+    customers: List[str]
+    customer_indptr: np.ndarray
+    customer_ids: np.ndarray
+    customer_counts: np.ndarray
+    _code_index: Dict[str, int] = field(init=False, repr=False, compare=False)
+    _customer_index: Dict[str, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "_code_index", {c: i for i, c in enumerate(self.codes)})
+        object.__setattr__(self, "_customer_index", {c: i for i, c in enumerate(self.customers)})
+
+    @property
+    def edges(self) -> int:
+        return int(len(self.indices))
+
+    def weight_matrix(self) -> sparse.csr_matrix:
+        n = len(self.codes)
+        return sparse.csr_matrix((self.weights, self.indices, self.indptr), shape=(n, n))
+
+    def _customer_count(self, edge: int, customer: int) -> int:
+        start, end = int(self.customer_indptr[edge]), int(self.customer_indptr[edge + 1])
+        i = start + int(np.searchsorted(self.customer_ids[start:end], customer))
+        if i < end and int(self.customer_ids[i]) == customer:
+            return int(self.customer_counts[i])
+        return 0
+
+    def neighbors(self, code: str, limit: Optional[int] = None, customer: Optional[str] = None) -> List[GraphNeighbor]:
+        row = self._code_index.get(code)
+        if row is None:
+            return []
+        start, end = int(self.indptr[row]), int(self.indptr[row + 1])
+        if limit is not None:
+            end = min(end, start + max(limit, 0))
+        cust = self._customer_index.get(customer) if customer is not None else None
+        return [
+            GraphNeighbor(
+                self.codes[int(self.indices[e])],
+                int(self.counts[e]),
+                float(self.weights[e]),
+                self._customer_count(e, cust) if cust is not None else 0,
+            )
+            for e in range(start, end)
+        ]
+
+
+def build_substitution_graph(observations: pd.DataFrame, half_life_days: float = GRAPH_HALF_LIFE_DAYS) -> SubstitutionGraph:
+    """
+    Aggregate (orig, repl, customer, date) observations into the graph: counts, weights decayed
+    by age relative to the newest observation, and counts per customer.
+    """
+    obs = observations
+    codes = sorted(set(obs["orig"]).union(obs["repl"]))
+    customers = sorted(set(obs["customer"]))
+    code_index = {c: i for i, c in enumerate(codes)}
+    customer_index = {c: i for i, c in enumerate(customers)}
+    if len(obs):
+        age = (obs["date"].max() - obs["date"]).dt.days.to_numpy(dtype=np.float64)
+        decay = np.power(0.5, age / half_life_days) if half_life_days > 0 else np.ones(len(obs))
+    else:
+        decay = np.empty(0)
+    obs = pd.DataFrame(
+        {
+            "orig": obs["orig"].map(code_index).to_numpy(dtype=np.int64),
+            "repl": obs["repl"].map(code_index).to_numpy(dtype=np.int64),
+            "customer": obs["customer"].map(customer_index).to_numpy(dtype=np.int64),
+            "decay": decay,
+        }
+    )
+    edges = obs.groupby(["orig", "repl"], sort=False).agg(count=("decay", "size"), weight=("decay", "sum")).reset_index()
+    # Rows in code order, best neighbors first (ties by code for determinism)
+    edges = edges.sort_values(["orig", "weight", "repl"], ascending=[True, False, True], ignore_index=True)
+    per_customer = obs.groupby(["orig", "repl", "customer"]).size().rename("count").reset_index()
+    edge_ids = edges[["orig", "repl"]].assign(edge=np.arange(len(edges)))
+    per_customer = per_customer.merge(edge_ids, on=["orig", "repl"]).sort_values(["edge", "customer"], ignore_index=True)
+
+    indptr = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges["orig"].to_numpy(), minlength=len(codes)), out=indptr[1:])
+    customer_indptr = np.zeros(len(edges) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(per_customer["edge"].to_numpy(), minlength=len(edges)), out=customer_indptr[1:])
+    return SubstitutionGraph(
+        codes=codes,
+        indptr=indptr,
+        indices=edges["repl"].to_numpy(dtype=np.int32),
+        counts=edges["count"].to_numpy(dtype=np.int32),
+        weights=edges["weight"].to_numpy(dtype=np.float32),
+        customers=customers,
+        customer_indptr=customer_indptr,
+        customer_ids=per_customer["customer"].to_numpy(dtype=np.int32),
+        customer_counts=per_customer["count"].to_numpy(dtype=np.int32),
+    )
+
+
+def graph_dir(cache_dir: Optional[Path] = None) -> Path:
+    return Path(cache_dir or catalog_cache_dir()) / "substitution_graph"
+
+
+_ARRAYS = ("indptr", "indices", "counts", "weights", "customer_indptr", "customer_ids", "customer_counts")
+
+
+def write_substitution_graph(graph: SubstitutionGraph, meta: Dict[str, Any], cache_dir: Optional[Path] = None) -> Path:
+    target = graph_dir(cache_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".staging-graph-", dir=target.parent))
+    try:
+        for name in _ARRAYS:
+            np.save(staging / f"{name}.npy", getattr(graph, name))
+        StringTable.write(staging / "codes", graph.codes)
+        StringTable.write(staging / "customers", graph.customers)
+        full_meta = dict(meta, format=GRAPH_FORMAT_VERSION, nodes=len(graph.codes), edges=graph.edges)
+        (staging / _META_FILE).write_text(json.dumps(full_meta, indent=2), encoding="utf-8")
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def load_substitution_graph(cache_dir: Optional[Path] = None) -> Optional[SubstitutionGraph]:
+    """
+    Memory-map a built graph, or None if there is none (the builder is an offline job).
+    """
+    root = graph_dir(cache_dir)
+    try:
+        meta = json.loads((root / _META_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != GRAPH_FORMAT_VERSION:
+        logger.warning("Ignoring substitution graph with unknown format at %s", root)
+        return None
+    arrays = {name: np.load(root / f"{name}.npy", mmap_mode="r") for name in _ARRAYS}
+    return SubstitutionGraph(
+        codes=StringTable.open(root / "codes").to_list(),
+        customers=StringTable.open(root / "customers").to_list(),
+        **arrays,
+    )
+
+
+@catalog_cached
+def product_substitution_graph() -> Optional[SubstitutionGraph]:
+    return load_substitution_graph()
+
+
+def main() -> None:
+    # Ensure repo root is on sys.path so `services.*` imports work
+    repo_root = Path(__file__).resolve().parents[2]
+    if str(repo_root) not in sys.path:
+        sys.path.insert(0, str(repo_root))
+    parser = argparse.ArgumentParser(description="Mine the original -> replacement graph from sales and replacement history.")
+    parser.add_argument("--half-life-days", type=float, default=GRAPH_HALF_LIFE_DAYS)
+    parser.add_argument("--max-lag-days", type=int, default=GRAPH_MAX_LAG_DAYS)
+    parser.add_argument("--chunksize", type=int, default=GRAPH_CHUNK_ROWS, help="CSV rows per chunk")
+    parser.add_argument("--cache-dir", type=str, default=None, help="Output directory (default: VALIO_CACHE_DIR)")
+    args = parser.parse_args()
+
+    sales = _resolve_path(None, DEFAULT_SALES_DELIVERIES_CSV)
+    replacements = _resolve_path(None, DEFAULT_REPLACEMENTS_CSV)
+    observations = join_shortages(
+        collect_shortages(sales, args.chunksize),
+        collect_replacements(replacements, args.chunksize),
+        args.max_lag_days,
+    )
+    graph = build_substitution_graph(observations, args.half_life_days)
+    meta = {
+        "sales_key": source_key(sales),
+        "replacements_key": source_key(replacements),
+        "half_life_days": args.half_life_days,
+        "max_lag_days": args.max_lag_days,
+    }
+    out = write_substitution_graph(graph, meta, Path(args.cache_dir) if args.cache_dir else None)
+    print(f"[graph] {len(graph.codes)} codes, {graph.edges} edges from {len(observations)} observations -> {out}")
+
+
+if __name__ == "__main__":
+    main()
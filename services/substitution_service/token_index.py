@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from .catalog_version import catalog_cached
+from .feature_store import ProductFeatureStore, product_feature_store
+
+
+@dataclass(frozen=True)
+class InvertedTokenIndex:
+    """
+    token -> product positions postings over the feature store's name tokens.
+    Queries touch only the postings of the query tokens instead of scanning the catalog.
+    """
+
+    vocabulary: Mapping[str, int]
+    indptr: np.ndarray
+    positions: np.ndarray
+    token_counts: np.ndarray
+    has_gtin: np.ndarray
+
+    def jaccard(self, tokens: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (positions, jaccard) for every product sharing at least one token with the query,
+        positions in ascending order. Products without a GTIN are skipped.
+        """
+        query = set(tokens)
+        cols = [self.vocabulary[t] for t in query if t in self.vocabulary]
+        if not cols:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        hits = np.concatenate([self.positions[self.indptr[c]: self.indptr[c + 1]] for c in cols])
+        pos, inter = np.unique(hits, return_counts=True)
+        keep = self.has_gtin[pos]
+        pos, inter = pos[keep], inter[keep].astype(np.float64)
+        union = len(query) + self.token_counts[pos] - inter
+        return pos, inter / union
+
+    def best(self, tokens: Iterable[str], min_score: float = 0.0) -> Optional[Tuple[int, float]]:
+        """
+        Highest-Jaccard product (lowest position on ties), or None below min_score.
+        """
+        pos, scores = self.jaccard(tokens)
+        if len(pos) == 0:
+            return None
+        i = int(np.argmax(scores))
+        if scores[i] < min_score:
+            return None
+        return int(pos[i]), float(scores[i])
+
+    def top_k(self, tokens: Iterable[str], k: int, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """
+        Up to k (position, jaccard) pairs ranked by Jaccard, ties by position.
+        """
+        pos, scores = self.jaccard(tokens)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(int(pos[i]), float(scores[i])) for i in order if scores[i] >= min_score]
+
+
+def build_token_index(store: ProductFeatureStore) -> InvertedTokenIndex:
+    postings = store.token_matrix.tocsc()
+    postings.sort_indices()
+    return InvertedTokenIndex(
+        vocabulary=store.token_vocabulary,
+        indptr=postings.indptr,
+        positions=postings.indices,
+        token_counts=store.token_counts.astype(np.float64),
+        has_gtin=np.asarray([bool(g) for g in store.gtins], dtype=bool),
+    )
+
+
+@catalog_cached
+def product_token_index() -> InvertedTokenIndex:
+    return build_token_index(product_feature_store())
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from .catalog_cache import source_key
+from .catalog_version import catalog_cached
+from .data_loaders import DEFAULT_PRODUCT_JSON, _resolve_path, catalog_cache_dir
+from .feature_store import ProductFeatureStore, pair_feature_matrix, product_feature_store
+from .popularity import PopularityTable, popularity_meta, product_popularity
+
+logger = logging.getLogger(__name__)
+
+TOPK_FORMAT_VERSION = 1
+DEFAULT_TOP_N = int(os.getenv("SUBSTITUTION_TOPK_N", "50"))
+# Serve suggestions from the precomputed table when a fresh one exists
+TOPK_TABLE_ENABLED = bool(int(os.getenv("SUBSTITUTION_TOPK_TABLE", "1")))
+_META_FILE = "meta.json"
+
+
+@dataclass(frozen=True)
+class TopKTable:
+    """
+    Precomputed same-category ranking per product, aligned with product_data_df() row positions.
+    positions[i] holds the best candidate positions for product i (-1 padded), scores[i] their scores,
+    and pool_sizes[i] how many candidates were ranked, so a row is complete when pool_sizes[i] <= top_n.
+    """
+
+    positions: np.ndarray
+    scores: np.ndarray
+    pool_sizes: np.ndarray
+
+    @property
+    def top_n(self) -> int:
+        return int(self.positions.shape[1])
+
+    def __len__(self) -> int:
+        return int(self.positions.shape[0])
+
+    def row(self, pos: int) -> Tuple[np.ndarray, np.ndarray, bool]:
+        """
+        (candidate positions, scores, complete) for one product, best first.
+        """
+        count = min(int(self.pool_sizes[pos]), self.top_n)
+        return self.positions[pos, :count], self.scores[pos, :count], int(self.pool_sizes[pos]) <= self.top_n
+
+
+def build_topk_table(
+    store: ProductFeatureStore,
+    score_fn: Callable[[np.ndarray], np.ndarray],
+    top_n: int = DEFAULT_TOP_N,
+    popularity: Optional[PopularityTable] = None,
+) -> TopKTable:
+    """
+    Score every product against its whole category (same GTIN excluded) and keep the best top_n.
+    Ties keep category order, matching the live ranking.
+    """
+    n = len(store)
+    positions = np.full((n, top_n), -1, dtype=np.int32)
+    scores = np.zeros((n, top_n), dtype=np.float32)
+    pool_sizes = np.zeros(n, dtype=np.int32)
+    for members in store.category_members.values():
+        for orig in members:
+            orig_gtin = store.gtins[orig]
+            if not orig_gtin:
+                continue
+            pool = np.asarray([p for p in members if store.gtins[p] and store.gtins[p] != orig_gtin], dtype=np.int64)
+            pool_sizes[orig] = len(pool)
+            if not len(pool):
+                continue
+            pool_scores = score_fn(pair_feature_matrix(store, int(orig), pool, popularity))
+            order = np.argsort(-pool_scores, kind="stable")[:top_n]
+            positions[orig, : len(order)] = pool[order]
+            scores[orig, : len(order)] = pool_scores[order]
+    return TopKTable(positions, scores, pool_sizes)
+
+
+def topk_table_dir(cache_dir: Optional[Path] = None) -> Path:
+    return Path(cache_dir or catalog_cache_dir()) / "topk"
+
+
+def catalog_key() -> str:
+    return source_key(_resolve_path(None, DEFAULT_PRODUCT_JSON))
+
+
+def write_topk_table(table: TopKTable, meta: Dict[str, Any], cache_dir: Optional[Path] = None) -> Path:
+    """
+    Write the table as .npy files plus meta.json; staged and renamed so readers never see a partial table.
+    """
+    target = topk_table_dir(cache_dir)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".staging-topk-", dir=target.parent))
+    try:
+        np.save(staging / "positions.npy", table.positions)
+        np.save(staging / "scores.npy", table.scores)
+        np.save(staging / "pool_sizes.npy", table.pool_sizes)
+        full_meta = dict(meta, format=TOPK_FORMAT_VERSION, rows=len(table), top_n=table.top_n)
+        (staging / _META_FILE).write_text(json.dumps(full_meta, indent=2), encoding="utf-8")
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def load_topk_table(expected_meta: Dict[str, Any], cache_dir: Optional[Path] = None) -> Optional[TopKTable]:
+    """
+    Memory-map the table if it exists and was built for the same catalog and weights, else None.
+    """
+    root = topk_table_dir(cache_dir)
+    try:
+        meta = json.loads((root / _META_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != TOPK_FORMAT_VERSION or any(meta.get(k) != v for k, v in expected_meta.items()):
+        logger.warning("Ignoring stale top-k table at %s", root)
+        return None
+    return TopKTable(
+        positions=np.load(root / "positions.npy", mmap_mode="r"),
+        scores=np.load(root / "scores.npy", mmap_mode="r"),
+        pool_sizes=np.load(root / "pool_sizes.npy", mmap_mode="r"),
+    )
+
+
+def table_meta(weights: Dict[str, float]) -> Dict[str, Any]:
+    return {
+        "catalog_key": catalog_key(),
+        "catalog_rows": len(product_feature_store()),
+        "weights": {k: float(v) for k, v in sorted(weights.items())},
+        # Scores include the popularity priors, so the table goes stale with the replacement history
+        "popularity": popularity_meta() if product_popularity() is not None else None,
+    }
+
+
+@catalog_cached
+def product_topk_table() -> Optional[TopKTable]:
+    """
+    Table for the current catalog and HEURISTIC_WEIGHTS, or None when disabled, missing or stale.
+    """
+    if not TOPK_TABLE_ENABLED:
+        return None
+    from .candidates import HEURISTIC_WEIGHTS
+
+    return load_topk_table(table_meta(HEURISTIC_WEIGHTS))
+
+
+def main() -> None:
+    # Ensure repo root is on sys.path so `services.*` imports work
+    repo_root = Path(__file__).resolve().parents[2]
+    if str(repo_root) not in sys.path:
+        sys.path.insert(0, str(repo_root))
+    from services.substitution_service.candidates import HEURISTIC_WEIGHTS, heuristic_scores
+
+    parser = argparse.ArgumentParser(description="Precompute the top-N substitute table for every catalog GTIN.")
+    parser.add_argument("--top-n", type=int, default=DEFAULT_TOP_N, help="Candidates kept per product")
+    parser.add_argument("--cache-dir", type=str, default=None, help="Output directory (default: VALIO_CACHE_DIR)")
+    args = parser.parse_args()
+
+    table = build_topk_table(product_feature_store(), heuristic_scores, top_n=args.top_n, popularity=product_popularity())
+    out = write_topk_table(table, table_meta(HEURISTIC_WEIGHTS), Path(args.cache_dir) if args.cache_dir else None)
+    print(f"[topk] Wrote {len(table)} rows x top {table.top_n} to {out}")
+
+
+if __name__ == "__main__":
+    main()
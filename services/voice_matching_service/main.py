@@ -10,7 +10,6 @@ import psycopg
 import requests
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field, ConfigDict
-from psycopg.rows import dict_row
 
 try:  # Optional direct import when running inside the monorepo
     from NLU.app import parse_single_text as _local_parse_single_text  # type: ignore
@@ -20,11 +19,15 @@ except Exception:  # pragma: no cover - fallback to HTTP only
 try:
     from services.substitution_service.availability import (  # type: ignore
         get_line_ids_for_gtins,
-        get_db_conninfo,
+    )
+    from services.substitution_service.db_pool import (  # type: ignore
+        pool_stats,
+        warehouse_connection,
     )
 except Exception:  # pragma: no cover - DB lookup is optional
     get_line_ids_for_gtins = None
-    get_db_conninfo = None
+    pool_stats = None
+    warehouse_connection = None
 
 logger = logging.getLogger("voice-matching-service")
 logging.basicConfig(
@@ -349,7 +352,7 @@ class OrderMatcher:
 def _fetch_warehouse_items_by_name(
     name: str, max_candidates: int = 100
 ) -> List[Dict[str, Any]]:
-    if get_db_conninfo is None:
+    if warehouse_connection is None:
         raise HTTPException(
             status_code=503, detail="Warehouse DB connection is not configured"
         )
@@ -372,9 +375,8 @@ def _fetch_warehouse_items_by_name(
     """
     params.append(max_candidates)
 
-    conninfo = get_db_conninfo()
     try:
-        with psycopg.connect(conninfo, row_factory=dict_row) as conn:
+        with warehouse_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(query, params)
                 return cur.fetchall()
@@ -418,6 +420,7 @@ def health() -> Dict[str, Any]:
         "status": "ok",
         "nlu_backend": "remote" if nlu_client.base_url else "in-process",
         "items_supported": True,
+        "db_pool": pool_stats() if pool_stats is not None else None,
     }
 
 
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import json
 import sys
 from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
 
 # Ensure repository root is on sys.path for imports like `services.substitution_service.*`
 REPO_ROOT = Path(__file__).resolve().parents[1]
@@ -9,3 +13,69 @@ if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
 
+def _product(
+    gtin: str,
+    category: str,
+    names: List[str],
+    vendor: str = "Test Vendor",
+    size: float = 1.0,
+    temperature: float = 4.0,
+    allergens: List[str] = (),
+    free_from: List[str] = (),
+) -> Dict[str, Any]:
+    classifications: List[Dict[str, Any]] = []
+    if allergens:
+        classifications.append(
+            {"name": "allergen", "values": [{"id": a, "unit": "CONTAINS"} for a in allergens]}
+        )
+    if free_from:
+        classifications.append(
+            {"name": "nonAllergen", "values": [{"id": a, "unit": "FREE_FROM"} for a in free_from]}
+        )
+    return {
+        "salesUnitGtin": gtin,
+        "salesUnit": "ST",
+        "category": category,
+        "allowedLotSize": size,
+        "temperatureCondition": temperature,
+        "vendorName": vendor,
+        "synkkaData": {
+            "gtin": gtin,
+            "names": [{"value": n, "language": lang} for n, lang in zip(names, ("en", "fi", "sv"))],
+        },
+        "units": [{"unitId": "ST", "sizeInBaseUnits": size}],
+        "classifications": classifications,
+    }
+
+
+SYNTHETIC_PRODUCTS: List[Dict[str, Any]] = [
+    _product("6400000000011", "100", ["Lactose free milk 1l", "Laktoositon maito 1l"], free_from=["LACTOSE"]),
+    _product("6400000000028", "100", ["Milk 1l", "Maito 1l"], allergens=["MILK", "LACTOSE"]),
+    _product("6400000000035", "100", ["Lactose free milk 2l", "Laktoositon maito 2l"], size=2.0, free_from=["LACTOSE"]),
+    _product("6400000000042", "100", ["Oat drink 1l", "Kaurajuoma 1l"], vendor="Oat Vendor", free_from=["LACTOSE", "MILK"]),
+    _product("6400000000059", "100", ["Skimmed milk 1l", "Rasvaton maito 1l"], allergens=["MILK"], temperature=6.0),
+    _product("6400000000066", "200", ["Rye bread 500g", "Ruisleipä 500g"], vendor="Bakery", temperature=20.0, allergens=["RYE"]),
+    _product("6400000000073", "200", ["Wheat bread 500g", "Vehnäleipä 500g"], vendor="Bakery", temperature=20.0, allergens=["WHEAT"]),
+    _product("6400000000080", "200", ["Rye crisp bread 250g", "Ruisnäkkileipä 250g"], vendor="Bakery", size=0.5, temperature=20.0, allergens=["RYE"]),
+]
+
+
+def _clear_catalog_caches() -> None:
+    from services.substitution_service import candidates, catalog_version, response_cache
+
+    # A fresh catalog version drops every per-version structure (DataFrame, indexes, feature store, ...)
+    catalog_version.reset_catalog()
+    candidates._lookup_gtin_by_tokens.cache_clear()
+    response_cache.invalidate_response_cache()
+
+
+@pytest.fixture
+def synthetic_catalog(tmp_path, monkeypatch):
+    """Point the data loaders at a small in-repo catalog instead of the full LFS dataset."""
+    from services.substitution_service.data_loaders import DEFAULT_PRODUCT_JSON
+
+    (tmp_path / DEFAULT_PRODUCT_JSON).write_text(json.dumps(SYNTHETIC_PRODUCTS), encoding="utf-8")
+    monkeypatch.setenv("VALIO_DATA_DIR", str(tmp_path))
+    _clear_catalog_caches()
+    yield SYNTHETIC_PRODUCTS
+    _clear_catalog_caches()
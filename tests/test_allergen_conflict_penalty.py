@@ -69,3 +69,27 @@ def test_allergen_conflict_reduces_score():
     assert (score_ok - score_conflict) >= 0.9
 
 
+def test_allergen_masks_are_bitwise_encodings():
+    from services.substitution_service.features import (
+        allergen_conflict_from_masks,
+        diet_compatible_from_masks,
+        encode_allergen_mask,
+        extract_allergen_masks,
+    )
+
+    product = _base_product()
+    product["classifications"] = [
+        {"name": "allergen", "values": [{"id": "MILK", "unit": "CONTAINS"}]},
+        {"name": "nonAllergen", "values": [{"id": "GLUTEN", "unit": "FREE_FROM"}]},
+    ]
+    contains, free_from = extract_allergen_masks(product)
+    assert contains == encode_allergen_mask(["MILK"])
+    assert free_from == encode_allergen_mask(["GLUTEN"])
+    assert contains & free_from == 0
+
+    lactose_free = encode_allergen_mask(["LACTOSE"])
+    assert allergen_conflict_from_masks(lactose_free, encode_allergen_mask(["LACTOSE", "MILK"])) == 1
+    assert allergen_conflict_from_masks(lactose_free, contains) == 0
+    assert diet_compatible_from_masks(lactose_free, encode_allergen_mask(["LACTOSE", "GLUTEN"])) == 1
+    assert diet_compatible_from_masks(lactose_free, free_from) == 0
+    assert diet_compatible_from_masks(0, 0) == 1
@@ -8,7 +8,7 @@ from psycopg.rows import dict_row
 from fastapi.testclient import TestClient
 import random
 
-from services.substitution_service.availability import get_db_conninfo
+from services.substitution_service.availability import get_db_conninfo, invalidate_availability_cache
 from services.substitution_service.data_loaders import product_data_df
 from services.substitution_service.candidates import _normalize_id
 from services.substitution_service.main import app
@@ -69,6 +69,8 @@ def _upsert_item(code: str, qty: float) -> None:
                 (line_id, code, f"Test {code}", qty, "ST"),
             )
         conn.commit()
+    # Don't wait for the change feed to drop the cached row
+    invalidate_availability_cache([code])
 
 
 def test_api_filters_by_db_availability():
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, List
+
+from services.substitution_service.availability import AvailabilityCache, WarehouseItem
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cache(stock: Dict[str, WarehouseItem], calls: List[List[str]], clock: _Clock, ttl: float = 10.0):
+    def fetch(codes: List[str]) -> Dict[str, WarehouseItem]:
+        calls.append(sorted(codes))
+        return {c: stock[c] for c in codes if c in stock}
+
+    return AvailabilityCache(fetch, ttl_seconds=ttl, clock=clock)
+
+
+def test_bulk_refresh_only_fetches_missing_codes():
+    stock = {"a": WarehouseItem(1, 5.0, "ST"), "b": WarehouseItem(2, 0.0, "ST")}
+    calls: List[List[str]] = []
+    cache = _cache(stock, calls, _Clock())
+
+    assert cache.get_many(["a", "missing"]) == {"a": stock["a"]}
+    assert cache.get_many(["a", "b", "missing"]) == {"a": stock["a"], "b": stock["b"]}
+    # "missing" was cached as absent, so only "b" needed a second query
+    assert calls == [["a", "missing"], ["b"]]
+    assert cache.stats()["hits"] == 2
+
+
+def test_entries_expire_after_ttl():
+    stock = {"a": WarehouseItem(1, 5.0, "ST")}
+    calls: List[List[str]] = []
+    clock = _Clock()
+    cache = _cache(stock, calls, clock, ttl=10.0)
+
+    cache.get_many(["a"])
+    clock.now = 9.0
+    cache.get_many(["a"])
+    stock["a"] = WarehouseItem(1, 1.0, "ST")
+    clock.now = 10.5
+    assert cache.get_many(["a"])["a"].qty == 1.0
+    assert len(calls) == 2
+
+
+def test_invalidate_drops_codes_and_in_flight_refreshes():
+    stock = {"a": WarehouseItem(1, 5.0, "ST"), "b": WarehouseItem(2, 3.0, "ST")}
+    calls: List[List[str]] = []
+    cache = _cache(stock, calls, _Clock())
+    cache.get_many(["a", "b"])
+
+    stock["a"] = WarehouseItem(1, 4.0, "ST")
+    cache.invalidate(["a"])
+    assert cache.get_many(["a", "b"])["a"].qty == 4.0
+    assert calls[-1] == ["a"]
+
+    # A notification arriving while "a" is being fetched must not let the fetched row be cached
+    def racing_fetch(codes: List[str]) -> Dict[str, WarehouseItem]:
+        calls.append(sorted(codes))
+        cache.invalidate(["a"])
+        return {c: stock[c] for c in codes}
+
+    cache._fetch = racing_fetch
+    cache.invalidate(["a"])
+    cache.get_many(["a"])
+    cache.get_many(["a"])
+    assert calls[-2:] == [["a"], ["a"]]
+
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+
+
+def test_async_lookup_shares_entries_with_sync_lookup():
+    stock = {"a": WarehouseItem(1, 5.0, "ST"), "b": WarehouseItem(2, 3.0, "ST")}
+    calls: List[List[str]] = []
+    cache = _cache(stock, calls, _Clock())
+    cache.get_many(["a"])
+
+    async def fetch_async(codes: List[str]) -> Dict[str, WarehouseItem]:
+        calls.append(["async"] + sorted(codes))
+        return {c: stock[c] for c in codes if c in stock}
+
+    assert asyncio.run(cache.get_many_async(["a", "b"], fetch_async)) == stock
+    assert calls == [["a"], ["async", "b"]]
+    assert cache.get_many(["a", "b"]) == stock
+    assert len(calls) == 2
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List
+
+from fastapi.testclient import TestClient
+
+from services.substitution_service import availability, main
+
+
+def _fake_stock(calls: List[List[str]], line_ids: Dict[str, int], qty: Dict[str, float]):
+    async def fake_items(gtins: Iterable[str]) -> Dict[str, availability.WarehouseItem]:
+        codes = sorted(gtins)
+        calls.append(codes)
+        return {g: availability.WarehouseItem(line_ids[g], qty.get(g, 10.0), "ST") for g in codes if g in line_ids}
+
+    return fake_items
+
+
+def test_batch_endpoint_uses_one_warehouse_query(synthetic_catalog, monkeypatch):
+    calls: List[List[str]] = []
+    line_ids = {p["salesUnitGtin"]: 1000 + i for i, p in enumerate(synthetic_catalog)}
+    del line_ids["6400000000035"]  # not stocked
+    monkeypatch.setattr(main, "get_warehouse_items_for_gtins_async", _fake_stock(calls, line_ids, {}))
+
+    client = TestClient(main.app)
+    resp = client.post(
+        "/substitution/suggest/batch",
+        json={
+            "items": [
+                {"lineId": 1, "productCode": "6400000000011", "qty": 2},
+                {"lineId": 2, "productCode": "6400000000066", "qty": 20},
+                {"lineId": 3, "productCode": "unknown", "qty": 1},
+            ]
+        },
+    )
+    assert resp.status_code == 200, resp.text
+    results = resp.json()["results"]
+    assert [r["lineId"] for r in results] == [1, 2, 3]
+    assert len(calls) == 1
+    # The union covers both categories' pools
+    assert "6400000000028" in calls[0]
+    assert "6400000000073" in calls[0]
+
+    dairy = results[0]["suggestedLineIds"]
+    assert dairy
+    assert line_ids["6400000000011"] not in dairy
+    assert results[1]["suggestedLineIds"] == []  # qty 20 exceeds stock of 10
+    assert results[2]["suggestedLineIds"] == []
+
+
+def test_single_line_endpoint_uses_one_warehouse_query(synthetic_catalog, monkeypatch):
+    calls: List[List[str]] = []
+    line_ids = {p["salesUnitGtin"]: 2000 + i for i, p in enumerate(synthetic_catalog)}
+    monkeypatch.setattr(
+        main, "get_warehouse_items_for_gtins_async", _fake_stock(calls, line_ids, {"6400000000028": 0.0})
+    )
+
+    resp = TestClient(main.app).post(
+        "/substitution/suggest", json={"lineId": 5, "productCode": "6400000000011", "qty": 1}
+    )
+    assert resp.status_code == 200, resp.text
+    assert len(calls) == 1
+    body = resp.json()
+    assert body["lineId"] == 5
+    assert body["suggestedLineIds"] and line_ids["6400000000028"] not in body["suggestedLineIds"]
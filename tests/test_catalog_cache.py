@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+
+import pandas as pd
+
+from services.substitution_service.catalog_cache import (
+    load_catalog_snapshot,
+    read_snapshot_meta,
+    write_catalog_snapshot,
+)
+from services.substitution_service.data_loaders import (
+    DEFAULT_PRODUCT_JSON,
+    catalog_cache_dir,
+    load_product_data_json,
+)
+
+
+def test_snapshot_roundtrip_matches_json(synthetic_catalog, tmp_path):
+    source = tmp_path / DEFAULT_PRODUCT_JSON
+    expected = pd.read_json(source)
+    first = load_product_data_json()  # parses JSON and writes the snapshot
+    assert read_snapshot_meta(source, catalog_cache_dir()) is not None
+
+    cached = load_catalog_snapshot(source, catalog_cache_dir())
+    assert cached is not None
+    assert list(cached.columns) == list(expected.columns)
+    assert cached.to_dict("records") == expected.to_dict("records")
+    assert load_product_data_json().to_dict("records") == first.to_dict("records")
+
+
+def test_snapshot_projection_and_staleness(tmp_path):
+    source = tmp_path / "catalog.json"
+    source.write_text(json.dumps([{"a": 1, "b": "x", "c": {"n": [1, 2]}}, {"a": 2, "b": None, "c": None}]))
+    cache = tmp_path / "cache"
+    write_catalog_snapshot(pd.read_json(source), source, cache)
+
+    projected = load_catalog_snapshot(source, cache, usecols=["b", "c"])
+    assert list(projected.columns) == ["b", "c"]
+    assert projected["b"].tolist() == ["x", None]
+    assert projected["c"].tolist()[0] == {"n": [1, 2]}
+
+    # Rewriting the source invalidates the snapshot
+    st = source.stat()
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert load_catalog_snapshot(source, cache) is None
+
+
+def _best_of(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_snapshot_loads_nested_columns_faster_than_read_json(synthetic_catalog, tmp_path):
+    source = tmp_path / "large_catalog.json"
+    rows = []
+    for i in range(12000):
+        product = json.loads(json.dumps(synthetic_catalog[i % len(synthetic_catalog)]))
+        product["salesUnitGtin"] = str(6410000000000 + i)
+        product["synkkaData"]["gtin"] = product["salesUnitGtin"]
+        rows.append(product)
+    source.write_text(json.dumps(rows), encoding="utf-8")
+    cache = tmp_path / "cache"
+    expected = pd.read_json(source)
+    write_catalog_snapshot(expected, source, cache)
+
+    assert load_catalog_snapshot(source, cache).to_dict("records") == expected.to_dict("records")
+    snapshot_s = _best_of(lambda: load_catalog_snapshot(source, cache))
+    json_s = _best_of(lambda: pd.read_json(source))
+    assert snapshot_s < json_s, (snapshot_s, json_s)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import json
+import threading
+
+from fastapi.testclient import TestClient
+
+from services.substitution_service import main
+from services.substitution_service.catalog_version import CatalogReloader, active_catalog, pinned_catalog
+from services.substitution_service.data_loaders import DEFAULT_PRODUCT_JSON, find_product_by_gtin, product_data_df
+from services.substitution_service.feature_store import product_feature_store
+from services.substitution_service.name_embeddings import product_name_index
+
+
+def _add_product(tmp_path, products, gtin):
+    extra = json.loads(json.dumps(products[0]))
+    extra["salesUnitGtin"] = gtin
+    extra["synkkaData"]["gtin"] = gtin
+    (tmp_path / DEFAULT_PRODUCT_JSON).write_text(json.dumps(products + [extra]), encoding="utf-8")
+
+
+def test_reload_builds_new_version_before_swapping(synthetic_catalog, tmp_path):
+    old = active_catalog()
+    assert len(product_feature_store()) == len(synthetic_catalog)
+
+    built_while_old_active = []
+
+    def warm():
+        built_while_old_active.append(active_catalog() is old)
+        return product_feature_store()
+
+    _add_product(tmp_path, synthetic_catalog, "6400000000097")
+    reloader = CatalogReloader(warm=[warm])
+    with pinned_catalog() as pinned:
+        assert reloader.start()
+        reloader.join()
+        # A request pinned before the swap keeps its version
+        assert pinned is old
+        assert len(product_feature_store()) == len(synthetic_catalog)
+
+    assert built_while_old_active == [True]
+    new = active_catalog()
+    assert new is not old and new.version != old.version
+    assert product_feature_store.cache_key in new.built()
+    assert len(product_feature_store()) == len(synthetic_catalog) + 1
+    assert find_product_by_gtin("6400000000097") is not None
+
+
+def test_failed_reload_keeps_active_version(synthetic_catalog, tmp_path):
+    product_data_df()
+    old = active_catalog()
+    (tmp_path / DEFAULT_PRODUCT_JSON).write_text("not json", encoding="utf-8")
+    reloader = CatalogReloader(warm=[product_data_df])
+    reloader.start()
+    reloader.join()
+    assert active_catalog() is old
+    assert reloader.last_error
+
+
+def test_admin_reload_endpoint_reports_version(synthetic_catalog, tmp_path):
+    client = TestClient(main.app)
+    before = client.get("/admin/catalog").json()["version"]
+
+    _add_product(tmp_path, synthetic_catalog, "6400000000097")
+    resp = client.post("/admin/catalog/reload", params={"wait": "true"})
+    assert resp.status_code == 202
+    body = resp.json()
+    assert body["started"] and not body["reloading"]
+    assert body["version"] != before
+    assert body["last_error"] is None
+    # Accessors used while serving are built before the swap, including the name embeddings
+    assert {product_feature_store.cache_key, product_name_index.cache_key} <= set(active_catalog().built())
+
+    stock = [{"productCode": "6400000000097", "qty": 5}]
+    debug = client.post("/substitution/suggest_debug", json={"sku": "6400000000011", "k": 5, "availability": stock})
+    assert [r["sku"] for r in debug.json()["recommendations"]] == ["6400000000097"]
+
+
+def test_concurrent_first_access_builds_once(synthetic_catalog, monkeypatch):
+    from services.substitution_service import feature_store
+
+    calls = []
+    real_build = feature_store.build_feature_store
+    monkeypatch.setattr(feature_store, "build_feature_store", lambda df: calls.append(1) or real_build(df))
+    threads = [threading.Thread(target=product_feature_store) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
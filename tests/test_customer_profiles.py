@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from services.substitution_service import customer_profiles, main
+from services.substitution_service.candidates import suggest_candidates_by_gtin
+from services.substitution_service.data_loaders import DEFAULT_REPLACEMENTS_CSV, DEFAULT_SALES_DELIVERIES_CSV
+
+LF_MILK, MILK, OAT, SKIMMED, RYE, WHEAT = (
+    "6400000000011",
+    "6400000000028",
+    "6400000000042",
+    "6400000000059",
+    "6400000000066",
+    "6400000000073",
+)
+
+
+def _write_history(tmp_path):
+    replacements = [("c1", OAT)] * 3 + [("c1", SKIMMED), ("c2", MILK), ("c2", "999")]
+    pd.DataFrame(replacements, columns=["customer_number", "product_code"]).to_csv(
+        tmp_path / DEFAULT_REPLACEMENTS_CSV, index=False
+    )
+    sales = [("c1", RYE), ("c1", RYE), ("c1", WHEAT), ("c1", OAT), ("c3", MILK)]
+    pd.DataFrame(sales, columns=["customer_number", "product_code"]).to_csv(
+        tmp_path / DEFAULT_SALES_DELIVERIES_CSV, index=False
+    )
+
+
+@pytest.fixture
+def profiles(synthetic_catalog, tmp_path):
+    _write_history(tmp_path)
+    store = customer_profiles.compute_profile_store(chunksize=2)
+    customer_profiles.write_profile_store(store, {})
+    customer_profiles.customer_profiles.cache_clear()
+    return store
+
+
+def test_profiles_aggregate_history_per_customer(profiles):
+    assert profiles.customers == ["c1", "c2", "c3"]
+    c1 = profiles.raw_profile("c1")
+    assert c1["accepted"] == pytest.approx({OAT: 1.0, SKIMMED: np.log1p(1) / np.log1p(3)})
+    assert c1["vendors"] == pytest.approx({"Bakery": 1.0, "Oat Vendor": 1 / 3})
+    assert c1["brands"] == {}
+    # Codes outside the catalog are kept as accepted replacements but never resolve to a position
+    assert set(profiles.raw_profile("c2")["accepted"]) == {MILK, "999"}
+    assert profiles.raw_profile("c3") == {"accepted": {}, "vendors": {"Test Vendor": 1.0}, "brands": {}}
+    assert profiles.raw_profile("unknown") is None
+
+    loaded = customer_profiles.load_profile_store()
+    assert loaded.customers == profiles.customers
+    assert loaded.raw_profile("c1") == c1
+
+
+def test_resolved_profiles_live_in_an_lru(profiles):
+    lookups = customer_profiles.CustomerProfiles(profiles, max_entries=1)
+    first = lookups.profile("c1")
+    assert lookups.profile("c1") is first
+    assert lookups.profile("nobody") is None
+    assert lookups.stats() == {
+        "customers": 3, "resident": 1, "max_entries": 1, "hits": 1, "misses": 2, "evictions": 1
+    }
+    assert first.positions.tolist() == [3, 4]
+    boosts = first.boosts(customer_profiles.product_feature_store(), np.asarray([0, 3, 5]))
+    assert boosts.tolist() == pytest.approx([0.0, 0.6 + 0.2 / 3, 0.2])
+
+
+def test_profile_boosts_scoring_and_api(profiles, synthetic_catalog):
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    base = {g: s for g, s, _c in suggest_candidates_by_gtin(LF_MILK, k=4, available_qty_by_code=stock)[1]}
+    for vectorized in (True, False):
+        ranked = suggest_candidates_by_gtin(
+            LF_MILK, k=4, available_qty_by_code=stock, customer_id="c1", vectorized=vectorized
+        )[1]
+        scores = {g: s for g, s, _c in ranked}
+        assert ranked[0][0] == OAT
+        assert scores[OAT] == pytest.approx(base[OAT] + 0.6 + 0.2 / 3, abs=1e-5)
+        assert scores[MILK] == pytest.approx(base[MILK], abs=1e-5)
+    unknown = suggest_candidates_by_gtin(LF_MILK, k=4, available_qty_by_code=stock, customer_id="c9")[1]
+    assert {g: s for g, s, _c in unknown} == pytest.approx(base)
+
+    client = TestClient(main.app)
+    availability = [{"productCode": g, "qty": 10} for g in stock]
+    body = {"sku": LF_MILK, "k": 4, "availability": availability}
+    plain = client.post("/substitution/suggest_debug", json=body).json()
+    boosted = client.post("/substitution/suggest_debug", json={**body, "context": {"customer_id": "c1"}}).json()
+    assert boosted["recommendations"][0]["sku"] == OAT
+    assert boosted["recommendations"] != plain["recommendations"]
+    assert client.get("/health").json()["customer_profiles"]["customers"] == 3
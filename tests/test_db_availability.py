@@ -8,7 +8,11 @@ import psycopg
 import pytest
 from psycopg.rows import dict_row
 
-from services.substitution_service.availability import get_db_conninfo, get_availability_for_gtins
+from services.substitution_service.availability import (
+    get_availability_for_gtins,
+    get_db_conninfo,
+    invalidate_availability_cache,
+)
 
 
 def _can_connect() -> bool:
@@ -48,6 +52,8 @@ def _upsert_item(code: str, qty: float) -> None:
                 (line_id, code, f"Test {code}", qty, "ST"),
             )
         conn.commit()
+    # Don't wait for the change feed to drop the cached row
+    invalidate_availability_cache([code])
 
 
 def test_get_availability_for_gtins_roundtrip():
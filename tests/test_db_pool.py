@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from fastapi.testclient import TestClient
+
+from services.substitution_service import availability, db_pool, main
+
+
+class _FakeCursor:
+    def __init__(self, rows: List[Dict[str, Any]], executed: List[Any]) -> None:
+        self._rows = rows
+        self._executed = executed
+
+    def __enter__(self) -> "_FakeCursor":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+    def execute(self, query: str, params: Any) -> None:
+        self._executed.append(list(params))
+
+    def fetchall(self) -> List[Dict[str, Any]]:
+        return self._rows
+
+
+class _FakeConnection:
+    def __init__(self, rows: List[Dict[str, Any]]) -> None:
+        self.rows = rows
+        self.executed: List[Any] = []
+
+    def cursor(self) -> _FakeCursor:
+        return _FakeCursor(self.rows, self.executed)
+
+
+def test_pool_stats_do_not_open_pool(monkeypatch):
+    monkeypatch.setattr(db_pool, "_POOL", None)
+    assert db_pool.pool_stats() == {"initialized": False}
+    assert db_pool._POOL is None
+
+
+def test_availability_borrows_pooled_connection(monkeypatch):
+    conn = _FakeConnection([{"product_code": "6400000000011", "qty": 3, "line_id": 7, "unit": "ST"}])
+    borrowed: List[int] = []
+
+    @contextmanager
+    def fake_connection():
+        borrowed.append(1)
+        yield conn
+
+    monkeypatch.setattr(availability, "warehouse_connection", fake_connection)
+    monkeypatch.setattr(availability, "AVAILABILITY_CACHE_ENABLED", False)
+    assert availability.get_availability_for_gtins(["6400000000011"]) == {"6400000000011": 3.0}
+    assert availability.get_line_ids_for_gtins(["6400000000011"]) == {"6400000000011": 7}
+    assert len(borrowed) == 2
+    assert conn.executed == [[["6400000000011"]], [["6400000000011"]]]
+
+
+def test_health_reports_pool_stats(monkeypatch):
+    monkeypatch.setattr(main, "pool_stats", lambda: {"initialized": True, "pool_size": 2})
+    resp = TestClient(main.app).get("/health")
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "ok"
+    assert resp.json()["db_pool"] == {"initialized": True, "pool_size": 2}
+
+
+def test_warehouse_items_single_round_trip(monkeypatch):
+    conn = _FakeConnection(
+        [
+            {"product_code": "6400000000011", "qty": 1, "line_id": 7, "unit": "ST"},
+            {"product_code": "6400000000011", "qty": 5, "line_id": 8, "unit": "ST"},
+            {"product_code": "6400000000028", "qty": 2, "line_id": 9, "unit": "KG"},
+        ]
+    )
+
+    @contextmanager
+    def fake_connection():
+        yield conn
+
+    monkeypatch.setattr(availability, "warehouse_connection", fake_connection)
+    monkeypatch.setattr(availability, "AVAILABILITY_CACHE_ENABLED", False)
+    items = availability.get_warehouse_items_for_gtins(["6400000000011", "6400000000028", ""])
+    assert items == {
+        "6400000000011": availability.WarehouseItem(8, 5.0, "ST"),
+        "6400000000028": availability.WarehouseItem(9, 2.0, "KG"),
+    }
+    # All codes travel as a single array parameter
+    assert len(conn.executed) == 1
+    assert sorted(conn.executed[0][0]) == ["6400000000011", "6400000000028"]
+    assert availability.get_warehouse_items_for_gtins([]) == {}
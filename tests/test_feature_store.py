@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from services.substitution_service.candidates import suggest_candidates_by_gtin
+from services.substitution_service.data_loaders import product_data_df
+from services.substitution_service.feature_store import (
+    FEATURE_NAMES,
+    pair_feature_matrix,
+    pair_features,
+    product_feature_store,
+)
+from services.substitution_service.features import compute_pair_features
+
+
+def test_store_partitions_by_category(synthetic_catalog):
+    store = product_feature_store()
+    assert len(store) == len(synthetic_catalog)
+    assert sorted(store.category_members) == ["100", "200"]
+    assert len(store.category_members["100"]) == 5
+    assert store.gtins[0] == "6400000000011"
+
+
+def test_pair_features_match_scalar_features(synthetic_catalog):
+    store = product_feature_store()
+    records = product_data_df().to_dict("records")
+    for o in range(len(records)):
+        for c in range(len(records)):
+            expected = compute_pair_features(records[o], records[c])
+            got = pair_features(store, o, c)
+            assert got.keys() == expected.keys()
+            for name, value in expected.items():
+                assert got[name] == pytest.approx(value), (o, c, name)
+
+
+def test_pair_feature_matrix_matches_pair_features(synthetic_catalog):
+    store = product_feature_store()
+    everyone = np.arange(len(store))
+    for o in range(len(store)):
+        matrix = pair_feature_matrix(store, o, everyone)
+        for c in everyone:
+            row = pair_features(store, o, int(c))
+            assert matrix[c].tolist() == pytest.approx([row[name] for name in FEATURE_NAMES]), (o, c)
+
+
+def test_vectorized_and_scalar_rankings_agree(synthetic_catalog):
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    for product in synthetic_catalog:
+        sku = product["salesUnitGtin"]
+        _, fast = suggest_candidates_by_gtin(sku, k=10, available_qty_by_code=stock, vectorized=True)
+        _, slow = suggest_candidates_by_gtin(sku, k=10, available_qty_by_code=stock, vectorized=False)
+        assert [g for g, _s, _c in fast] == [g for g, _s, _c in slow]
+        assert [s for _g, s, _c in fast] == pytest.approx([s for _g, s, _c in slow])
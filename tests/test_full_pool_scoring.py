@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from services.substitution_service import candidates
+from services.substitution_service.candidates import (
+    _prefilter_positions,
+    _stable_top_k,
+    _top_k_scalar,
+    _top_k_vectorized,
+    build_candidate_pool,
+)
+from services.substitution_service.feature_store import product_feature_store
+
+
+def test_stable_top_k_matches_stable_sort():
+    rng = np.random.RandomState(0)
+    scores = rng.randint(0, 5, size=200).astype(np.float64)
+    full = np.argsort(-scores, kind="stable")
+    for k in (1, 3, 17, 200, 500):
+        assert _stable_top_k(scores, k).tolist() == full[:k].tolist()
+
+
+def test_chunked_scoring_matches_single_pass(synthetic_catalog, monkeypatch):
+    store = product_feature_store()
+    pool = [p for p in range(len(store)) if p != 0]
+    single_fast = _top_k_vectorized(store, 0, pool, 4)
+    single_slow = _top_k_scalar(store, 0, pool, 4)
+    monkeypatch.setattr(candidates, "_SCORING_CHUNK", 2)
+    assert _top_k_vectorized(store, 0, pool, 4) == single_fast
+    assert _top_k_scalar(store, 0, pool, 4) == pytest.approx(single_slow)
+    assert [p for p, _s in single_fast] == [p for p, _s in single_slow]
+
+
+def test_budget_overrun_prefilters_the_rest_of_the_pool(synthetic_catalog, monkeypatch):
+    store = product_feature_store()
+    # Oat drink (3): the first chunk is scored in full, then rye bread (5, same size) passes the
+    # pre-filter while crisp bread (7, no shared token and half the size) is dropped
+    pool = [0, 1, 5, 7]
+    monkeypatch.setattr(candidates, "_SCORING_CHUNK", 2)
+    monkeypatch.setattr(candidates, "APPROX_SIZE_BAND", 1.5)
+    expired = 0.0  # perf_counter() is always past this deadline
+    assert {p for p, _s in _top_k_vectorized(store, 3, pool, 4, deadline=expired)} == {0, 1, 5}
+    assert {p for p, _s in _top_k_scalar(store, 3, pool, 4, deadline=expired)} == {0, 1, 5}
+    # Without a deadline the whole pool is scored
+    assert {p for p, _s in _top_k_vectorized(store, 3, pool, 4)} == {0, 1, 5, 7}
+
+
+def test_whole_category_is_scored_without_sampling(synthetic_catalog):
+    pool = build_candidate_pool("6400000000011")
+    assert not pool.approximate
+    assert len(pool.positions) == 4
+
+
+def test_approximate_mode_prefilters_large_categories(synthetic_catalog, monkeypatch):
+    monkeypatch.setattr(candidates, "APPROX_CATEGORY_SIZE", 2)
+    monkeypatch.setattr(candidates, "APPROX_RETRIEVAL", "prefilter")
+    monkeypatch.setattr(candidates, "APPROX_SIZE_BAND", 1.5)
+    store = product_feature_store()
+    assert build_candidate_pool("6400000000042", k=1).approximate
+    # Oat drink (3) vs: lactose free milk (0, shares "vendor"), rye bread (5, same size),
+    # crisp bread (7, no shared token and half the size)
+    kept = _prefilter_positions(store, 3, np.asarray([0, 5, 7]), k=1)
+    assert kept.tolist() == [0, 5]
+    # Never narrows below k
+    assert _prefilter_positions(store, 3, np.asarray([7]), k=1).tolist() == [7]
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import pandas as pd
+
+from services.substitution_service.data_loaders import (
+    _normalize_id,
+    build_gtin_index,
+    find_product_by_gtin,
+    product_gtin_index,
+)
+from services.substitution_service.candidates import suggest_candidates_by_gtin
+
+
+def test_build_gtin_index_prefers_sales_unit_gtin_and_normalizes():
+    df = pd.DataFrame(
+        [
+            {"salesUnitGtin": 6400000000011.0, "synkkaData": {"gtin": "6400000000099"}},
+            {"salesUnitGtin": None, "synkkaData": {"gtin": "6400000000011"}},
+            {"salesUnitGtin": "6400000000028", "synkkaData": None},
+        ]
+    )
+    index = build_gtin_index(df)
+    assert index["6400000000011"] == 0
+    assert index["6400000000099"] == 0
+    assert index["6400000000028"] == 2
+    assert "nan" not in index
+
+
+def test_product_gtin_index_is_read_only_and_cached(synthetic_catalog):
+    index = product_gtin_index()
+    assert index is product_gtin_index()
+    assert len(index) == len(synthetic_catalog)
+    try:
+        index["x"] = 1  # type: ignore[index]
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("GTIN index must be immutable")
+
+
+def test_find_product_by_gtin(synthetic_catalog):
+    prod = find_product_by_gtin("6400000000066.0")
+    assert prod is not None
+    assert prod["category"] == 200
+    assert find_product_by_gtin("0000000000000") is None
+
+
+def test_suggest_uses_index_lookup(synthetic_catalog):
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    orig, scored = suggest_candidates_by_gtin("6400000000011", k=2, available_qty_by_code=stock)
+    assert _normalize_id(orig["salesUnitGtin"]) == "6400000000011"
+    assert len(scored) == 2
+    assert all(gtin != "6400000000011" for gtin, _score, _cand in scored)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+from services.substitution_service import history_store
+from services.substitution_service.data_loaders import (
+    DEFAULT_PURCHASES_CSV,
+    DEFAULT_SALES_DELIVERIES_CSV,
+    load_purchases_csv,
+    load_sales_deliveries_csv,
+)
+
+SALES_CSV = """order_number,order_created_date,order_created_time,requested_delivery_date,customer_number,order_row_number,product_code,order_qty,sales_unit,delivery_number,plant,storage_location,delivered_qty,transfer_number,warehouse_number,picking_confirmed_date,picking_confirmed_time,picking_picked_qty
+32014535,2024-09-02,70832,2024-09-02,33345,10,410397,2.0,ST,21042242.0,30588.0,2012.0,2.0,32017375.0,3001.0,2024-09-02,82024.0,2.0
+32014536,2024-09-02,70818,2024-09-03,33345,20,410398,1.5,PAK,,,,,,,,,
+32014537,2024-09-03,71137,2024-09-04,40001,10,410397,4.0,ST,21042250,30588,2012,3.0,32017380,3001,2024-09-04,74027,3.0
+"""
+PURCHASES_CSV = """order_number,po_row_number,customer_number,po_created_date,requested_delivery_date,product_code,plant,storage_location,ordered_qty,unit,received_qty
+2300000000,10,30386,2024-09-01,2024-09-03,407329,1001,2011,8.0,ST,8.0
+2300000001,10,30386,2024-09-01,2024-09-03,408060,1001,2011,3.0,KG,
+"""
+
+
+@pytest.fixture
+def history_dir(tmp_path, monkeypatch):
+    (tmp_path / DEFAULT_SALES_DELIVERIES_CSV).write_text(SALES_CSV, encoding="utf-8")
+    (tmp_path / DEFAULT_PURCHASES_CSV).write_text(PURCHASES_CSV, encoding="utf-8")
+    monkeypatch.setenv("VALIO_DATA_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_sales_loader_uses_compact_types(history_dir):
+    df = load_sales_deliveries_csv()
+    assert len(df) == 3
+    assert isinstance(df["sales_unit"].dtype, pd.CategoricalDtype)
+    assert df["product_code"].tolist() == ["410397", "410398", "410397"]
+    assert df["order_qty"].dtype == "float32" and df["order_created_time"].dtype == "Int32"
+    assert df["order_number"].dtype == "Int64"
+    assert pd.api.types.is_datetime64_any_dtype(df["requested_delivery_date"])
+    # Empty cells stay missing instead of widening the column to float64/object
+    assert df["delivery_number"].tolist()[1] is pd.NA
+    assert df["delivery_number"].dtype == "Int32" and df["delivery_number"][2] == 21042250
+    assert pd.isna(df["picking_confirmed_date"][1])
+
+    purchases = load_purchases_csv()
+    assert purchases["order_number"].tolist() == [2300000000, 2300000001]
+    assert purchases["unit"].tolist() == ["ST", "KG"]
+
+
+def test_chunked_loading_and_overrides(history_dir):
+    chunks = list(load_sales_deliveries_csv(usecols=["product_code", "delivered_qty"], chunksize=2))
+    assert [len(c) for c in chunks] == [2, 1]
+    assert list(chunks[0].columns) == ["product_code", "delivered_qty"]
+
+    merged = history_store.concat_frames(chunks)
+    assert isinstance(merged["product_code"].dtype, pd.CategoricalDtype)
+    assert merged["product_code"].tolist() == ["410397", "410398", "410397"]
+
+    df = load_sales_deliveries_csv(usecols=["customer_number"], dtype={"customer_number": str})
+    assert not isinstance(df["customer_number"].dtype, pd.CategoricalDtype)
+    assert df["customer_number"].tolist() == ["33345", "33345", "40001"]
+
+
+def test_parquet_copy_is_served_while_fresh(history_dir):
+    pytest.importorskip("pyarrow")
+    source = history_dir / DEFAULT_SALES_DELIVERIES_CSV
+    cache_dir = history_dir / ".cache"
+    out = history_store.write_history_parquet(source, history_store.SALES_SCHEMA, cache_dir, chunksize=2)
+    assert history_store.fresh_history_parquet(source, cache_dir) == out
+
+    from_csv = load_sales_deliveries_csv()
+    pd.testing.assert_frame_equal(
+        history_store.read_history_parquet(out, history_store.SALES_SCHEMA), from_csv, check_categorical=False
+    )
+    chunks = list(load_sales_deliveries_csv(usecols=["product_code", "order_qty"], chunksize=2))
+    assert [len(c) for c in chunks] == [2, 1]
+    assert chunks[0]["order_qty"].dtype == "float32"
+
+    # Rewriting the CSV makes the Parquet copy stale; loads fall back to the CSV
+    source.write_text(SALES_CSV.rsplit("\n", 2)[0] + "\n", encoding="utf-8")
+    assert history_store.fresh_history_parquet(source, cache_dir) is None
+    assert len(load_sales_deliveries_csv()) == 2
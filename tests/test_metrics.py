@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Dict, Iterable
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.substitution_service import availability, main, metrics
+
+
+@pytest.fixture(autouse=True)
+def _fresh_metrics():
+    metrics.reset_metrics()
+    yield
+    metrics.reset_metrics()
+
+
+def test_histogram_renders_cumulative_prometheus_buckets():
+    stages = metrics.StageMetrics(buckets_ms=(1, 10))
+    for ms in (0.5, 1.0, 5.0, 50.0):
+        stages.observe("suggest", "pool", ms)
+    text = stages.render()
+    assert 'substitution_stage_duration_seconds_bucket{endpoint="suggest",stage="pool",le="0.001"} 2' in text
+    assert 'substitution_stage_duration_seconds_bucket{endpoint="suggest",stage="pool",le="0.01"} 3' in text
+    assert 'substitution_stage_duration_seconds_bucket{endpoint="suggest",stage="pool",le="+Inf"} 4' in text
+    assert 'substitution_stage_duration_seconds_sum{endpoint="suggest",stage="pool"} 0.056500' in text
+    assert 'substitution_stage_duration_seconds_count{endpoint="suggest",stage="pool"} 4' in text
+    assert text.startswith("# HELP substitution_stage_duration_seconds")
+
+    assert metrics.server_timing_header({"pool": 1.23456, "total": 2.0}) == "pool;dur=1.235, total;dur=2.000"
+
+
+def test_suggest_records_stage_histograms_and_server_timing(synthetic_catalog, monkeypatch):
+    async def fake_items(gtins: Iterable[str]) -> Dict[str, availability.WarehouseItem]:
+        return {g: availability.WarehouseItem(i, 10.0, "ST") for i, g in enumerate(sorted(gtins))}
+
+    monkeypatch.setattr(main, "get_warehouse_items_for_gtins_async", fake_items)
+    client = TestClient(main.app)
+    body = {"lineId": 1, "productCode": "6400000000011", "qty": 1}
+    resp = client.post("/substitution/suggest", json=body)
+    assert resp.status_code == 200 and "server-timing" not in resp.headers
+
+    monkeypatch.setattr(main, "SERVER_TIMING_ENABLED", True)
+    resp = client.post("/substitution/suggest", json=body)
+    header = resp.headers["server-timing"]
+    assert [part.split(";")[0] for part in header.split(", ")][-1] == "total"
+    assert {"resolve", "pool", "warehouse", "heuristic", "line_ids"} <= {p.split(";")[0] for p in header.split(", ")}
+
+    text = client.get("/metrics").text
+    for stage in ("resolve", "pool", "warehouse", "filter", "heuristic", "materialize", "line_ids", "total"):
+        assert f'substitution_stage_duration_seconds_count{{endpoint="suggest",stage="{stage}"}} 2' in text
+
+
+def test_warehouse_round_trips_are_recorded(monkeypatch):
+    @contextmanager
+    def fake_connection():
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return None
+
+            def execute(self, query, params):
+                return None
+
+            def fetchall(self):
+                return [{"product_code": "6400000000011", "qty": 3, "line_id": 7, "unit": "ST"}]
+
+        class Connection:
+            def cursor(self):
+                return Cursor()
+
+        yield Connection()
+
+    monkeypatch.setattr(availability, "warehouse_connection", fake_connection)
+    monkeypatch.setattr(availability, "AVAILABILITY_CACHE_ENABLED", False)
+    assert availability.get_availability_for_gtins(["6400000000011"]) == {"6400000000011": 3.0}
+    snapshot = metrics.stage_metrics().snapshot()
+    assert snapshot[("availability", "db_query")][2] == 1
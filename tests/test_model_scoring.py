@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import joblib
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.ensemble import RandomForestClassifier
+
+from services.substitution_service import candidates, model
+from services.substitution_service.candidates import suggest_candidates_by_gtin
+from services.substitution_service.feature_store import (
+    FEATURE_NAMES,
+    pair_feature_matrix,
+    product_feature_store,
+)
+from services.substitution_service.main import app
+
+
+def _scorer(feature_names):
+    rng = np.random.RandomState(0)
+    x = rng.rand(200, len(feature_names))
+    y = (x[:, 0] + x[:, 1] > 1.0).astype(int)
+    clf = RandomForestClassifier(n_estimators=10, random_state=0).fit(x, y)
+    return model.ModelScorer({"model": clf, "feature_names": list(feature_names)})
+
+
+@pytest.fixture
+def loaded_scorer(monkeypatch):
+    # Model columns in a different order than FEATURE_NAMES to exercise the reordering
+    scorer = _scorer(list(reversed(FEATURE_NAMES)))
+    monkeypatch.setattr(model, "_SCORER", scorer)
+    monkeypatch.setattr(model, "_LOADED", True)
+    return scorer
+
+
+def test_score_batch_matches_per_row_score():
+    scorer = _scorer(FEATURE_NAMES)
+    x = np.random.RandomState(1).rand(25, len(FEATURE_NAMES))
+    batch = scorer.score_batch(x)
+    single = [scorer.score(dict(zip(FEATURE_NAMES, row))) for row in x]
+    assert batch.tolist() == pytest.approx(single)
+    assert scorer.score_batch(np.empty((0, len(FEATURE_NAMES)))).shape == (0,)
+
+
+def test_score_batch_reorders_named_columns(loaded_scorer):
+    x = np.random.RandomState(2).rand(10, len(FEATURE_NAMES))
+    expected = loaded_scorer.score_batch(x[:, ::-1])
+    assert loaded_scorer.score_batch(x, FEATURE_NAMES).tolist() == pytest.approx(expected.tolist())
+
+
+def test_model_mode_ranks_pool_with_one_predict_call(synthetic_catalog, loaded_scorer, monkeypatch):
+    calls = []
+    predict = loaded_scorer.model.predict_proba
+    monkeypatch.setattr(loaded_scorer.model, "predict_proba", lambda x: calls.append(len(x)) or predict(x))
+
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    _, scored = suggest_candidates_by_gtin("6400000000011", k=4, available_qty_by_code=stock, mode="model")
+    assert calls == [4]
+
+    store = product_feature_store()
+    pool = np.asarray([1, 2, 3, 4])
+    probs = loaded_scorer.score_batch(pair_feature_matrix(store, 0, pool), FEATURE_NAMES)
+    expected = [store.gtins[p] for p in pool[np.argsort(-probs, kind="stable")]]
+    assert [g for g, _s, _c in scored] == expected
+
+
+def test_model_mode_falls_back_without_model(synthetic_catalog, monkeypatch):
+    monkeypatch.setattr(model, "_SCORER", None)
+    monkeypatch.setattr(model, "_LOADED", True)
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    by_model = suggest_candidates_by_gtin("6400000000011", k=3, available_qty_by_code=stock, mode="model")[1]
+    heuristic = suggest_candidates_by_gtin("6400000000011", k=3, available_qty_by_code=stock, mode="heuristic")[1]
+    assert [g for g, _s, _c in by_model] == [g for g, _s, _c in heuristic]
+
+
+def test_single_class_model_is_rejected_once(tmp_path, monkeypatch):
+    clf = RandomForestClassifier(n_estimators=2, random_state=0).fit(np.zeros((4, 2)), np.zeros(4, dtype=int))
+    path = tmp_path / "rf.joblib"
+    joblib.dump({"model": clf, "feature_names": ["a", "b"]}, path)
+    loads = []
+    real_load = joblib.load
+    monkeypatch.setattr(model, "DEFAULT_MODEL_PATHS", [path])
+    monkeypatch.setattr(model, "_SCORER", None)
+    monkeypatch.setattr(model, "_LOADED", False)
+    monkeypatch.setattr(model.joblib, "load", lambda *a, **kw: loads.append(a) or real_load(*a, **kw))
+    assert model.load_default_model() is None
+    assert model.load_default_model() is None
+    assert len(loads) == 1
+
+
+def test_hybrid_mode_reranks_heuristic_shortlist(synthetic_catalog, loaded_scorer, monkeypatch):
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    shortlist = suggest_candidates_by_gtin("6400000000011", k=2, available_qty_by_code=stock, mode="heuristic")[1]
+    resolve = candidates._resolve_original_position
+    resolved = []
+    monkeypatch.setattr(
+        candidates, "_resolve_original_position", lambda *a: resolved.append(a[0]) or resolve(*a)
+    )
+    timings = {}
+    _, hybrid = suggest_candidates_by_gtin(
+        "6400000000011", k=2, available_qty_by_code=stock, mode="hybrid", shortlist_size=2, timings=timings
+    )
+    store = product_feature_store()
+    pos = {g: i for i, g in enumerate(store.gtins)}
+    cands = np.asarray([pos[g] for g, _s, _c in shortlist])
+    probs = loaded_scorer.score_batch(pair_feature_matrix(store, 0, cands), FEATURE_NAMES)
+    assert [g for g, _s, _c in hybrid] == [store.gtins[p] for p in cands[np.argsort(-probs, kind="stable")]]
+    assert {"resolve", "pool", "heuristic", "model", "materialize"} <= set(timings)
+    # The GTIN is resolved once; the pool is built from that position
+    assert resolved == ["6400000000011"]
+
+
+def test_debug_endpoint_reports_mode_and_timings(synthetic_catalog, loaded_scorer):
+    stock = [{"productCode": p["salesUnitGtin"], "qty": 10} for p in synthetic_catalog]
+    resp = TestClient(app).post(
+        "/substitution/suggest_debug",
+        json={"sku": "6400000000011", "k": 2, "availability": stock, "mode": "hybrid", "shortlist": 3},
+    )
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert body["mode"] == "hybrid"
+    assert len(body["recommendations"]) == 2
+    assert body["timings"]["total"] >= body["timings"]["model"] >= 0
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import numpy as np
+
+from services.substitution_service import candidates
+from services.substitution_service.candidates import build_candidate_pool
+from services.substitution_service.feature_store import product_feature_store
+from services.substitution_service.name_embeddings import product_name_index
+
+
+def test_embeddings_are_unit_length_and_grouped_by_category(synthetic_catalog):
+    index = product_name_index()
+    assert index.embeddings.shape[0] == len(synthetic_catalog)
+    np.testing.assert_allclose(np.linalg.norm(index.embeddings, axis=1), 1.0, rtol=1e-5)
+    start, end = index.blocks["200"]
+    assert sorted(index.block_positions[start:end].tolist()) == [5, 6, 7]
+
+
+def test_nearest_in_category_ranks_lexical_neighbours(synthetic_catalog):
+    index = product_name_index()
+    positions, sims = index.nearest_in_category(0, "100", 4)
+    assert 0 not in positions.tolist()
+    assert set(positions.tolist()) <= {1, 2, 3, 4}
+    assert np.all(np.diff(sims) <= 1e-6)
+    # "Lactose free milk 2l" is the closest name to "Lactose free milk 1l"
+    assert positions[0] == 2
+    assert len(index.nearest_in_category(0, "100", 2)[0]) == 2
+
+
+def test_approximate_pool_uses_name_retrieval(synthetic_catalog, monkeypatch):
+    monkeypatch.setattr(candidates, "APPROX_CATEGORY_SIZE", 2)
+    monkeypatch.setattr(candidates, "APPROX_RETRIEVAL", "names")
+    monkeypatch.setattr(candidates, "NAME_RETRIEVAL_SIZE", 2)
+    pool = build_candidate_pool("6400000000011", k=1)
+    assert pool.approximate
+    expected = sorted(product_name_index().nearest_in_category(0, "100", 2)[0].tolist())
+    assert pool.positions == expected
+    assert all(product_feature_store().gtins[p] != "6400000000011" for p in pool.positions)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.substitution_service import popularity
+from services.substitution_service.candidates import suggest_candidates_by_gtin
+from services.substitution_service.data_loaders import DEFAULT_REPLACEMENTS_CSV
+from services.substitution_service.feature_store import FEATURE_NAMES, pair_feature_matrix, product_feature_store
+
+
+def _write_replacements(tmp_path, codes):
+    pd.DataFrame({"order_number": range(len(codes)), "product_code": codes}).to_csv(
+        tmp_path / DEFAULT_REPLACEMENTS_CSV, index=False
+    )
+
+
+def test_table_normalizes_counts_overall_and_per_category(synthetic_catalog, tmp_path):
+    # 3x the oat drink, 1x skimmed milk, 1x rye bread, plus codes outside the catalog
+    _write_replacements(
+        tmp_path, ["6400000000042"] * 3 + ["6400000000059", "6400000000066", "999", "6400000000042"[:-1]]
+    )
+    table = popularity.product_popularity()
+    assert table is not None and len(table) == len(synthetic_catalog)
+
+    assert table.overall[3] == pytest.approx(1.0)
+    assert table.overall[4] == pytest.approx(np.log1p(1) / np.log1p(3))
+    assert table.by_category[3] == pytest.approx(1.0)
+    # Rye bread is the most replaced product of its category
+    assert table.by_category[5] == pytest.approx(1.0)
+    assert table.overall[0] == 0.0 and table.by_category[6] == 0.0
+
+    # Written once, then served from disk
+    assert (popularity.popularity_dir() / "meta.json").exists()
+    popularity.product_popularity.cache_clear()
+    reloaded = popularity.product_popularity()
+    assert np.array_equal(reloaded.overall, table.overall)
+
+
+def test_popularity_feeds_the_scoring_path(synthetic_catalog, tmp_path):
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    before = suggest_candidates_by_gtin("6400000000011", k=4, available_qty_by_code=stock)[1]
+    assert popularity.product_popularity() is None
+
+    _write_replacements(tmp_path, ["6400000000042"] * 5)
+    popularity.product_popularity.cache_clear()
+    table = popularity.product_popularity()
+    matrix = pair_feature_matrix(product_feature_store(), 0, np.asarray([1, 3]), table)
+    assert matrix[:, FEATURE_NAMES.index("popularity_overall")].tolist() == [0.0, 1.0]
+
+    after = suggest_candidates_by_gtin("6400000000011", k=4, available_qty_by_code=stock)[1]
+    scores_before = {g: s for g, s, _c in before}
+    scores_after = {g: s for g, s, _c in after}
+    assert scores_after["6400000000042"] == pytest.approx(scores_before["6400000000042"] + 0.3 + 0.5, abs=1e-5)
+    assert scores_after["6400000000028"] == pytest.approx(scores_before["6400000000028"], abs=1e-5)
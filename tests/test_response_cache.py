@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+from services.substitution_service import availability, main
+from services.substitution_service.response_cache import (
+    ResponseCache,
+    invalidate_response_cache,
+    request_fingerprint,
+    response_cache,
+)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_eviction_and_ttl():
+    clock = _Clock()
+    cache = ResponseCache(ttl_seconds=10.0, max_entries=2, clock=clock)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    clock.now = 10.0
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (2, 2, 1, 1)
+
+
+def test_fingerprint_is_canonical():
+    a = request_fingerprint(sku="1", k=3, availability={"x": 1, "y": 2.0})
+    b = request_fingerprint(availability={"y": 2, "x": 1.0}, k=3.0, sku="1")
+    assert a == b
+    assert a != request_fingerprint(sku="1", k=3, availability={"x": 1, "y": 3})
+    assert a != request_fingerprint(sku="1", k=3, availability=None)
+
+
+def test_debug_endpoint_serves_repeats_from_cache(synthetic_catalog, monkeypatch):
+    calls = []
+    real_run = main.run_scoring
+
+    async def counting_run(fn, *args, **kwargs):
+        calls.append(fn.__name__)
+        return await real_run(fn, *args, **kwargs)
+
+    monkeypatch.setattr(main, "run_scoring", counting_run)
+    client = TestClient(main.app)
+    stock = [{"productCode": p["salesUnitGtin"], "qty": 10} for p in synthetic_catalog]
+    body = {"sku": "6400000000011", "k": 2, "availability": stock}
+
+    first = client.post("/substitution/suggest_debug", json=body).json()
+    # Same snapshot in a different order hits the same entry
+    second = client.post("/substitution/suggest_debug", json={**body, "availability": stock[::-1]}).json()
+    assert len(calls) == 1
+    assert second["recommendations"] == first["recommendations"]
+    assert set(second["timings"]) == {"cache", "total"}
+
+    client.post("/substitution/suggest_debug", json={**body, "k": 3})
+    assert len(calls) == 2
+
+    invalidate_response_cache()
+    client.post("/substitution/suggest_debug", json=body)
+    assert len(calls) == 3
+    assert response_cache().stats()["hits"] >= 1
+
+
+def test_debug_responses_from_live_stock_are_not_cached(synthetic_catalog, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        availability, "get_availability_for_gtins", lambda codes: calls.append(codes) or {g: 10.0 for g in codes}
+    )
+    client = TestClient(main.app)
+    body = {"sku": "6400000000011", "k": 2}
+    client.post("/substitution/suggest_debug", json=body)
+    client.post("/substitution/suggest_debug", json=body)
+    # Without an availability snapshot the ranking reads warehouse stock, which may change between calls
+    assert len(calls) == 2
+    assert response_cache().stats()["entries"] == 0
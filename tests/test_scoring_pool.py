@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from services.substitution_service import availability, candidates, main, scoring_pool
+from services.substitution_service.candidates import candidate_pools, suggest_candidates_batch
+from services.substitution_service.catalog_version import reset_catalog
+from services.substitution_service.feature_store import product_feature_store
+
+LINES = [("6400000000011", 1.0, None), ("6400000000066", 1.0, None), ("unknown", 1.0, None)]
+
+
+def test_jobs_match_direct_calls_in_thread_mode(synthetic_catalog, monkeypatch):
+    monkeypatch.setattr(scoring_pool, "SCORING_PROCESSES", 0)
+    assert scoring_pool.scoring_executor() is None
+    pooled, timings = asyncio.run(scoring_pool.run_scoring(scoring_pool.pool_lines_job, LINES))
+    store = product_feature_store()
+    assert pooled.gtins == [pool.gtins(store) for pool in candidate_pools(LINES)]
+    assert {"resolve", "pool"} <= set(timings)
+
+    # The second job ranks the pools it is given instead of building them again
+    with monkeypatch.context() as patched:
+        patched.setattr(candidates, "build_candidate_pool", None)
+        ranked, timings = asyncio.run(
+            scoring_pool.run_scoring(scoring_pool.rank_pooled_lines_job, LINES, pooled, 2, None)
+        )
+    assert ranked == suggest_candidates_batch(LINES, k=2, resolve_availability=False)
+    assert {"filter", "heuristic", "materialize"} <= set(timings)
+    assert not {"resolve", "pool"} & set(timings)
+
+
+def test_pools_are_rebuilt_after_a_catalog_swap(synthetic_catalog):
+    pooled, _timings = scoring_pool.pool_lines_job(LINES)
+    reset_catalog()
+    ranked, timings = scoring_pool.rank_pooled_lines_job(LINES, pooled, 2, None)
+    assert {"resolve", "pool"} <= set(timings)
+    assert ranked == suggest_candidates_batch(LINES, k=2, resolve_availability=False)
+
+
+def test_jobs_run_in_worker_processes(synthetic_catalog, monkeypatch):
+    # Workers are spawned and find the synthetic catalog through the inherited VALIO_DATA_DIR
+    monkeypatch.setattr(scoring_pool, "SCORING_PROCESSES", 1)
+    try:
+        pooled, _timings = asyncio.run(scoring_pool.run_scoring(scoring_pool.pool_lines_job, LINES))
+        stock = {g: 5.0 for gtins in pooled.gtins for g in gtins}
+        ranked, _timings = asyncio.run(
+            scoring_pool.run_scoring(scoring_pool.rank_pooled_lines_job, LINES, pooled, 2, stock)
+        )
+    finally:
+        scoring_pool.shutdown_scoring_executor()
+    expected = suggest_candidates_batch(LINES, k=2, available_qty_by_code=stock)
+    assert [[g for g, _s, _c in scored] for _o, scored in ranked] == [[g for g, _s, _c in scored] for _o, scored in expected]
+
+
+def test_debug_requests_reading_stock_stay_in_the_api_process(synthetic_catalog, monkeypatch):
+    monkeypatch.setattr(scoring_pool, "SCORING_PROCESSES", 1)
+    looked_up = []
+    monkeypatch.setattr(
+        availability, "get_availability_for_gtins", lambda codes: looked_up.append(codes) or {g: 5.0 for g in codes}
+    )
+    try:
+        resp = TestClient(main.app).post("/substitution/suggest_debug", json={"sku": "6400000000011", "k": 2})
+        # The stock lookup ran here (the patched function), and no worker process was started for it
+        assert resp.status_code == 200 and resp.json()["recommendations"]
+        assert looked_up and scoring_pool._EXECUTOR is None
+    finally:
+        scoring_pool.shutdown_scoring_executor()
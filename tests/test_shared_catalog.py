@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import numpy as np
+
+from services.substitution_service import name_embeddings, shared_catalog, token_index, topk_table
+from services.substitution_service.candidates import suggest_candidates_by_gtin
+from services.substitution_service.catalog_version import current_catalog
+from services.substitution_service.data_loaders import product_data_df, product_gtin_index, product_record
+from services.substitution_service.feature_store import product_feature_store
+
+
+def _in_process(stock):
+    store = product_feature_store()
+    records = [product_data_df().iloc[i].to_dict() for i in range(len(store))]
+    ranked = suggest_candidates_by_gtin("6400000000011", k=3, available_qty_by_code=stock)[1]
+    return store, dict(product_gtin_index()), records, ranked
+
+
+def test_shared_store_matches_in_process_store(synthetic_catalog, monkeypatch):
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    expected, index, records, ranked = _in_process(stock)
+
+    monkeypatch.setenv("VALIO_SHARED_CATALOG", "1")
+    for cached in (product_data_df, product_feature_store, product_gtin_index, token_index.product_token_index):
+        cached.cache_clear()
+    topk_table.product_topk_table.cache_clear()
+    shared = product_feature_store()
+
+    assert isinstance(shared.unit_size, np.memmap) and not shared.unit_size.flags.writeable
+    assert shared.gtins == expected.gtins
+    for name in ("category_codes", "vendor_codes", "contains_mask", "free_from_mask", "token_counts"):
+        assert np.array_equal(getattr(shared, name), getattr(expected, name))
+    assert (shared.token_matrix != expected.token_matrix).nnz == 0
+    assert dict(shared.token_vocabulary) == dict(expected.token_vocabulary)
+    assert [shared.tokens[i] for i in range(len(shared))] == list(expected.tokens)
+    assert {c: m.tolist() for c, m in shared.category_members.items()} == {
+        c: m.tolist() for c, m in expected.category_members.items()
+    }
+    assert dict(product_gtin_index()) == index
+    assert [product_record(i) for i in range(len(shared))] == records
+    assert suggest_candidates_by_gtin("6400000000011", k=3, available_qty_by_code=stock)[1] == ranked
+    # Workers in shared mode never build the DataFrame
+    assert product_data_df.cache_key not in current_catalog().built()
+
+
+def test_shared_files_are_built_once_and_rebuilt_when_stale(synthetic_catalog, tmp_path, monkeypatch):
+    builds = []
+    real_write = shared_catalog.write_shared_catalog
+    monkeypatch.setattr(
+        shared_catalog, "write_shared_catalog", lambda *a, **kw: builds.append(1) or real_write(*a, **kw)
+    )
+    shared_catalog.ensure_shared_catalog()
+    shared_catalog.ensure_shared_catalog()
+    assert len(builds) == 1
+
+    source = tmp_path / "valio_aimo_product_data_junction_2025.json"
+    source.write_text(source.read_text(encoding="utf-8") + "\n", encoding="utf-8")
+    shared_catalog.ensure_shared_catalog()
+    assert len(builds) == 2
+
+
+def test_shared_name_embeddings_are_memory_mapped(synthetic_catalog, monkeypatch):
+    expected = name_embeddings.product_name_index()
+
+    monkeypatch.setenv("VALIO_SHARED_CATALOG", "1")
+    for cached in (product_data_df, product_feature_store, name_embeddings.product_name_index):
+        cached.cache_clear()
+    builds = []
+    real_write = shared_catalog.write_shared_name_embeddings
+    monkeypatch.setattr(
+        shared_catalog, "write_shared_name_embeddings", lambda *a, **kw: builds.append(1) or real_write(*a, **kw)
+    )
+    shared = name_embeddings.product_name_index()
+    assert isinstance(shared.embeddings, np.memmap) and isinstance(shared.block_embeddings, np.memmap)
+    np.testing.assert_allclose(shared.embeddings, expected.embeddings, atol=1e-5)
+    np.testing.assert_allclose(shared.block_embeddings, expected.block_embeddings, atol=1e-5)
+    assert shared.block_positions.tolist() == expected.block_positions.tolist()
+    assert dict(shared.blocks) == dict(expected.blocks)
+    assert shared.nearest_in_category(0, "100", 4)[0].tolist() == expected.nearest_in_category(0, "100", 4)[0].tolist()
+    assert product_data_df.cache_key not in current_catalog().built()
+
+    # Another worker attaches to the files instead of embedding again
+    name_embeddings.product_name_index.cache_clear()
+    name_embeddings.product_name_index()
+    assert builds == [1]
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from services.substitution_service.data_loaders import (
+    iter_json_objects,
+    iter_product_batches,
+    load_product_data_json,
+)
+
+
+def test_iter_json_objects_handles_chunk_boundaries(tmp_path):
+    records = [{"i": i, "text": 'a, [b] {c} "quoted"' * (i + 1), "nested": {"list": [1, {"x": i}]}} for i in range(25)]
+    array_file = tmp_path / "array.json"
+    array_file.write_text(json.dumps(records, indent=2), encoding="utf-8")
+    lines_file = tmp_path / "lines.jsonl"
+    lines_file.write_text("\n".join(json.dumps(r) for r in records), encoding="utf-8")
+    for path in (array_file, lines_file):
+        assert list(iter_json_objects(path, chunk_chars=7)) == records
+
+
+def test_iter_json_objects_rejects_truncated_file(tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text('[{"a": 1}, {"b": ', encoding="utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_objects(path))
+
+
+def test_iter_product_batches_projects_nested_paths(synthetic_catalog, monkeypatch):
+    monkeypatch.setenv("VALIO_CATALOG_SNAPSHOT", "0")
+    batches = list(iter_product_batches(fields=["category", "synkkaData.names", "missing.path"], batch_size=3))
+    assert [len(b) for b in batches] == [3, 3, 2]
+    first = batches[0][0]
+    assert first == {
+        "category": "100",
+        "synkkaData": {"names": synthetic_catalog[0]["synkkaData"]["names"]},
+    }
+
+
+def test_load_product_data_json_streams_projected_columns(synthetic_catalog, monkeypatch):
+    monkeypatch.setenv("VALIO_CATALOG_SNAPSHOT", "0")
+    df = load_product_data_json(usecols=["salesUnitGtin", "synkkaData.gtin", "nope"])
+    assert list(df.columns) == ["salesUnitGtin", "synkkaData"]
+    assert len(df) == len(synthetic_catalog)
+    assert df["synkkaData"].iloc[0] == {"gtin": synthetic_catalog[0]["salesUnitGtin"]}
+
+
+@pytest.mark.parametrize("snapshot", ["0", "1"])
+def test_load_product_data_json_without_known_columns_returns_full_frame(synthetic_catalog, monkeypatch, snapshot):
+    monkeypatch.setenv("VALIO_CATALOG_SNAPSHOT", snapshot)
+    if snapshot == "1":
+        load_product_data_json()  # writes the snapshot, so the projected load below is a snapshot hit
+    df = load_product_data_json(usecols=["nope", "missing.path"])
+    assert "salesUnitGtin" in df.columns and "synkkaData" in df.columns
+    assert len(df) == len(synthetic_catalog)
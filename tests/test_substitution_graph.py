@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from services.substitution_service import main, substitution_graph
+from services.substitution_service.candidates import build_candidate_pool, suggest_candidates_by_gtin
+from services.substitution_service.data_loaders import DEFAULT_REPLACEMENTS_CSV, DEFAULT_SALES_DELIVERIES_CSV
+
+MILK, LF_MILK, OAT, RYE = "6400000000028", "6400000000011", "6400000000042", "6400000000066"
+
+
+def _write_history(tmp_path):
+    sales = pd.DataFrame(
+        [
+            # customer, code, delivery date, ordered, delivered
+            ("c1", MILK, "2025-01-10", 5, 0),
+            ("c1", MILK, "2025-03-01", 5, 2),
+            ("c2", MILK, "2025-03-01", 4, 0),
+            ("c2", OAT, "2025-03-01", 4, 4),  # delivered in full: not a shortage
+            ("c3", LF_MILK, "2025-03-01", 1, 0),
+        ],
+        columns=["customer_number", "product_code", "requested_delivery_date", "order_qty", "delivered_qty"],
+    )
+    sales.to_csv(tmp_path / DEFAULT_SALES_DELIVERIES_CSV, index=False)
+    replacements = pd.DataFrame(
+        [
+            ("c1", OAT, "2025-01-10"),
+            ("c1", OAT, "2025-03-02"),  # next day: within the lag window
+            ("c2", RYE, "2025-03-01"),
+            ("c2", MILK, "2025-03-01"),  # same product re-ordered: no edge
+            ("c3", OAT, "2025-03-05"),  # too late
+        ],
+        columns=["customer_number", "product_code", "requested_delivery_date"],
+    )
+    replacements.to_csv(tmp_path / DEFAULT_REPLACEMENTS_CSV, index=False)
+
+
+def _build(tmp_path, **kwargs):
+    shortages = substitution_graph.collect_shortages(tmp_path / DEFAULT_SALES_DELIVERIES_CSV, chunksize=2)
+    replacements = substitution_graph.collect_replacements(tmp_path / DEFAULT_REPLACEMENTS_CSV, chunksize=2)
+    observations = substitution_graph.join_shortages(shortages, replacements, max_lag_days=1)
+    return substitution_graph.build_substitution_graph(observations, **kwargs)
+
+
+def test_graph_counts_decay_and_customer_counts(synthetic_catalog, tmp_path):
+    _write_history(tmp_path)
+    graph = _build(tmp_path, half_life_days=51.0)
+
+    assert graph.edges == 2
+    oat, rye = graph.neighbors(MILK)
+    assert (oat.code, oat.count, rye.code, rye.count) == (OAT, 2, RYE, 1)
+    # Observations are dated by the replacement: Jan 10 is 51 days before the newest one (Mar 2)
+    assert oat.weight == pytest.approx(1.0 + 0.5, rel=1e-5)
+    assert rye.weight == pytest.approx(0.5 ** (1 / 51), rel=1e-5)
+    assert graph.neighbors(MILK, customer="c1")[0].customer_count == 2
+    assert graph.neighbors(MILK, customer="c2")[0].customer_count == 0
+    assert graph.neighbors(MILK, limit=1) == [oat._replace(customer_count=0)]
+    assert graph.neighbors(LF_MILK) == [] and graph.neighbors("unknown") == []
+
+    matrix = graph.weight_matrix()
+    assert matrix.shape == (len(graph.codes), len(graph.codes)) and matrix.nnz == 2
+
+
+def test_persisted_graph_feeds_candidate_pool_and_api(synthetic_catalog, tmp_path):
+    _write_history(tmp_path)
+    graph = _build(tmp_path)
+    substitution_graph.write_substitution_graph(graph, {"half_life_days": 90.0})
+    substitution_graph.product_substitution_graph.cache_clear()
+    loaded = substitution_graph.product_substitution_graph()
+    assert loaded.codes == graph.codes
+    assert np.array_equal(loaded.weights, graph.weights)
+
+    # Rye bread is in another category but was a historical replacement for milk
+    pool = build_candidate_pool(MILK)
+    assert pool.positions[-1] == 5 and pool.positions.count(5) == 1
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    ranked = [g for g, _s, _c in suggest_candidates_by_gtin(MILK, k=10, available_qty_by_code=stock)[1]]
+    assert RYE in ranked
+
+    body = TestClient(main.app).get("/substitution/graph/neighbors", params={"code": MILK, "customer": "c2"}).json()
+    assert [(n["code"], n["customerCount"]) for n in body["neighbors"]] == [(OAT, 0), (RYE, 1)]
+
+
+def test_neighbors_endpoint_without_graph(synthetic_catalog):
+    resp = TestClient(main.app).get("/substitution/graph/neighbors", params={"code": MILK})
+    assert resp.status_code == 503
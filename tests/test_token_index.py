@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import pytest
+
+from services.substitution_service.candidates import (
+    _lookup_gtin_by_tokens,
+    _normalize_token_key,
+    lookup_gtins_by_name,
+    suggest_candidates_by_gtin,
+)
+from services.substitution_service.data_loaders import _normalize_id, product_data_df
+from services.substitution_service.features import _collect_names
+from services.substitution_service.utils_text import jaccard_similarity, simple_tokenize
+
+
+def _brute_force_best(name: str):
+    target = simple_tokenize(name)
+    best_score, best_gtin = 0.0, None
+    for product in product_data_df().to_dict("records"):
+        tokens = set()
+        for n in _collect_names(product):
+            tokens |= simple_tokenize(n)
+        score = jaccard_similarity(target, tokens)
+        if score > best_score:
+            best_score, best_gtin = score, _normalize_id(product.get("salesUnitGtin"))
+    return best_gtin if best_score >= 0.2 else None
+
+
+@pytest.mark.parametrize(
+    "name",
+    ["laktoositon maito", "Rye bread", "Bakery ruisleipä 500g", "oat", "completely unknown words"],
+)
+def test_token_index_matches_full_scan(synthetic_catalog, name):
+    assert _lookup_gtin_by_tokens(_normalize_token_key(name)) == _brute_force_best(name)
+
+
+def test_lookup_gtins_by_name_ranks_alternatives(synthetic_catalog):
+    ranked = lookup_gtins_by_name("lactose free milk", k=3, min_score=0.0)
+    assert len(ranked) == 3
+    scores = [s for _g, s in ranked]
+    assert scores == sorted(scores, reverse=True)
+    assert ranked[0][0] in {"6400000000011", "6400000000035"}
+    assert lookup_gtins_by_name("") == []
+
+
+def test_suggest_falls_back_to_name(synthetic_catalog):
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    orig, scored = suggest_candidates_by_gtin(
+        "unknown-sku", k=2, available_qty_by_code=stock, fallback_name="Ruisleipä 500g"
+    )
+    assert _normalize_id(orig["salesUnitGtin"]) == "6400000000066"
+    assert scored
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.substitution_service import availability, candidates, main, topk_table
+from services.substitution_service.candidates import (
+    HEURISTIC_WEIGHTS,
+    heuristic_scores,
+    suggest_candidates_batch,
+    suggest_candidates_by_gtin,
+)
+from services.substitution_service.feature_store import product_feature_store
+
+
+def _write_table(top_n: int) -> None:
+    table = topk_table.build_topk_table(product_feature_store(), heuristic_scores, top_n=top_n)
+    topk_table.write_topk_table(table, topk_table.table_meta(HEURISTIC_WEIGHTS))
+    topk_table.product_topk_table.cache_clear()
+
+
+def _live(monkeypatch, sku, **kwargs):
+    with monkeypatch.context() as m:
+        m.setattr(candidates, "product_topk_table", lambda: None)
+        return suggest_candidates_by_gtin(sku, **kwargs)[1]
+
+
+def test_table_serves_same_ranking_as_live_scoring(synthetic_catalog, monkeypatch):
+    _write_table(top_n=10)
+    assert topk_table.product_topk_table() is not None
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    stock["6400000000028"] = 1.0
+    for product in synthetic_catalog:
+        sku = product["salesUnitGtin"]
+        served = suggest_candidates_by_gtin(sku, k=3, available_qty_by_code=stock, required_qty=2)[1]
+        live = _live(monkeypatch, sku, k=3, available_qty_by_code=stock, required_qty=2)
+        assert [g for g, _s, _c in served] == [g for g, _s, _c in live]
+        assert [s for _g, s, _c in served] == pytest.approx([s for _g, s, _c in live], abs=1e-5)
+        assert "6400000000028" not in [g for g, _s, _c in served]
+
+
+def test_truncated_row_falls_back_to_live_scoring(synthetic_catalog, monkeypatch):
+    _write_table(top_n=1)
+    table = topk_table.product_topk_table()
+    positions, _scores, complete = table.row(0)
+    assert len(positions) == 1 and not complete
+
+    best = product_feature_store().gtins[int(positions[0])]
+    stock = {p["salesUnitGtin"]: 10.0 for p in synthetic_catalog}
+    stock[best] = 0.0
+    served = suggest_candidates_by_gtin("6400000000011", k=2, available_qty_by_code=stock)[1]
+    live = _live(monkeypatch, "6400000000011", k=2, available_qty_by_code=stock)
+    assert [g for g, _s, _c in served] == [g for g, _s, _c in live]
+    assert len(served) == 2
+
+
+def test_stale_table_is_ignored(synthetic_catalog, monkeypatch):
+    _write_table(top_n=5)
+    monkeypatch.setitem(HEURISTIC_WEIGHTS, "name_jaccard", 2.0)
+    topk_table.product_topk_table.cache_clear()
+    assert topk_table.product_topk_table() is None
+
+
+def test_order_endpoint_serves_table_rows_and_pools_exhausted_rows(synthetic_catalog, monkeypatch):
+    _write_table(top_n=3)
+    gtins = product_feature_store().gtins
+    row = [gtins[p] for p in topk_table.product_topk_table().row(0)[0]]
+    line_ids = {p["salesUnitGtin"]: 3000 + i for i, p in enumerate(synthetic_catalog)}
+    stock = {g: 10.0 for g in line_ids}
+    calls: List[List[str]] = []
+
+    async def fake_items(codes: Iterable[str]) -> Dict[str, availability.WarehouseItem]:
+        calls.append(sorted(codes))
+        return {g: availability.WarehouseItem(line_ids[g], stock[g], "ST") for g in codes if g in line_ids}
+
+    monkeypatch.setattr(main, "get_warehouse_items_for_gtins_async", fake_items)
+    client = TestClient(main.app)
+    body = {"lineId": 1, "productCode": "6400000000011", "qty": 1}
+    with monkeypatch.context() as m:
+        # Served from the table: no live pool, and stock only for the row
+        m.setattr(candidates, "_pool_for_position", None)
+        resp = client.post("/substitution/suggest", json=body)
+    assert resp.json()["suggestedLineIds"] == [line_ids[g] for g in row]
+    assert calls == [sorted(row)]
+
+    # The truncated row runs out of stock: the line is pooled in full and the rest of its pool looked up
+    calls.clear()
+    stock[row[0]] = 0.0
+    resp = client.post("/substitution/suggest", json=body)
+    live = _live(monkeypatch, "6400000000011", k=3, available_qty_by_code=stock)
+    assert resp.json()["suggestedLineIds"] == [line_ids[g] for g, _s, _c in live]
+    pool = {p["salesUnitGtin"] for p in synthetic_catalog if p["category"] == "100"} - {"6400000000011"}
+    assert calls == [sorted(row), sorted(pool - set(row))]
+
+
+def test_row_without_stocked_products_falls_back_to_the_pool(synthetic_catalog, monkeypatch):
+    _write_table(top_n=3)
+    gtins = product_feature_store().gtins
+    row = {gtins[p] for p in topk_table.product_topk_table().row(0)[0]}
+    pool = {p["salesUnitGtin"] for p in synthetic_catalog if p["category"] == "100"} - {"6400000000011"}
+    [outside] = pool - row
+    # The warehouse stocks only the same-category product outside the row: the row lookup comes back empty
+
+    async def fake_items(codes: Iterable[str]) -> Dict[str, availability.WarehouseItem]:
+        return {g: availability.WarehouseItem(4242, 10.0, "ST") for g in codes if g == outside}
+
+    monkeypatch.setattr(main, "get_warehouse_items_for_gtins_async", fake_items)
+    monkeypatch.setattr(
+        availability, "get_availability_for_gtins", lambda codes: {g: 10.0 for g in codes if g == outside}
+    )
+    body = {"lineId": 1, "productCode": "6400000000011", "qty": 1}
+    resp = TestClient(main.app).post("/substitution/suggest", json=body)
+    assert resp.json()["suggestedLineIds"] == [4242]
+    assert [g for g, _s, _c in suggest_candidates_by_gtin("6400000000011", k=3)[1]] == [outside]
+    [(_orig, ranked)] = suggest_candidates_batch([("6400000000011", 1.0, None)], k=3)
+    assert [g for g, _s, _c in ranked] == [outside]
@@ -14,7 +14,7 @@ REPO_ROOT = Path(__file__).resolve().parents[1]
 if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
-from services.substitution_service.data_loaders import product_data_df  # noqa: E402
+from services.substitution_service.data_loaders import product_data_df, product_gtin_index  # noqa: E402
 from services.substitution_service.candidates import _normalize_id  # noqa: E402
 
 
@@ -44,12 +44,12 @@ def _category_index() -> Dict[str, str]:
     """
     df = product_data_df()
     mapping: Dict[str, str] = {}
-    if "salesUnitGtin" not in df.columns:
+    if "category" not in df.columns:
         return mapping
-    for _, row in df.iterrows():
-        gt = _normalize_id(row.get("salesUnitGtin"))
-        cat = row.get("category")
-        if gt and cat is not None:
+    categories = df["category"].tolist()
+    for gt, pos in product_gtin_index().items():
+        cat = categories[pos]
+        if cat is not None:
             mapping[gt] = str(cat)
     return mapping
 
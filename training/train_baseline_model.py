@@ -4,7 +4,7 @@ import argparse
 import json
 import os
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Tuple
 
 import joblib
 import numpy as np
@@ -21,7 +21,9 @@ if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
 from services.substitution_service.data_loaders import (  # noqa: E402
+    build_gtin_index,
     product_data_df,
+    product_gtin_index,
 )
 from services.substitution_service.features import (  # noqa: E402
     compute_pair_features,
@@ -48,14 +50,16 @@ def load_pairs_csv(path: Path) -> pd.DataFrame:
     return df
 
 
-def _index_products_by_gtin(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+def _index_products_by_gtin(df: pd.DataFrame, gtins: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Materialize row dicts only for the GTINs referenced by the pairs.
+    """
+    positions = product_gtin_index() if df is product_data_df() else build_gtin_index(df)
     idx: Dict[str, Dict[str, Any]] = {}
-    if "salesUnitGtin" not in df.columns:
-        return idx
-    for _, row in df.iterrows():
-        gtin = _normalize_id(row.get("salesUnitGtin"))
-        if gtin:
-            idx[gtin] = row.to_dict()
+    for gtin in set(gtins):
+        pos = positions.get(gtin)
+        if pos is not None:
+            idx[gtin] = df.iloc[pos].to_dict()
     return idx
 
 
@@ -111,7 +115,9 @@ def main() -> None:
 
     print("[train] Loading product catalog")
     products = product_data_df()
-    prod_index = _index_products_by_gtin(products)
+    prod_index = _index_products_by_gtin(
+        products, pairs_df["orig_gtin"].tolist() + pairs_df["cand_gtin"].tolist()
+    )
     print(f"[train] Catalog indexed GTINs: {len(prod_index)}")
 
     print("[train] Building feature matrix")
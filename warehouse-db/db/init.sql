@@ -32,6 +32,34 @@ CREATE TABLE IF NOT EXISTS warehouse_items (
     unit         VARCHAR(10) NOT NULL       -- единица измерения, например 'ST'
 );
 
+-- Уведомления об изменении остатков: сервис подбора замен держит кэш наличия
+-- и сбрасывает записи по product_code из payload (пустой payload = сбросить всё)
+CREATE OR REPLACE FUNCTION notify_warehouse_items_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('warehouse_items_changed', '');
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('warehouse_items_changed', OLD.product_code);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('warehouse_items_changed', NEW.product_code);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS warehouse_items_notify ON warehouse_items;
+CREATE TRIGGER warehouse_items_notify
+    AFTER INSERT OR UPDATE OR DELETE ON warehouse_items
+    FOR EACH ROW EXECUTE FUNCTION notify_warehouse_items_changed();
+
+DROP TRIGGER IF EXISTS warehouse_items_notify_truncate ON warehouse_items;
+CREATE TRIGGER warehouse_items_notify_truncate
+    AFTER TRUNCATE ON warehouse_items
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_warehouse_items_changed();
+
 -- Пример: вставляем твой заказ
 INSERT INTO orders (
     order_id,